@@ -14,10 +14,42 @@ Authors:
 #	Note: transaction is started when the cursor is created, ended by db.commit|rollback
 #@TODO: Add debug logging
 
-import MySQLdb, MySQLdb.cursors
-from passlib.hash import sha512_crypt
+import importlib
+from log_notify import LogNotifier
+
+credentialsPath = '/home/pi/code/makeictelectronicdoor/web/include/DB_CREDENTIALS'
+
+class LazyModule(object):
+	'''
+	Stands in for a module until one of its attributes is used, then
+	imports it (and any listed submodules). Keeps MySQLdb and passlib out of
+	the start-up time of commands that never touch the database.
+	'''
+	def __init__(self, name, *submodules):
+		self._names = (name,) + submodules
+		self._module = None
+
+	def __getattr__(self, attr):
+		if self._module is None:
+			for name in self._names:
+				module = importlib.import_module(name)
+				if self._module is None:
+					self._module = module
+		return getattr(self._module, attr)
+
+MySQLdb = LazyModule('MySQLdb', 'MySQLdb.cursors')
+passlibHash = LazyModule('passlib.hash')
+
+def saltAndHash(data):
+	'''
+	Salt and hash a plaintext password using SHA512 algorithm. A plain
+	function, so it can be handed to a multiprocessing pool.
+	'''
+	return passlibHash.sha512_crypt.encrypt(data)
 
 class MySQLBackend(object):
+	tagIDs = None	# cached tag name -> tagID, see getTagIDs
+
 	def __init__(self, host, db, user, passwd):
 		'''
 		Initiate a connection to the database using constructor arguments,
@@ -30,6 +62,7 @@ class MySQLBackend(object):
 		  passwd (string): MySQL password
 		'''
 		self.dbInfo = {'host':host, 'db':db, 'user':user, 'passwd':passwd}
+		self.changedUsers = set()
 		self.db = MySQLdb.connect(
 			host=host, db=db,
 			user=user, passwd=passwd,
@@ -40,13 +73,31 @@ class MySQLBackend(object):
 		'''
 		Re-connect to database using stored credentials
 		'''
-		self.db.close()
+		try:
+			self.db.close()
+		except Exception:
+			pass	# already closed, or broken
 		self.db = MySQLdb.connect(
 			host=self.dbInfo['host'], db=self.dbInfo['db'],
 			user=self.dbInfo['user'], passwd=self.dbInfo['passwd'],
 			cursorclass=MySQLdb.cursors.DictCursor
 		)
 	
+	def userChanged(self, *userIDs):
+		'''
+		Record that users were added, edited or removed through this
+		backend, for in-memory indexes to pick up (see takeChangedUsers)
+		'''
+		self.changedUsers.update(int(userID) for userID in userIDs if userID is not None)
+
+	def takeChangedUsers(self):
+		'''
+		Returns:
+		  the set of userIDs changed since the last call
+		'''
+		changed, self.changedUsers = self.changedUsers, set()
+		return changed
+
 	#@TEST added this to make sure data is up-to-date. Not sure if it's the best way
 	#only useful if long running scripts like door-lock.py
 	def ensureConnection(self):
@@ -54,6 +105,17 @@ class MySQLBackend(object):
 			self.reconnectDB()
 		self.db.commit()				
 
+	def recover(self):
+		'''
+		Leave the connection usable after a failed operation: roll back its
+		open transaction, or re-connect if that fails (e.g. the server went
+		away, or a streaming query was left unread)
+		'''
+		try:
+			self.db.rollback()
+		except Exception:
+			self.reconnectDB()
+
 	#@TODO: Unit tests
 	def log(self, logType, rfid=None, userID=None, message=None, commit=True):
 		'''
@@ -65,6 +127,8 @@ class MySQLBackend(object):
 		  userID (string, optional): the user's ID number, Default=None
 		  message (string, optional): additional information, Default=None
 		  commit (bool, optional): if True commit the transaction, Default=True
+		Returns:
+		  the logID of the new log
 		'''
 		sql = '''
 			INSERT INTO logs
@@ -75,40 +139,161 @@ class MySQLBackend(object):
 			raise(ValueError('Not a valid logType'))
 		cursor = self.db.cursor()
 		cursor.execute(sql, (logType, rfid, userID, message))
+		logID = cursor.lastrowid
 		cursor.close()
 		if commit:
 			self.db.commit()
+		return logID
 
 	def getLogs(self, filters=None):
 		'''
+		Retrieve all logs matching a set of filters at once. Use iterLogs to
+		stream large results.
+
+		Args:
+		  filters (dict, optional): column name -> value, list of values or
+		    comma separated values; a log matches any of the values
+		Returns:
+		  [0, list of log dicts], or [1, None] if a filter names an unknown column
 		'''
+		try:
+			where, params = self.logFilterSQL(filters)
+		except ValueError:
+			return [1, None]
 		sql = "SELECT * FROM logs"
-		columns = self.getColumnNames('logs')
-		if filters:
-			sql += " WHERE"
-			lastFilter = len(filters) - 1
-			for i, filter in enumerate(filters):
-				if filter not in columns:
-					return[1, None]
-				if ',' in filters[filter]:
-					filters[filter] = filters[filter].split(',')
-				if isinstance(filters[filter], list):
-					values = ["'{:}'".format(val) for val in filters[filter]]
-					values = ','.join(values)
-				else:
-					values = "'{:}'".format(filters[filter])
-				sql += " {:} IN ({:})".format(filter, values)
-				if i != lastFilter:
-					sql += " AND"
+		if where:
+			sql += " WHERE " + " AND ".join(where)
 		cursor = self.db.cursor()
 		try:
-			data = cursor.fetchmany(cursor.execute(sql))
+			data = cursor.fetchmany(cursor.execute(sql, params))
 		except MySQLdb.OperationalError:
 			return None
 		cursor.close()
 
 		return [0, data]
 
+	def iterLogs(self, filters=None, since=None, until=None, limit=None, afterID=None):
+		'''
+		Stream logs in logID order through an unbuffered server-side cursor,
+		so memory use does not grow with the number of rows.
+
+		The connection cannot run other queries until the returned iterator
+		is exhausted or closed.
+
+		Args:
+		  filters (dict, optional): see getLogs
+		  since (int, optional): only logs with timestamp >= since
+		  until (int, optional): only logs with timestamp < until
+		  limit (int, optional): only the last `limit` matching logs
+		  afterID (int, optional): only logs with logID > afterID
+		Returns:
+		  an iterator of log dicts
+		Raises:
+		  ValueError if a filter names an unknown column
+		'''
+		where, params = self.logFilterSQL(filters)
+		if since is not None:
+			where.append("timestamp >= %s")
+			params.append(since)
+		if until is not None:
+			where.append("timestamp < %s")
+			params.append(until)
+		if afterID is not None:
+			where.append("logID > %s")
+			params.append(afterID)
+		sql = "SELECT * FROM logs"
+		if where:
+			sql += " WHERE " + " AND ".join(where)
+		if limit is not None:
+			sql = "SELECT * FROM ({:s} ORDER BY logID DESC LIMIT %s) AS recent".format(sql)
+			params.append(int(limit))
+		sql += " ORDER BY logID"
+		cursor = self.db.cursor(MySQLdb.cursors.SSDictCursor)
+		cursor.execute(sql, params)
+		return self.streamRows(cursor)
+
+	def iterUsers(self, afterID=None, userIDs=None):
+		'''
+		Stream users in userID order through an unbuffered server-side
+		cursor, each with its tags and rfids (comma separated, collected by
+		GROUP_CONCAT in the same query). Password hashes are not included.
+
+		The connection cannot run other queries until the returned iterator
+		is exhausted or closed.
+
+		Args:
+		  afterID (int, optional): only users with userID > afterID
+		  userIDs (list, optional): only these users
+		Returns:
+		  an iterator of user dicts
+		'''
+		where, params = [], []
+		if afterID is not None:
+			where.append("users.userID > %s")
+			params.append(afterID)
+		if userIDs is not None:
+			where.append("users.userID IN ({:s})".format(','.join(['%s'] * len(userIDs)) or 'NULL'))
+			params.extend(userIDs)
+		sql = '''
+			SELECT users.userID, users.email, users.firstName, users.lastName, users.status,
+				(SELECT GROUP_CONCAT(tags.tag ORDER BY tags.tag SEPARATOR ',')
+					FROM userTags JOIN tags ON tags.tagID = userTags.tagID
+					WHERE userTags.userID = users.userID) AS tags,
+				(SELECT GROUP_CONCAT(rfids.id ORDER BY rfids.id SEPARATOR ',')
+					FROM rfids WHERE rfids.userID = users.userID) AS rfids
+			FROM users
+			{:s}
+			ORDER BY users.userID
+			'''.format("WHERE " + " AND ".join(where) if where else "")
+		cursor = self.db.cursor(MySQLdb.cursors.SSDictCursor)
+		cursor.execute(sql, params)
+		rows = self.streamRows(cursor)
+		try:
+			for user in rows:
+				user['tags'] = user['tags'].split(',') if user['tags'] else []
+				user['rfids'] = user['rfids'].split(',') if user['rfids'] else []
+				yield user
+		finally:
+			rows.close()
+
+	def streamRows(self, cursor, size=256):
+		'''
+		Yield the rows of an executed server-side cursor, `size` at a time,
+		and close it when done (closing reads any rows left unread).
+		'''
+		try:
+			while True:
+				rows = cursor.fetchmany(size)
+				if not rows:
+					break
+				for row in rows:
+					yield row
+		finally:
+			cursor.close()
+			self.db.commit()
+
+	def logFilterSQL(self, filters):
+		'''
+		Translate log filters (see getLogs) to SQL.
+
+		Returns:
+		  (conditions, params): a list of WHERE conditions and their parameters
+		Raises:
+		  ValueError if a filter names an unknown column
+		'''
+		where, params = [], []
+		if not filters:
+			return where, params
+		columns = self.getColumnNames('logs')
+		for name, value in sorted(filters.items()):
+			if name not in columns:
+				raise ValueError("Invalid filter '{:}'".format(name))
+			if isinstance(value, basestring):
+				value = value.split(',')
+			where.append("{:s} IN ({:s})".format(name, ','.join(['%s'] * len(value))))
+			params.extend(value)
+		return where, params
+
 	def getValidTags(self):
 		'''
 		Retrieve a list of tag names configured in the database.
@@ -127,6 +312,31 @@ class MySQLBackend(object):
 		self.db.commit()
 		return data
 
+	def getTagIDs(self, tags=None):
+		'''
+		Map tag names to tagIDs, from a cache that is re-read from the
+		database the first time and whenever a requested tag is missing.
+
+		Args:
+		  tags (list of strings, optional): the tags to look up; default=None (all)
+		Returns:
+		  dict of tag name -> tagID
+		Raises:
+		  ValueError if one of tags does not exist
+		'''
+		if self.tagIDs is None or any(tag not in self.tagIDs for tag in tags or []):
+			cursor = self.db.cursor()
+			cursor.execute('''SELECT tagID, tag FROM tags''')
+			self.tagIDs = dict((row['tag'], row['tagID']) for row in cursor.fetchall())
+			cursor.close()
+			self.db.commit()
+		if tags is None:
+			return dict(self.tagIDs)
+		missing = [tag for tag in tags if tag not in self.tagIDs]
+		if missing:
+			raise ValueError("Invalid tag '{:s}'".format(missing[0]))
+		return dict((tag, self.tagIDs[tag]) for tag in tags)
+
 	def getColumnNames(self, table):
 		'''
 		Retrieve a list of column names from a table in the database.
@@ -202,7 +412,7 @@ class MySQLBackend(object):
 		Returns:
 		  A string containing the salted hash of the password
 		'''
-		return sha512_crypt.encrypt(data)
+		return saltAndHash(data)
 	
 	def getUser(self, key, value):
 		'''
@@ -288,35 +498,110 @@ class MySQLBackend(object):
 
 	def getAllUsers(self):
 		'''
-'		Get all users in the database.
+		Get all users in the database.
 
 		Returns:
 		  List of dicts containing user information
 		'''
-		sql1 = 	'''
-			SELECT tags.* FROM tags
-				JOIN userTags ON tags.tagID = userTags.tagID
-				JOIN users ON userTags.userID = users.userID
-			WHERE users.userID = %s
-			'''
-		sql3 = 	'''
-			SELECT * from rfids WHERE userID = %s
-			'''
+		return self.getUsers()
+
+	def getUsers(self, filters=None):
+		'''
+		Get the users matching a set of filters, with their tags and rfids.
+		The filters are translated to SQL, so only matching rows are read.
+
+		Args:
+		  filters (dict, optional): attribute name -> value. A list of values
+		    matches any of them for userID, status, email, firstName and
+		    lastName, and all of them for tags and rfids. Default=None (all users)
+		Returns:
+		  List of dicts containing user information
+		Raises:
+		  ValueError if a filter attribute is not supported
+		'''
+		where, joins, params = self.userFilterSQL(filters or {})
+		sql = '''SELECT users.* FROM users''' + joins
+		if where:
+			sql += ''' WHERE ''' + ' AND '.join(where)
+		sql += ''' ORDER BY users.userID'''
 		cursor = self.db.cursor()
-		userList =  cursor.fetchmany(cursor.execute(
-			'''SELECT * FROM users'''))
-		for user in userList:
-			if user != None:
-				numTags = cursor.execute(sql1,user['userID'])
-				data = cursor.fetchmany(numTags)
-				tags = [tag['tag'] for tag in data]
-				user['tags'] = tags
-				rfids = cursor.fetchmany(cursor.execute(sql3, user['userID']))
-				rfidList = [x['id'] for x in rfids]
-				user['rfids'] = rfidList
+		userList = cursor.fetchmany(cursor.execute(sql, params))
+		self.addUserDetails(cursor, userList)
 		cursor.close()
 		self.db.commit()
 		return userList
+
+	def userFilterSQL(self, filters):
+		'''
+		Translate user filters (see getUsers) to SQL.
+
+		Tags and rfids use all-of semantics: each is a derived table of the
+		userIDs that have every requested value (GROUP BY ... HAVING COUNT),
+		joined to users on its primary key.
+
+		Returns:
+		  (conditions, joins, params): a list of WHERE conditions, the JOIN
+		  clauses, and the parameters for both, in query order
+		'''
+		columns = {
+			'userID': 'users.userID', 'status': 'users.status',
+			'email': 'users.email', 'firstName': 'users.firstName',
+			'lastName': 'users.lastName',
+		}
+		sets = {
+			'tags':  '''SELECT userTags.userID FROM userTags
+					JOIN tags ON tags.tagID = userTags.tagID
+				WHERE tags.tag IN ({:s})
+				GROUP BY userTags.userID HAVING COUNT(DISTINCT tags.tagID) = %s''',
+			'rfids': '''SELECT rfids.userID FROM rfids
+				WHERE rfids.id IN ({:s})
+				GROUP BY rfids.userID HAVING COUNT(DISTINCT rfids.id) = %s''',
+		}
+		where, joins = [], ''
+		joinParams, whereParams = [], []
+		for i, (name, value) in enumerate(sorted(filters.items())):
+			values = value if isinstance(value, (list, tuple, set)) else [value]
+			values = sorted(set(str(v) for v in values))
+			if not values:
+				continue
+			placeholders = ','.join(['%s'] * len(values))
+			if name in columns:
+				where.append('{:s} IN ({:s})'.format(columns[name], placeholders))
+				whereParams.extend(values)
+			elif name in sets:
+				joins += '''
+			JOIN ({:s}) AS f{:d} ON f{:d}.userID = users.userID'''.format(
+					sets[name].format(placeholders), i, i)
+				joinParams.extend(values + [len(values)])
+			else:
+				raise ValueError("Invalid filter '{:}'".format(name))
+		return where, joins, joinParams + whereParams
+
+	def addUserDetails(self, cursor, userList):
+		'''
+		Set the 'tags' and 'rfids' lists of every user in userList, with one
+		query for each rather than two per user.
+		'''
+		byID = {}
+		for user in userList:
+			user['tags'] = []
+			user['rfids'] = []
+			byID[user['userID']] = user
+		if not byID:
+			return
+		placeholders = ','.join(['%s'] * len(byID))
+		sql1 = '''
+			SELECT userTags.userID, tags.tag FROM userTags
+				JOIN tags ON tags.tagID = userTags.tagID
+			WHERE userTags.userID IN ({:s})
+			'''.format(placeholders)
+		sql2 = '''
+			SELECT userID, id FROM rfids WHERE userID IN ({:s})
+			'''.format(placeholders)
+		for row in cursor.fetchmany(cursor.execute(sql1, byID.keys())):
+			byID[row['userID']]['tags'].append(row['tag'])
+		for row in cursor.fetchmany(cursor.execute(sql2, byID.keys())):
+			byID[row['userID']]['rfids'].append(row['id'])
 	
 	def updateUser(self, userID, email=None, firstName=None, lastName=None, tags=None, status=None, password=None):
 		'''
@@ -344,25 +629,176 @@ class MySQLBackend(object):
 			strings.append('''passwordHash='%s' '''%self.saltAndHash(password))
 		sql += ','.join(strings)
 		sql += '''WHERE userID = %s'''
+		# before any write: getTagIDs raises on an unknown tag (and commits)
+		tagIDs = self.getTagIDs(tags or []).values() if tags != None else None
 
 		cursor = self.db.cursor()
-		if (email != None or firstName != None or 
-		    lastName != None or password != None or status != None):
-#			print sql
-			cursor.execute(sql, userID)
+		try:
+			if (email != None or firstName != None or 
+			    lastName != None or password != None or status != None):
+#				print sql
+				cursor.execute(sql, userID)
 		
-		if tags != None:
-			cursor.execute('''DELETE FROM userTags WHERE userID = %s''', userID)
-			if tags != '':
-				for tag in tags:
-					cursor.execute('''INSERT INTO userTags (userID, tagID)
-							  VALUES(
-							  (SELECT userID FROM users WHERE userID = %s),
-						 	 (SELECT tagID FROM tags WHERE tag = %s))''', 
-						 	 (userID, tag))
+			if tagIDs != None:
+				self.setUserTags(cursor, userID, tagIDs)
 	
+			cursor.close()
+			self.db.commit()
+		except:
+			self.db.rollback()
+			raise
+		self.userChanged(userID)
+
+	def setUserTags(self, cursor, userID, tagIDs):
+		'''
+		Give a user exactly the given tags, deleting and inserting only the
+		userTags rows that differ. Does not commit.
+
+		Args:
+		  cursor: cursor of the current transaction
+		  userID (string): the user's ID number
+		  tagIDs (list): the tagIDs of the user's new tags (see getTagIDs)
+		'''
+		wanted = set(tagIDs)
+		cursor.execute('''SELECT tagID FROM userTags WHERE userID = %s''', (userID,))
+		current = set(row['tagID'] for row in cursor.fetchall())
+		removed = current - wanted
+		if removed:
+			cursor.execute('''DELETE FROM userTags WHERE userID = %s AND tagID IN ({:s})'''.format(
+				','.join(['%s'] * len(removed))), [userID] + sorted(removed))
+		if wanted - current:
+			cursor.executemany('''INSERT INTO userTags (userID, tagID) VALUES (%s, %s)''',
+				[(userID, tagID) for tagID in sorted(wanted - current)])
+
+	def retagUsers(self, userIDs, add=None, remove=None, tags=None):
+		'''
+		Change the tags of many users in one transaction.
+
+		Args:
+		  userIDs (list): the users to retag
+		  add (list of strings, optional): tags to give every user
+		  remove (list of strings, optional): tags to take from every user
+		  tags (list of strings, optional): if given, every user gets exactly
+		    these tags (add and remove are then ignored)
+		Returns:
+		  (added, removed): the number of userTags rows inserted and deleted
+		Raises:
+		  ValueError if a tag does not exist
+		'''
+		userIDs = sorted(set(int(userID) for userID in userIDs))
+		if not userIDs:
+			return 0, 0
+		users = ','.join(['%s'] * len(userIDs))
+		if tags is not None:
+			wanted = set(self.getTagIDs(tags).values())
+			unwanted = None
+		else:
+			wanted = set(self.getTagIDs(add or []).values())
+			unwanted = set(self.getTagIDs(remove or []).values()) - wanted
+		cursor = self.db.cursor()
+		try:
+			if unwanted is None:
+				sql = '''DELETE FROM userTags WHERE userID IN ({:s})'''.format(users)
+				params = list(userIDs)
+				if wanted:
+					sql += ''' AND tagID NOT IN ({:s})'''.format(','.join(['%s'] * len(wanted)))
+					params += sorted(wanted)
+				removed = cursor.execute(sql, params)
+			elif unwanted:
+				removed = cursor.execute('''DELETE FROM userTags WHERE userID IN ({:s}) AND tagID IN ({:s})'''.format(
+					users, ','.join(['%s'] * len(unwanted))), userIDs + sorted(unwanted))
+			else:
+				removed = 0
+			added = 0
+			if wanted:
+				cursor.execute('''SELECT userID, tagID FROM userTags WHERE userID IN ({:s}) AND tagID IN ({:s})'''.format(
+					users, ','.join(['%s'] * len(wanted))), userIDs + sorted(wanted))
+				existing = set((row['userID'], row['tagID']) for row in cursor.fetchall())
+				rows = [(userID, tagID) for userID in userIDs for tagID in sorted(wanted)
+					if (userID, tagID) not in existing]
+				if rows:
+					cursor.executemany('''INSERT INTO userTags (userID, tagID) VALUES (%s, %s)''', rows)
+				added = len(rows)
+			cursor.close()
+			self.db.commit()
+		except:
+			self.db.rollback()
+			raise
+		self.userChanged(*userIDs)
+		return added, removed
+
+	def getUserIDs(self, filters):
+		'''
+		Select users with the filters of getUsers, without reading them.
+
+		Returns:
+		  list of userIDs
+		Raises:
+		  ValueError if a filter attribute is not supported
+		'''
+		where, joins, params = self.userFilterSQL(filters or {})
+		sql = '''SELECT users.userID FROM users''' + joins
+		if where:
+			sql += ''' WHERE ''' + ' AND '.join(where)
+		cursor = self.db.cursor()
+		cursor.execute(sql, params)
+		userIDs = [row['userID'] for row in cursor.fetchall()]
 		cursor.close()
 		self.db.commit()
+		return userIDs
+
+	def setStatus(self, status, filters):
+		'''
+		Change the status of every user matching filters with one UPDATE,
+		writing an 'activate' (new status 'active') or 'de-activate' log for
+		each user whose status changes, in the same transaction. Programs
+		listening for notifications (see log_notify.py) are told once.
+
+		Args:
+		  status (string): the new status
+		  filters (dict): user filters as for getUsers, e.g. {'userID': [...]}
+		    or {'tags': ['teacher'], 'status': 'probation'}
+		Returns:
+		  list of the userIDs whose status changed
+		Raises:
+		  ValueError if status or a filter attribute is not valid
+		'''
+		if status not in self.getValidStatuses():
+			raise ValueError("Invalid status '{:}'".format(status))
+		if not filters:
+			raise ValueError("No users selected")
+		where, joins, params = self.userFilterSQL(filters)
+		where.append('users.status <> %s')
+		sql = '''SELECT users.userID, users.status FROM users''' + joins
+		sql += ''' WHERE ''' + ' AND '.join(where) + ''' FOR UPDATE'''
+		logType = 'activate' if status == 'active' else 'de-activate'
+
+		cursor = self.db.cursor()
+		try:
+			cursor.execute(sql, params + [status])
+			changed = [(row['userID'], row['status']) for row in cursor.fetchall()]
+			if changed:
+				userIDs = [userID for userID, old in changed]
+				cursor.execute('''UPDATE users SET status = %s WHERE userID IN ({:s})'''.format(
+					','.join(['%s'] * len(userIDs))), [status] + userIDs)
+				cursor.executemany('''
+					INSERT INTO logs
+						(timestamp, logType, userID, message)
+					VALUES
+						(UNIX_TIMESTAMP(), %s, %s, %s)''',
+					[(logType, userID, '{:s} -> {:s}'.format(old, status)) for userID, old in changed])
+			cursor.close()
+			self.db.commit()
+		except:
+			self.db.rollback()
+			raise
+		userIDs = [userID for userID, old in changed]
+		if userIDs:
+			self.userChanged(*userIDs)
+			notifier = LogNotifier()
+			notifier.notify('users', len(userIDs))
+			notifier.close()
+		return userIDs
 
 	def addUser(self, email, firstName=None, lastName=None, password=None, tags=None):
 		'''
@@ -383,25 +819,131 @@ class MySQLBackend(object):
 				(%s, %s, %s, %s)
 			'''
 		sql2 = 	'''
-			INSERT INTO userTags (userID, tagID)
-			VALUES (%s,(SELECT tagID FROM tags WHERE tag = %s))
+			INSERT INTO userTags (userID, tagID) VALUES (%s, %s)
 			'''
 
 		if password == '' or password == None:
 			password = None
 		else:
 			password = self.saltAndHash(password)
+		# before any write: getTagIDs raises on an unknown tag (and commits)
+		tagIDs = self.getTagIDs(list(set(tags or []))).values()
+		cursor = self.db.cursor()
+		try:
+			cursor.execute(sql, (email, firstName, lastName, password))
+			userID = cursor.lastrowid
+			if tagIDs:
+				cursor.executemany(sql2, [(userID, tagID) for tagID in tagIDs])
+			cursor.close()
+			self.db.commit()
+		except:
+			self.db.rollback()
+			raise
+		self.userChanged(userID)
+		return userID
+	
+	def getCardOwners(self, keys):
+		'''
+		Look up who holds a set of NFC keys.
+
+		Args:
+		  keys (list of strings): NFC key UIDs
+		Returns:
+		  dict of key UID -> (userID, email), for the keys that are assigned
+		'''
+		keys = list(set(keys))
+		if not keys:
+			return {}
+		sql = '''
+			SELECT rfids.id, users.userID, users.email FROM rfids
+				JOIN users ON users.userID = rfids.userID
+			WHERE rfids.id IN ({:s})
+			'''.format(','.join(['%s'] * len(keys)))
 		cursor = self.db.cursor()
-		cursor.execute(sql, (email, firstName, lastName, password))
-		user = self.getUserByUserID(cursor.lastrowid)
-		if tags != None:
-			for tag in tags:
-				cursor.execute(sql2, (user['userID'], tag))
+		owners = dict((row['id'], (row['userID'], row['email']))
+			      for row in cursor.fetchmany(cursor.execute(sql, keys)))
 		cursor.close()
 		self.db.commit()
-		if user != None:
-			return user['userID']
-	
+		return owners
+
+	def importUsers(self, users):
+		'''
+		Add or update many users in one transaction. Users are matched on
+		e-mail: existing users are updated, others are added. Nothing is
+		written if any statement fails.
+
+		Args:
+		  users (list of dicts): 'email' and optionally 'firstName',
+		    'lastName', 'status', 'passwordHash' (already hashed), 'tags' and
+		    'rfids'. Fields that are missing or None are left unchanged for
+		    existing users; new users without a status are inactive. A tags
+		    list replaces the user's tags; rfids are added to the user.
+		Returns:
+		  dict of lower case email -> userID for the imported users
+		'''
+		sqlUser = '''
+			INSERT INTO users
+				(email, firstName, lastName, status, passwordHash)
+			VALUES
+				(%s, %s, %s, %s, %s)
+			ON DUPLICATE KEY UPDATE
+				firstName = COALESCE(%s, firstName),
+				lastName = COALESCE(%s, lastName),
+				status = COALESCE(%s, status),
+				passwordHash = COALESCE(%s, passwordHash)
+			'''
+		sqlTag = '''INSERT INTO userTags (userID, tagID) VALUES (%s, %s)'''
+		sqlCard = '''
+			INSERT INTO rfids (id, userID) VALUES (%s, %s)
+			ON DUPLICATE KEY UPDATE userID = VALUES(userID)
+			'''
+		sqlLog = '''
+			INSERT INTO logs (timestamp, logType, rfid, userID, message)
+			VALUES (UNIX_TIMESTAMP(), 'assign', %s, %s, NULL)
+			'''
+		if not users:
+			return {}
+		# before any write: getTagIDs raises on an unknown tag (and commits)
+		tagIDs = self.getTagIDs(sorted(set(tag for user in users for tag in user.get('tags') or [])))
+		cursor = self.db.cursor()
+		try:
+			cursor.executemany(sqlUser, [(
+				user['email'], user.get('firstName'), user.get('lastName'),
+				user.get('status') or 'inactive', user.get('passwordHash'),
+				user.get('firstName'), user.get('lastName'),
+				user.get('status'), user.get('passwordHash'))
+				for user in users])
+
+			emails = [user['email'] for user in users]
+			cursor.execute('''SELECT userID, email FROM users WHERE email IN ({:s})'''.format(
+				','.join(['%s'] * len(emails))), emails)
+			userIDs = dict((row['email'].lower(), row['userID']) for row in cursor.fetchall())
+
+			retagged = [userIDs[user['email'].lower()] for user in users if user.get('tags') is not None]
+			if retagged:
+				cursor.execute('''DELETE FROM userTags WHERE userID IN ({:s})'''.format(
+					','.join(['%s'] * len(retagged))), retagged)
+				cursor.executemany(sqlTag, [(userIDs[user['email'].lower()], tagIDs[tag])
+					for user in users for tag in set(user.get('tags') or [])])
+
+			cards = [(key, userIDs[user['email'].lower()]) for user in users for key in (user.get('rfids') or [])]
+			if cards:
+				# keys a user already has are neither re-assigned nor logged
+				cursor.execute('''SELECT id, userID FROM rfids WHERE id IN ({:s})'''.format(
+					','.join(['%s'] * len(cards))), [key for key, userID in cards])
+				owned = set((row['id'], row['userID']) for row in cursor.fetchall())
+				cards = [card for card in cards if card not in owned]
+			if cards:
+				cursor.executemany(sqlCard, cards)
+				cursor.executemany(sqlLog, cards)
+			cursor.close()
+			self.db.commit()
+		except:
+			self.db.rollback()
+			raise
+		self.userChanged(*userIDs.values())
+		return userIDs
+
 	#@TEST: added for testing.
 	def rmUser(self, userID):
 		'''
@@ -425,6 +967,7 @@ class MySQLBackend(object):
 		cursor.close()
 
 		self.db.commit()
+		self.userChanged(userID)
 	
 	#@TODO: Unit tests
 	def enroll(self, key, userID, autoSteal=False):
@@ -453,6 +996,7 @@ class MySQLBackend(object):
 		cursor.close()
 		
 		self.db.commit()
+		self.userChanged(userID)
 
 	def unenroll(self, userID, keyUID):
 		'''
@@ -469,14 +1013,42 @@ class MySQLBackend(object):
 		cursor.execute(sql,(keyUID, userID))
 		cursor.close()
 		self.db.commit()
+		self.userChanged(userID)
+
+def connect():
+	'''
+	Connect to the door database with the stored credentials.
+
+	Returns:
+	  a MySQLBackend
+	'''
+	with open(credentialsPath, 'r') as credentialsFile:
+		credentials = credentialsFile.read().strip().split("\t")
+
+	try:
+		return MySQLBackend(
+			host="localhost" ,db="MakeICTMemberKeys",
+			user=credentials[0], passwd=credentials[1])
+	except:
+		print("Failed to login with: %s / %s" % (credentials[0], credentials[1]))
+		raise
+
+class LazyBackend(object):
+	'''
+	Proxy for the shared MySQLBackend that connects on first use, so that
+	importing a script (for -h, argument errors or commands that don't need
+	the database) does not open a connection.
+	'''
+	def __init__(self, factory=connect):
+		self._factory = factory
+		self._backend = None
+
+	def connected(self):
+		return self._backend is not None
 
-with open('/home/pi/code/makeictelectronicdoor/web/include/DB_CREDENTIALS', 'r') as credentialsFile:
-    credentials = credentialsFile.read().strip().split("\t")
+	def __getattr__(self, name):
+		if self._backend is None:
+			self._backend = self._factory()
+		return getattr(self._backend, name)
 
-try:
-	backend = MySQLBackend(
-		host="localhost" ,db="MakeICTMemberKeys",
-		user=credentials[0], passwd=credentials[1])
-except:
-	print("Failed to login with: %s / %s" % (credentials[0], credentials[1]))
-	raise
+backend = LazyBackend()
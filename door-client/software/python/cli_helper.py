@@ -11,8 +11,6 @@ Authors:
 	Christian Kindel <iceman81292@gmail.com>
 '''
 import os, signal, time, subprocess, argparse, readline, logging, logging.config
-from backend import backend
-from prettytable import PrettyTable
 from getpass import getpass
 
 Dir = os.path.realpath(os.path.dirname(__file__))
@@ -95,6 +93,14 @@ def validateEmail(email):
 		return False
 
 def parseFilters(filterString):
+	'''
+	Parse 'attribute:value' filters from the command line. Comma separated
+	values (and tags and rfids, always) become lists.
+
+	Returns:
+	  dict of attribute -> value or list of values, or None (after printing
+	  an error) if a filter is malformed
+	'''
 	filterDict = {}
 	for f in filterString:
 		if ':' not in f:
@@ -106,8 +112,33 @@ def parseFilters(filterString):
 			putMessage("error: Invalid filter syntax : '{:}'".format(f),
 					   level=severity.ERROR)
 			return
-		if oneFilter[0] == 'tags':
-			oneFilter[1] = [tag.strip() for tag in oneFilter[1].split(',')]
+		if ',' in oneFilter[1] or oneFilter[0] in ('tags', 'rfids'):
+			oneFilter[1] = [value.strip() for value in oneFilter[1].split(',')]
 		filterDict[oneFilter[0].strip()] = oneFilter[1]
 
 	return filterDict
+
+def parseTime(timeString):
+	'''
+	Convert a point in time given on the command line to a unix timestamp.
+
+	Args:
+	  timeString (string): 'YYYY-MM-DD', 'YYYY-MM-DD HH:MM[:SS]' (local time),
+	    a unix timestamp, or an age such as '90s', '30m', '12h', '7d', '2w'
+	Returns:
+	  the unix timestamp (int)
+	Raises:
+	  ValueError if the string is not in one of these formats
+	'''
+	timeString = timeString.strip()
+	units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+	if timeString[-1:] in units and timeString[:-1].isdigit():
+		return int(time.time()) - int(timeString[:-1]) * units[timeString[-1]]
+	if timeString.isdigit():
+		return int(timeString)
+	for timeFormat in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+		try:
+			return int(time.mktime(time.strptime(timeString, timeFormat)))
+		except ValueError:
+			pass
+	raise ValueError("Invalid time '{:s}'".format(timeString))
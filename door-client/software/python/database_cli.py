@@ -19,86 +19,252 @@ from get_user import getUser
 from show_logs import showAllLogs
 from edit_user import editUser
 from rm_user import rmUser
+from backend import backend
 from cli_helper import *
 
-import os, subprocess, readline
+import enroll as enrollScript, unenroll as unenrollScript
+import show_user as showUserScript, show_logs as showLogsScript
+import edit_user as editUserScript, rm_user as rmUserScript
+import import_users as importUsersScript, export as exportScript
+import retag as retagScript, set_status as setStatusScript
+from user_index import userIndex
+import os, time, shlex, subprocess, readline
 
 Dir = os.path.realpath(os.path.dirname(__file__))
 historyFile = os.path.join(Dir, '.cli-history')
 
+# what the values of each command's options complete to (see completeArgs);
+# 'userFilter' and 'logFilter' complete attribute:value pairs (see filterFields)
+userFields = ['userID', 'email']
+completions = {
+	'showuser': {'-u': ['userID'], '--userid': ['userID'], '-e': ['email'], '--email': ['email'],
+		     '-f': ['userFilter'], '--filters': ['userFilter']},
+	'showlogs': {'-f': ['logFilter'], '--filters': ['logFilter']},
+	'edituser': {'-u': ['userID'], '--userid': ['userID'], '-e': ['email'], '--email': ['email'],
+		     '-s': ['status'], '--status': ['status'], '-t': ['tag'], '--tags': ['tag']},
+	'adduser': {'-s': ['status'], '--status': ['status'], '-t': ['tag'], '--tags': ['tag']},
+	'retag': {'-u': ['userID'], '--users': ['userID'], '-f': ['userFilter'], '--filters': ['userFilter'],
+		  '-a': ['tag'], '--add': ['tag'], '-r': ['tag'], '--remove': ['tag'], '-s': ['tag'], '--set': ['tag']},
+	'setstatus': {'-u': ['userID'], '--users': ['userID'], '-t': ['tag'], '--tags': ['tag'],
+		      '-f': ['userFilter'], '--filters': ['userFilter']},
+	'rmuser': {'-u': userFields, '--user': userFields},
+	'enroll': {'-u': ['userID'], '--userid': ['userID']},
+	'unenroll': {'-u': ['userID'], '--user': ['userID'], '-n': ['rfid'], '--nfcid': ['rfid']},
+}
+multiValued = ['-f', '--filters', '-t', '--tags', '--users', '-a', '--add', '-r', '--remove', '--set']
+# the attributes each kind of filter accepts (MySQLBackend.userFilterSQL and
+# logFilterSQL), and the index field their values complete from, if any
+filterFields = {
+	'userFilter': {'userID': 'userID', 'email': 'email', 'firstName': 'name', 'lastName': 'name',
+		       'status': 'status', 'tags': 'tag', 'rfids': 'rfid'},
+	'logFilter': {'logID': None, 'timestamp': None, 'logType': None, 'userID': 'userID',
+		      'rfid': 'rfid', 'message': None},
+}
+
 class DatabaseCLI(Cmd):
 	def __init__(self,completekey='tab', stdin=None, stdout=None):
 		Cmd.__init__(self,completekey, stdin, stdout)
 		self.prompt = "\001\033[1m\033[34m\002DB_CMD>\001\033[0m\002 "
+		self.timing = True
+		self.started = None
+		self.index = userIndex
 		readline.read_history_file(historyFile)
+		# e-mails contain '@', '-' and '.'; only split words on whitespace
+		readline.set_completer_delims(' \t\n')
 
 	def emptyline(self):
 		pass 	
 
+	def precmd(self, line):
+		self.started = time.time() if line.strip() else None
+		return line
+
+	def postcmd(self, stop, line):
+		command = line.split()[0] if line.split() else ''
+		if self.timing and self.started and command not in ('help', '?', 'timing'):
+			putMessage("'{:s}' took {:.3f} s".format(command, time.time() - self.started))
+		return stop
+
 	def callScript(self, command):
 		args = command.split()
 		args = [arg.strip() for arg in args if arg.strip()]
 		subprocess.call(args)
-		
+
+	def runScript(self, script, args, name):
+		'''
+		Run a script's main() in this process, against the shared backend
+		connection, instead of spawning the script.
+
+		Args:
+		  script (module): the script; must provide main(argv, prog)
+		  args (string): the command line arguments
+		  name (string): the command name, used in usage and error messages
+		'''
+		try:
+			argv = shlex.split(args)
+		except ValueError as e:
+			putMessage("Invalid arguments: {:}".format(e), level=severity.ERROR)
+			return
+		try:
+			if backend.connected():
+				backend.ensureConnection()
+			return script.main(argv, prog=name)
+		except SystemExit:
+			# argparse exits on -h and on bad arguments; stay in the shell
+			pass
+		except Exception as e:
+			# a failed command must not take the shell (and its connection) down
+			putMessage("error: '{:s}' failed: {:s}: {:}".format(name, type(e).__name__, e),
+				   level=severity.ERROR)
+			if backend.connected():
+				try:
+					backend.recover()
+				except Exception as e:
+					putMessage("error: Could not re-connect to the database: {:}".format(e),
+						   level=severity.ERROR)
+
+	def completeArgs(self, script, name, text, line, begidx):
+		'''
+		Complete an option name from the command's parser, or an option value
+		from the user index.
+		'''
+		if text.startswith('-'):
+			options = [option for action in script.buildParser(name)._actions
+				   for option in action.option_strings]
+			return sorted(option for option in options if option.startswith(text))
+		words = line[:begidx].split()[1:]
+		option = None
+		for i, word in enumerate(reversed(words)):
+			if word.startswith('-'):
+				if i == 0 or word in multiValued:
+					option = word
+				break
+		fields = completions.get(name, {}).get(option, [])
+		matches = []
+		for field in fields:
+			if field in filterFields:
+				matches.extend(self.completeFilter(filterFields[field], text))
+			else:
+				matches.extend(self.index.complete(field, text))
+		return [match for match in matches if ' ' not in match]
+
+	def completeFilter(self, fields, text):
+		if ':' not in text:
+			return [field + ':' for field in sorted(fields) if field.startswith(text)]
+		field, values = text.split(':', 1)
+		if fields.get(field) is None:
+			return []
+		done, current = values.rpartition(',')[0::2]
+		start = field + ':' + (done + ',' if done else '')
+		return [start + value for value in self.index.complete(fields[field], current)]
+
+	def do_timing(self, args):
+		if args.strip() in ('on', 'off'):
+			self.timing = args.strip() == 'on'
+		putMessage("Command timing is {:s}".format('on' if self.timing else 'off'))
+
+	def help_timing(self):
+		print "timing [on|off]: show how long each command takes"
 
 	def do_showlogs(self, args):
-		self.callScript("./show_logs.py " + args)
+		self.runScript(showLogsScript, args, 'showlogs')
 
 	def help_showlogs(self):
-		subprocess.call(["./show_logs.py", "-h"])
+		showLogsScript.buildParser('showlogs').print_help()
+
+	def complete_showlogs(self, text, line, begidx, endidx):
+		return self.completeArgs(showLogsScript, 'showlogs', text, line, begidx)
 
 	def do_showuser(self, args):
-#		args = args.split()
-#		if not args:
-#			showUser()
-#		elif args[0] == 'all':
-#			if len(args) > 1:
-#				if args[1] == 'filter' and len(args) == 4:
-#					filters = {args[2]: args[3]}
-#					if showUser(filters=filters) == 1:
-#						putMessage(
-#						"Invalid filter: '{:s}'".format(args[2]),
-#						level=severity.ERROR)
-#
-#				elif args[1] == 'filter' and len(args) !=4:
-#					putMessage("Wrong number of args",
-#						   level=severity.ERROR)
-#			else:
-#				showUser(getAll=True)
-		self.callScript("./show_user.py " + args)
+		self.runScript(showUserScript, args, 'showuser')
 
 	def help_showuser(self):
-		subprocess.call(["./show_user.py", "-h"])
+		showUserScript.buildParser('showuser').print_help()
+
+	def complete_showuser(self, text, line, begidx, endidx):
+		return self.completeArgs(showUserScript, 'showuser', text, line, begidx)
 	
 	def do_adduser(self, args):
-		self.callScript("./edit_user.py " + args)
+		self.runScript(editUserScript, args, 'adduser')
 
 	def help_adduser(self):
-		subprocess.call(["./edit_user.py", "-h"])
+		editUserScript.buildParser('adduser').print_help()
+
+	def complete_adduser(self, text, line, begidx, endidx):
+		return self.completeArgs(editUserScript, 'adduser', text, line, begidx)
 
 	def do_edituser(self, args):
-		self.callScript("./edit_user.py " +  args)
+		self.runScript(editUserScript, args, 'edituser')
 	
 	def help_edituser(self):
-		subprocess.call(["./edit_user.py", "-h"])
+		editUserScript.buildParser('edituser').print_help()
+
+	def complete_edituser(self, text, line, begidx, endidx):
+		return self.completeArgs(editUserScript, 'edituser', text, line, begidx)
+
+	def do_importusers(self, args):
+		self.runScript(importUsersScript, args, 'importusers')
+
+	def help_importusers(self):
+		importUsersScript.buildParser('importusers').print_help()
+
+	def do_retag(self, args):
+		self.runScript(retagScript, args, 'retag')
+
+	def help_retag(self):
+		retagScript.buildParser('retag').print_help()
+
+	def complete_retag(self, text, line, begidx, endidx):
+		return self.completeArgs(retagScript, 'retag', text, line, begidx)
+
+	def do_setstatus(self, args):
+		self.runScript(setStatusScript, args, 'setstatus')
+
+	def help_setstatus(self):
+		setStatusScript.buildParser('setstatus').print_help()
+
+	def complete_setstatus(self, text, line, begidx, endidx):
+		words = line[:begidx].split()
+		if len(words) == 1 and not text.startswith('-'):
+			return self.index.complete('status', text)
+		return self.completeArgs(setStatusScript, 'setstatus', text, line, begidx)
+
+	def do_export(self, args):
+		self.runScript(exportScript, args, 'export')
+
+	def help_export(self):
+		exportScript.buildParser('export').print_help()
 
 	def do_rmuser(self, args):
-		self.callScript("./rm_user.py " + args)
+		self.runScript(rmUserScript, args, 'rmuser')
 	
 	def help_rmuser(self):
-		subprocess.call(["./rm_user.py", "-h"])
+		rmUserScript.buildParser('rmuser').print_help()
+
+	def complete_rmuser(self, text, line, begidx, endidx):
+		return self.completeArgs(rmUserScript, 'rmuser', text, line, begidx)
 
 	def do_enroll(self, args):
-		self.callScript("sudo ./enroll.py " + args)
+		# reading the NFC reader and restarting door-lock need root
+		if os.geteuid() == 0:
+			self.runScript(enrollScript, args, 'enroll')
+		else:
+			self.callScript("sudo " + os.path.join(Dir, 'enroll.py') + " " + args)
 	
 	def help_enroll(self):
-		subprocess.call(["./enroll.py", "-h"])
+		enrollScript.buildParser('enroll').print_help()
+
+	def complete_enroll(self, text, line, begidx, endidx):
+		return self.completeArgs(enrollScript, 'enroll', text, line, begidx)
 
 	def do_unenroll(self,args):
-		self.callScript("./unenroll.py " + args)
+		self.runScript(unenrollScript, args, 'unenroll')
 
 	def help_unenroll(self):
-		subprocess.call(["./unenroll.py", "-h"])
+		unenrollScript.buildParser('unenroll').print_help()
+
+	def complete_unenroll(self, text, line, begidx, endidx):
+		return self.completeArgs(unenrollScript, 'unenroll', text, line, begidx)
 	
 	def do_exit(self, args):
 		readline.write_history_file(historyFile)
@@ -15,12 +15,14 @@ import os, time, sys, signal, subprocess, logging, logging.config, yaml
 
 from backend import backend
 from rpi import interfaceControl
+from log_notify import LogNotifier
 
 Dir = os.path.realpath(os.path.dirname(__file__))
 config = os.path.join(Dir, 'config.yml')
 global_config = yaml.load(file(config, 'r'))
 
 lastDoorStatus = [0,0]
+notifier = LogNotifier()
 logging.config.dictConfig(global_config['logging'])
 log=logging.getLogger('door-lock')
 
@@ -71,7 +73,7 @@ def checkCards():
 			if user['status'] == 'active':
 				log.info("ACCEPTED card ID: %s" % nfcID)
 				log.info("Access granted to '%s %s'" % (user['firstName'], user['lastName']))
-				backend.log('unlock', nfcID, user['userID'])
+				notifier.notify('log', backend.log('unlock', nfcID, user['userID']))
 				log.info("Door 1: UNLOCKED")
 				interfaceControl.unlockDoor()
 				proc = subprocess.Popen(['/home/pi/code/makeictelectronicdoor/vista/disarm.sh'], stdout=subprocess.PIPE)
@@ -80,12 +82,12 @@ def checkCards():
 			else:
 				log.warning("DENIED card  ID: %s" % nfcID)
 				log.warning("Reason: '%s %s' is not active" % (user['firstName'], user['lastName']))
-				backend.log('deny', nfcID, user['userID'])
+				notifier.notify('log', backend.log('deny', nfcID, user['userID']))
 				interfaceControl.showBadCardRead()
 		else:
 			log.warning("DENIED card  ID: %s" % nfcID)
 			log.warning("Reason: card not registered")
-			backend.log('deny', nfcID)
+			notifier.notify('log', backend.log('deny', nfcID))
 			interfaceControl.showBadCardRead()
 
 log.debug("Entering monitor loop")
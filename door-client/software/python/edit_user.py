@@ -17,9 +17,9 @@ from get_user import getUser
 from enroll import enroll
 from cli_helper import *
 
-validTags = backend.getValidTags()
-validStatuses = backend.getValidStatuses()
 def editUser(userID=None, email=None, firstName=None, lastName=None, status=None, tags=None, password=None):
+	validTags = backend.getValidTags()
+	validStatuses = backend.getValidStatuses()
 	if userID or email:
 		userSearch = userID if userID else email
 		user = getUser(userSearch, confirm=False)
@@ -120,18 +120,33 @@ def editUser(userID=None, email=None, firstName=None, lastName=None, status=None
 		putMessage("Information for user [{:d}] has been updated".format(user['userID']),
 			   level= severity.OK)
 
-if __name__ == "__main__":
-	parser = argparse.ArgumentParser(description='Add a user to the MakeICT database.')
-	parser.add_argument("-u", "--userid", help="The user's userID.")
+def buildParser(prog=None):
+	parser = argparse.ArgumentParser(prog=prog, description='Add a user to the MakeICT database.')
+	parser.add_argument("-u", "--userid", help="The user's userID or name.")
 	parser.add_argument("-e", "--email", help="The user's e-mail address.")
 	parser.add_argument("-f", "--firstname", help="The user's first name.")
 	parser.add_argument("-l", "--lastname", help="The user's last name.")
 	parser.add_argument("-p", "--password", help="The user's password.")
-	parser.add_argument("-s", "--status", help="The user's status.", choices=validStatuses)
-	parser.add_argument("-t", "--tags", choices=validTags, nargs='+')
-	args = parser.parse_args()
+	# statuses and tags are checked in main(), so -h works without the database
+	parser.add_argument("-s", "--status", help="The user's status.")
+	parser.add_argument("-t", "--tags", nargs='+', help="The user's tags.")
+	return parser
+
+def main(argv=None, prog=None):
+	parser = buildParser(prog)
+	args = parser.parse_args(argv)
+	if args.status and args.status not in backend.getValidStatuses():
+		parser.error("argument -s/--status: invalid choice: '{:s}' (choose from {:s})".format(
+			args.status, ', '.join(backend.getValidStatuses())))
+	for tag in args.tags or []:
+		if tag not in backend.getValidTags():
+			parser.error("argument -t/--tags: invalid choice: '{:s}' (choose from {:s})".format(
+				tag, ', '.join(backend.getValidTags())))
 
 	try:
-		editUser(args.userid, args.email, args.firstname, args.lastname, args.status, args.tags, args.password)
+		return editUser(args.userid, args.email, args.firstname, args.lastname, args.status, args.tags, args.password)
 	except KeyboardInterrupt:
 		pass
+
+if __name__ == "__main__":
+	exit(main())
@@ -13,23 +13,35 @@ Authors:
 '''
 #@TODO: define error status codes here (duplicate key error)
 
-import os, sys, signal, time, subprocess, argparse, logging, logging.config, yaml
-from backend import backend
+import os, sys, signal, time, subprocess, argparse, logging, logging.config
+from backend import backend, MySQLdb
 from get_user import getUser
 from cli_helper import *
-from MySQLdb import IntegrityError
 
 Dir = os.path.realpath(os.path.dirname(__file__))
 doorLockPipedLog = os.path.join(Dir, '../logs/piped-door-lock.log')
 config = os.path.join(Dir, 'config.yml')
-global_config = yaml.load(file(config, 'r'))
-logging.config.dictConfig(global_config['logging'])
 log = logging.getLogger('enroll')
+loggingConfigured = False
+
+def setupLogging():
+	'''
+	Load the logging configuration from config.yml, once. Deferred until
+	it is needed so that importing this module does not load yaml.
+	'''
+	global loggingConfigured
+	if loggingConfigured:
+		return
+	import yaml
+	global_config = yaml.load(file(config, 'r'))
+	logging.config.dictConfig(global_config['logging'])
+	loggingConfigured = True
 
 def enroll(userID=None, nfcID=None, steal=False, quiet=False, reader=False):
 	if os.geteuid() != 0:
 		print "Root is required to run this script"
 		return
+	setupLogging()
 
 	user = getUser(userID, confirm=(False if userID else True))
 	if user == None:
@@ -86,13 +98,14 @@ def enroll(userID=None, nfcID=None, steal=False, quiet=False, reader=False):
 		try:
 			backend.enroll(nfcID, userID, steal)
 			putMessage("User [{:d}] enrolled with ID: {:s}".format(userID, nfcID),level=severity.OK)
-		except IntegrityError:
+		except MySQLdb.IntegrityError:
 			putMessage("Key is already assigned!",level=severity.WARNING)
 			putMessage("User not enrolled",level=severity.ERROR)
 	else:
 		putMessage("Did not enroll user", level=severity.WARNING)
 
 def killDoorLock():
+	setupLogging()
 	process = subprocess.Popen(['pgrep', 'door-lock.py'], stdout=subprocess.PIPE)
 	out, err = process.communicate()
 	if out != '':
@@ -123,18 +136,25 @@ def startDoorLock():
 
 
 
-if __name__ == "__main__":
-	log.info("==========[enroll.py started]==========")
-
-	parser = argparse.ArgumentParser(description='Add an NFC ID to a user in the MakeICT database.')
-	parser.add_argument("-u", "--userid", help="The user's unique userID.", type=int)
+def buildParser(prog=None):
+	parser = argparse.ArgumentParser(prog=prog, description='Add an NFC ID to a user in the MakeICT database.')
+	parser.add_argument("-u", "--userid", help="The user's unique userID, e-mail address or name.")
 	parser.add_argument("-s", "--steal", help="Re-assign the card if it is already registered to another user.", action="store_true")
 	parser.add_argument("-q", "--quiet", help="Suppress prompts and output", action="store_true")
 	method = parser.add_mutually_exclusive_group()
 	method.add_argument("-n", "--nfcid", help="UID of the user's NFC card.")
 	method.add_argument("-r", "--reader", help="Read a card UID from the card reader", action="store_true")
-	args = parser.parse_args()
+	return parser
+
+def main(argv=None, prog=None):
+	args = buildParser(prog).parse_args(argv)
+	# after parsing, so -h and argument errors don't load yaml
+	setupLogging()
+	log.info("==========[enroll.py started]==========")
 	try:
 		enroll(args.userid, args.nfcid, args.steal, args.quiet, args.reader)
 	except KeyboardInterrupt:
 		pass
+
+if __name__ == "__main__":
+	main()
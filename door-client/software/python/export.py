@@ -0,0 +1,154 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+MakeICT/Bluebird Arthouse Electronic Door Entry
+
+export.py: Exports users or logs to CSV or JSON Lines
+Usage: export.py users|logs FILE [--format csv|jsonl] [--gzip]
+                 [--since TIME] [--until TIME] [--after-id LOGID]
+
+Rows are streamed from a server-side cursor straight to the file, so memory
+use does not depend on the size of the table. Users are exported with their
+tags and keys (comma separated in CSV), without password hashes; the CSV
+can be read back by import_users.py. FILE '-' writes to standard output.
+
+For incremental log exports, pass the last logID of the previous export
+(printed at the end) as --after-id.
+
+Authors:
+	Dominic Canare <dom@greenlightgo.org>
+	Rye Kennedy <ryekennedy@gmail.com>
+	Christian Kindel <iceman81292@gmail.com>
+'''
+
+import os, sys, time, csv, json, gzip, argparse
+from collections import OrderedDict
+from backend import backend
+from cli_helper import *
+
+fieldOrders = {
+	'users': ['userID', 'email', 'firstName', 'lastName', 'status', 'tags', 'rfids'],
+	'logs': ['logID', 'timestamp', 'logType', 'userID', 'rfid', 'message'],
+}
+
+def csvValue(value):
+	if value is None:
+		return ''
+	if isinstance(value, list):
+		value = ','.join(value)
+	if isinstance(value, unicode):
+		return value.encode('utf-8')
+	return str(value)
+
+class CSVWriter(object):
+	def __init__(self, out, fieldOrder):
+		self.fieldOrder = fieldOrder
+		self.writer = csv.writer(out)
+		self.writer.writerow(fieldOrder)
+
+	def write(self, row):
+		self.writer.writerow([csvValue(row[field]) for field in self.fieldOrder])
+
+class JSONLinesWriter(object):
+	def __init__(self, out, fieldOrder):
+		self.out = out
+		self.fieldOrder = fieldOrder
+
+	def write(self, row):
+		self.out.write(json.dumps(OrderedDict((field, row[field]) for field in self.fieldOrder)))
+		self.out.write('\n')
+
+writers = {'csv': CSVWriter, 'jsonl': JSONLinesWriter}
+
+def openOutput(path, compress=False):
+	if path == '-':
+		return gzip.GzipFile(fileobj=sys.stdout, mode='wb') if compress else sys.stdout
+	return gzip.open(path, 'wb') if compress else open(path, 'wb', 1 << 16)
+
+def export(table, path, fileFormat=None, compress=None, since=None, until=None, afterID=None):
+	'''
+	Write every user, or every log in a time range, to a file.
+
+	Args:
+	  table (string): 'users' or 'logs'
+	  path (string): output file, '-' for standard output
+	  fileFormat (string, optional): 'csv' or 'jsonl'; default: from the
+	    file extension, csv if it says nothing
+	  compress (bool, optional): gzip the output; default: if path ends in .gz
+	  since, until (int, optional): logs only, unix time range [since, until)
+	  afterID (int, optional): logs only, export logs with logID > afterID
+	Returns:
+	  the number of rows written
+	'''
+	base = path[:-3] if path.endswith('.gz') else path
+	if compress is None:
+		compress = path.endswith('.gz')
+	if not fileFormat:
+		fileFormat = 'jsonl' if os.path.splitext(base)[1].lower() in ('.jsonl', '.json') else 'csv'
+
+	# open the output first: a streaming query must be read to the end or
+	# closed before the connection can be used again
+	out = openOutput(path, compress)
+	rows = None
+	count = 0
+	lastID = afterID
+	try:
+		if table == 'users':
+			rows = backend.iterUsers()
+		else:
+			rows = backend.iterLogs(since=since, until=until, afterID=afterID)
+		writer = writers[fileFormat](out, fieldOrders[table])
+		for row in rows:
+			writer.write(row)
+			count += 1
+		if table == 'logs' and count:
+			lastID = row['logID']
+	finally:
+		if rows is not None:
+			rows.close()
+		if out is not sys.stdout:
+			out.close()
+		else:
+			out.flush()
+	return count, lastID
+
+def buildParser(prog=None):
+	parser = argparse.ArgumentParser(prog=prog, description='Export users or logs from the MakeICT database.')
+	parser.add_argument("table", choices=['users', 'logs'])
+	parser.add_argument("file", help="Output file ('-': standard output). A .gz suffix compresses it.")
+	parser.add_argument("--format", choices=sorted(writers.keys()), help="Output format (default: from the extension, else csv).")
+	parser.add_argument("-z", "--gzip", action='store_true', default=None, help="Compress the output with gzip.")
+	parser.add_argument("-s", "--since", help="Logs only: from this time on ('YYYY-MM-DD [HH:MM[:SS]]', unix time or an age like 7d).")
+	parser.add_argument("-u", "--until", help="Logs only: before this time.")
+	parser.add_argument("-a", "--after-id", type=int, help="Logs only: resume after this logID.")
+	return parser
+
+def main(argv=None, prog=None):
+	parser = buildParser(prog)
+	args = parser.parse_args(argv)
+	if args.table == 'users' and (args.since or args.until or args.after_id is not None):
+		parser.error("--since, --until and --after-id apply to logs only")
+	try:
+		since = parseTime(args.since) if args.since else None
+		until = parseTime(args.until) if args.until else None
+	except ValueError as e:
+		parser.error(str(e))
+
+	start = time.time()
+	try:
+		count, lastID = export(args.table, args.file, args.format, args.gzip, since, until, args.after_id)
+	except IOError as e:
+		putMessage("Could not write {:s}: {:}".format(args.file, e), level=severity.ERROR)
+		return 1
+	except KeyboardInterrupt:
+		return 1
+	if args.file != '-':
+		elapsed = time.time() - start
+		putMessage("Exported {:d} {:s} in {:.2f} s".format(count, args.table, elapsed),
+			   "{:.0f} rows/s".format(count / elapsed) if elapsed else '', level=severity.OK)
+		if args.table == 'logs' and lastID is not None:
+			putMessage("Last logID: {:d}".format(lastID), "resume with --after-id {:d}".format(lastID))
+	return 0
+
+if __name__ == "__main__":
+	exit(main())
@@ -13,13 +13,36 @@ Authors:
 
 import signal, time, subprocess, argparse, logging, logging.config
 from backend import backend
+from user_index import userIndex
 from cli_helper import *
 
+def findUser(search, limit=9):
+	'''
+	Fuzzy search by name or e-mail; let the operator pick from the best
+	matches.
+
+	Returns:
+	  the chosen userID, or None
+	'''
+	matches = userIndex.search(search, limit)
+	if not matches:
+		putMessage("No users match '{:s}'.".format(search), level=severity.WARNING)
+		return None
+	# only an exact match is taken without asking
+	if matches[0][0] == 1.0 and (len(matches) == 1 or matches[1][0] < 1.0):
+		return matches[0][1]
+	for i, (score, userID, firstName, lastName, email) in enumerate(matches, 1):
+		putMessage("{:d}) [{:d}] {:s} {:s}".format(i, userID, firstName, lastName), email)
+	choice = getInput("Which user?", options=[str(i) for i in range(1, len(matches) + 1)] + ['n'])
+	if choice == 'n':
+		return None
+	return matches[int(choice) - 1][1]
+
 def getUser(search=None, confirm=True):
-	search = str(search) if search else None
+	search = str(search).strip() if search else None
 	while True:
 		if search == None:
-			search = getInput("Enter E-mail or userID")
+			search = getInput("Enter e-mail, userID or name")
 		elif search.isdigit():
 			user = backend.getUserByUserID(search)
 			break
@@ -27,8 +50,9 @@ def getUser(search=None, confirm=True):
 			user = backend.getUserByEmail(search)
 			break
 		else:
-			putMessage("Invalid search criteria.", level=severity.ERROR)
-			search = None
+			userID = findUser(search)
+			user = backend.getUserByUserID(userID) if userID else None
+			break
 	if user == None:
 		putMessage("User not found. Confirm info and try again.", level=severity.WARNING)
 	else:
@@ -39,13 +63,19 @@ def getUser(search=None, confirm=True):
 				return None
 	return user
 
-if __name__ == "__main__":
-	parser = argparse.ArgumentParser(description='Add a user to the MakeICT database.')
-	parser.add_argument("-u", "--user", help="The user's userID or e-mail address.")
+def buildParser(prog=None):
+	parser = argparse.ArgumentParser(prog=prog, description='Add a user to the MakeICT database.')
+	parser.add_argument("-u", "--user", help="The user's userID, e-mail address or name.")
 	parser.add_argument("-n", "--noconfirm", action='store_true', help="Do not prompt for confirmation")
-	args = parser.parse_args()
+	return parser
+
+def main(argv=None, prog=None):
+	args = buildParser(prog).parse_args(argv)
 
 	try:
 		getUser(args.user, args.noconfirm)
 	except KeyboardInterrupt:
 		pass
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,109 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+MakeICT/Bluebird Arthouse Electronic Door Entry
+
+import_time.py: Measures how long the CLI modules and scripts take to start
+Usage: import_time.py [module ...] [--tree] [-c "script.py args" ...] [-r N]
+
+Python 2 has no -X importtime, so each module is imported in a fresh
+interpreter with __import__ wrapped, and the same report is printed:
+self and cumulative microseconds for every module loaded for the first
+time, indented by import depth. -c times whole script runs instead
+(e.g. -c "edit_user.py -h"), best of N.
+
+Authors:
+	Dominic Canare <dom@greenlightgo.org>
+	Rye Kennedy <ryekennedy@gmail.com>
+	Christian Kindel <iceman81292@gmail.com>
+'''
+
+import os, sys, time, argparse, subprocess, __builtin__
+
+Dir = os.path.realpath(os.path.dirname(__file__))
+defaultModules = ['cli_helper', 'backend', 'get_user', 'show_user', 'show_logs', 'edit_user',
+		  'enroll', 'unenroll', 'rm_user', 'import_users', 'export', 'database_cli']
+
+def traceImports(module):
+	'''
+	Import module, timing every import it triggers.
+
+	Returns:
+	  a list of (depth, name, self seconds, cumulative seconds), in the order
+	  the imports finished (dependencies before the modules that need them)
+	'''
+	records = []
+	stack = [0.0]
+	original = __builtin__.__import__
+	def timedImport(name, globals=None, locals=None, fromlist=None, level=-1):
+		if name in sys.modules:
+			return original(name, globals, locals, fromlist, level)
+		stack.append(0.0)
+		start = time.time()
+		try:
+			return original(name, globals, locals, fromlist, level)
+		finally:
+			elapsed = time.time() - start
+			children = stack.pop()
+			stack[-1] += elapsed
+			records.append((len(stack) - 1, name, elapsed - children, elapsed))
+	__builtin__.__import__ = timedImport
+	try:
+		__import__(module)
+	finally:
+		__builtin__.__import__ = original
+	return records
+
+def runTraced(module, tree=False):
+	'''
+	Trace module in a fresh interpreter, print its report and return the
+	total import time in seconds (None if the import failed)
+	'''
+	process = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--trace', module],
+				   cwd=Dir, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+	out, err = process.communicate()
+	if process.returncode != 0:
+		print "{:<16s} import failed: {:s}".format(module, err.strip().splitlines()[-1] if err.strip() else '?')
+		return None
+	records = [line.split('\t') for line in out.splitlines() if line]
+	total = sum(float(cumulative) for depth, name, own, cumulative in records if depth == '0')
+	if tree:
+		print "import time: self [us] | cumulative | imported package"
+		for depth, name, own, cumulative in records:
+			print "import time: {:>9d} | {:>10d} | {:s}{:s}".format(
+				int(float(own) * 1e6), int(float(cumulative) * 1e6), '  ' * int(depth), name)
+	print "{:<16s} {:8.1f} ms".format(module, total * 1e3)
+	return total
+
+def timeCommand(command, repeat):
+	'''Best wall clock time of `repeat` runs of a script, in seconds'''
+	args = command.split()
+	args[0] = os.path.join(Dir, args[0])
+	best = None
+	with open(os.devnull, 'w') as devnull:
+		for i in range(repeat):
+			start = time.time()
+			subprocess.call([sys.executable] + args, cwd=Dir, stdout=devnull, stderr=devnull)
+			elapsed = time.time() - start
+			best = elapsed if best is None else min(best, elapsed)
+	return best
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description='Measure the start-up time of the CLI modules.')
+	parser.add_argument("modules", nargs='*', help="Modules to import (default: all CLI modules).")
+	parser.add_argument("-t", "--tree", action='store_true', help="Print every module imported, like python3 -X importtime.")
+	parser.add_argument("-c", "--command", action='append', help="Time a whole script run instead, e.g. 'edit_user.py -h' (repeatable).")
+	parser.add_argument("-r", "--repeat", type=int, default=5, help="Runs per command; the best is reported.")
+	parser.add_argument("--trace", help=argparse.SUPPRESS)
+	args = parser.parse_args()
+
+	if args.trace:
+		sys.path.insert(0, Dir)
+		for record in traceImports(args.trace):
+			print "{:d}\t{:s}\t{:.7f}\t{:.7f}".format(*record)
+	elif args.command:
+		for command in args.command:
+			print "{:<30s} {:8.1f} ms".format(command, timeCommand(command, args.repeat) * 1e3)
+	else:
+		for module in args.modules or defaultModules:
+			runTraced(module, args.tree)
@@ -0,0 +1,202 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+MakeICT/Bluebird Arthouse Electronic Door Entry
+
+import_users.py: Adds or updates many users at once from a CSV or JSON Lines file
+Usage: import_users.py FILE [--format csv|jsonl] [--steal] [--dry-run]
+
+Columns (CSV header / JSON keys): email (required), firstName, lastName,
+status, password, tags, rfids. Users are matched on e-mail. tags and rfids
+are comma separated in CSV, lists or comma separated strings in JSON. A
+tags value of '-' removes all of the user's tags; empty fields leave the
+stored value unchanged.
+
+Authors:
+	Dominic Canare <dom@greenlightgo.org>
+	Rye Kennedy <ryekennedy@gmail.com>
+	Christian Kindel <iceman81292@gmail.com>
+'''
+
+import os, time, csv, json, argparse
+from backend import backend, saltAndHash
+from cli_helper import *
+
+fields = ['email', 'firstName', 'lastName', 'status', 'password', 'tags', 'rfids']
+ignored = ['userID']	# written by export.py; users are matched on e-mail
+
+def readRows(path, fileFormat=None):
+	'''
+	Generator yielding (line number, dict) for every row in a CSV file with
+	a header line, or in a JSON Lines file (one object per line)
+	'''
+	if not fileFormat:
+		fileFormat = 'jsonl' if os.path.splitext(path)[1].lower() in ('.jsonl', '.json') else 'csv'
+	with open(path, 'rb') as f:
+		if fileFormat == 'csv':
+			reader = csv.DictReader(f)
+			for row in reader:
+				yield reader.line_num, row
+		else:
+			for lineNumber, line in enumerate(f, 1):
+				if not line.strip():
+					continue
+				try:
+					yield lineNumber, json.loads(line)
+				except ValueError as e:
+					yield lineNumber, e
+
+def cleanRow(row):
+	'''
+	Normalize one input row: strip strings, turn empty fields into None and
+	tags/rfids into lists.
+
+	Raises:
+	  ValueError for unknown columns
+	'''
+	user = {}
+	for name, value in row.items():
+		if name in ignored:
+			continue
+		if name not in fields:
+			raise ValueError("Unknown column '{:}'".format(name))
+		if isinstance(value, basestring):
+			value = value.strip()
+		if value in ('', None):
+			continue
+		if name in ('tags', 'rfids'):
+			if value == '-' and name == 'tags':
+				value = []
+			elif isinstance(value, basestring):
+				value = [x.strip() for x in value.split(',') if x.strip()]
+			else:
+				value = [str(x).strip() for x in value]
+		elif not isinstance(value, basestring):
+			value = str(value)
+		user[name] = value
+	return user
+
+def validateRows(rows, steal=False):
+	'''
+	Check rows against the tags and statuses configured in the database
+	(read once), the e-mails and keys earlier in the file, and the current
+	owners of the keys.
+
+	Returns:
+	  (users, errors): the valid users as (line number, user dict), and
+	  a list of (line number, message)
+	'''
+	validTags = set(backend.getValidTags())
+	validStatuses = set(backend.getValidStatuses())
+	users, errors = [], []
+	emails, keys = {}, {}
+	for lineNumber, row in rows:
+		if isinstance(row, Exception):
+			errors.append((lineNumber, "Invalid JSON: {:}".format(row)))
+			continue
+		try:
+			user = cleanRow(row)
+		except (ValueError, AttributeError) as e:
+			errors.append((lineNumber, str(e) if isinstance(e, ValueError) else "Not a JSON object"))
+			continue
+		problems = []
+		email = user.get('email')
+		if not validateEmail(email):
+			problems.append("Invalid e-mail '{:}'".format(email))
+		elif email.lower() in emails:
+			problems.append("Duplicate e-mail '{:s}' (line {:d})".format(email, emails[email.lower()]))
+		if user.get('status') and user['status'] not in validStatuses:
+			problems.append("Invalid status '{:s}'".format(user['status']))
+		for tag in user.get('tags') or []:
+			if tag not in validTags:
+				problems.append("Invalid tag '{:s}'".format(tag))
+		for key in user.get('rfids') or []:
+			if key in keys:
+				problems.append("Key {:s} also on line {:d}".format(key, keys[key]))
+		if problems:
+			errors.append((lineNumber, '; '.join(problems)))
+			continue
+		emails[email.lower()] = lineNumber
+		for key in user.get('rfids') or []:
+			keys[key] = lineNumber
+		users.append((lineNumber, user))
+
+	owners = backend.getCardOwners(keys.keys())
+	if owners and not steal:
+		valid = []
+		for lineNumber, user in users:
+			taken = [key for key in user.get('rfids') or []
+				 if key in owners and (owners[key][1] or '').lower() != user['email'].lower()]
+			if taken:
+				errors.append((lineNumber, "Key {:s} is already assigned to user [{:d}]".format(
+					', '.join(taken), owners[taken[0]][0])))
+			else:
+				valid.append((lineNumber, user))
+		users = valid
+	return users, sorted(errors)
+
+def hashPasswords(users, workers=None):
+	'''
+	Replace every 'password' with a 'passwordHash'. SHA512-crypt is slow on
+	purpose, so the hashes are computed in a pool of worker processes.
+	'''
+	pending = [user for user in users if user.get('password')]
+	if len(pending) > 1 and workers != 1:
+		import multiprocessing
+		pool = multiprocessing.Pool(workers)
+		try:
+			hashes = pool.map(saltAndHash, [user['password'] for user in pending])
+		finally:
+			pool.close()
+			pool.join()
+	else:
+		hashes = [saltAndHash(user['password']) for user in pending]
+	for user, passwordHash in zip(pending, hashes):
+		user['passwordHash'] = passwordHash
+	for user in users:
+		user.pop('password', None)
+
+def importUsers(path, fileFormat=None, steal=False, dryRun=False, workers=None):
+	start = time.time()
+	try:
+		users, errors = validateRows(readRows(path, fileFormat), steal)
+	except (IOError, csv.Error) as e:
+		putMessage("Could not read {:s}: {:}".format(path, e), level=severity.ERROR)
+		return 1
+	for lineNumber, message in errors:
+		putMessage("line {:d}: {:s}".format(lineNumber, message), level=severity.ERROR)
+	users = [user for lineNumber, user in users]
+	if dryRun:
+		putMessage("{:d} valid rows, {:d} rejected (dry run)".format(len(users), len(errors)),
+			   level=severity.WARNING if errors else severity.OK)
+		return 1 if errors else 0
+
+	hashPasswords(users, workers)
+	backend.importUsers(users)
+	elapsed = time.time() - start
+	putMessage("Imported {:d} users in {:.2f} s".format(len(users), elapsed),
+		   "{:.0f} rows/s".format(len(users) / elapsed) if elapsed else '', level=severity.OK)
+	if errors:
+		putMessage("{:d} rows rejected".format(len(errors)), level=severity.WARNING)
+		return 1
+	return 0
+
+def buildParser(prog=None):
+	parser = argparse.ArgumentParser(prog=prog, description='Add or update users in the MakeICT database from a file.')
+	parser.add_argument("file", help="CSV file with a header line, or JSON Lines file.")
+	parser.add_argument("--format", choices=['csv', 'jsonl'], help="File format (default: from the extension).")
+	parser.add_argument("-s", "--steal", action="store_true", help="Re-assign keys that are registered to other users.")
+	parser.add_argument("-n", "--dry-run", action="store_true", help="Only validate the file.")
+	parser.add_argument("-w", "--workers", type=int, help="Password hashing processes (default: one per CPU).")
+	return parser
+
+def main(argv=None, prog=None):
+	args = buildParser(prog).parse_args(argv)
+
+	try:
+		return importUsers(args.file, args.format, args.steal, args.dry_run, args.workers)
+	except KeyboardInterrupt:
+		pass
+
+if __name__ == "__main__":
+	exit(main())
@@ -0,0 +1,22 @@
+-- MakeICT/Bluebird Arthouse Electronic Door Entry
+-- indexes.sql: indexes used by backend.py's filtered queries (MySQL)
+--
+-- Run once against MakeICTMemberKeys:
+--   mysql -u <user> -p MakeICTMemberKeys < indexes.sql
+-- MySQL has no CREATE INDEX IF NOT EXISTS; "Duplicate key name" errors mean
+-- the index is already there.
+
+-- status/name filters in show_user.py -f
+CREATE INDEX users_status ON users (status);
+CREATE INDEX users_name ON users (lastName, firstName);
+
+-- tag filters: tag name -> tagID -> the users that have it
+CREATE UNIQUE INDEX tags_tag ON tags (tag);
+CREATE INDEX userTags_tag_user ON userTags (tagID, userID);
+CREATE INDEX userTags_user_tag ON userTags (userID, tagID);
+
+-- the cards of a set of users
+CREATE INDEX rfids_user ON rfids (userID);
+
+-- show_logs.py --since
+CREATE INDEX logs_timestamp ON logs (timestamp);
@@ -0,0 +1,109 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+MakeICT/Bluebird Arthouse Electronic Door Entry
+
+log_notify.py: Local push notifications for new logs and user changes
+
+Every listener (e.g. show_logs.py --follow) binds a unix datagram socket in
+notifyDir; door-lock.py sends a short datagram to each of them whenever it
+writes a log, so followers can query right away instead of polling often.
+MySQLBackend.setStatus sends one after a bulk status change, so anything
+caching users knows to re-read them.
+Notifications are best effort: nothing is sent if nobody listens, and a
+follower still polls now and then in case one is lost.
+
+Messages are plain text: 'log <logID>' or 'users <number changed>'.
+
+Authors:
+	Dominic Canare <dom@greenlightgo.org>
+	Rye Kennedy <ryekennedy@gmail.com>
+	Christian Kindel <iceman81292@gmail.com>
+'''
+
+import os, socket, select, errno
+
+notifyDir = '/tmp/door-lock-notify'
+
+class LogNotifier(object):
+	def __init__(self, path=notifyDir):
+		self.path = path
+		self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+		self.sock.setblocking(False)
+
+	def notify(self, kind='log', value=''):
+		'''
+		Send a message to every listener. Never raises: a missing directory
+		means nobody listens, and sockets left behind by listeners that died
+		are removed.
+
+		Args:
+		  kind (string): message type, default='log'
+		  value (optional): sent after the type, e.g. the logID
+		'''
+		message = '{:s} {:}'.format(kind, value).strip()
+		try:
+			names = os.listdir(self.path)
+		except OSError:
+			return
+		for name in names:
+			address = os.path.join(self.path, name)
+			try:
+				self.sock.sendto(message, address)
+			except socket.error as e:
+				if e.errno in (errno.ECONNREFUSED, errno.ENOENT):
+					try:
+						os.unlink(address)
+					except OSError:
+						pass
+				# EAGAIN: the listener is behind; it will query anyway
+
+	def close(self):
+		self.sock.close()
+
+class LogListener(object):
+	def __init__(self, path=notifyDir):
+		'''
+		Bind a socket for this process in path, creating the directory
+		(world-writable and sticky, like /tmp) if needed.
+		'''
+		if not os.path.isdir(path):
+			try:
+				os.mkdir(path)
+				os.chmod(path, 01777)
+			except OSError as e:
+				if e.errno != errno.EEXIST:
+					raise
+		self.address = os.path.join(path, '{:d}.sock'.format(os.getpid()))
+		if os.path.exists(self.address):
+			os.unlink(self.address)
+		self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+		self.sock.bind(self.address)
+		os.chmod(self.address, 0666)
+		self.sock.setblocking(False)
+		self.heard = False
+
+	def wait(self, timeout):
+		'''
+		Wait up to timeout seconds for notifications.
+
+		Returns:
+		  the list of messages received (empty on timeout)
+		'''
+		messages = []
+		ready = select.select([self.sock], [], [], timeout)[0]
+		while ready:
+			try:
+				messages.append(self.sock.recv(256))
+			except socket.error:
+				break
+		if messages:
+			self.heard = True
+		return messages
+
+	def close(self):
+		self.sock.close()
+		try:
+			os.unlink(self.address)
+		except OSError:
+			pass
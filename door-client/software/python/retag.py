@@ -0,0 +1,76 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+MakeICT/Bluebird Arthouse Electronic Door Entry
+
+retag.py: Adds, removes or sets tags of many users at once, in one transaction
+Usage: retag.py (-u USERID [USERID ...] | -f FILTER [FILTER ...]) [-a TAG ...] [-r TAG ...] [-s TAG ...] [-y]
+
+Authors:
+	Dominic Canare <dom@greenlightgo.org>
+	Rye Kennedy <ryekennedy@gmail.com>
+	Christian Kindel <iceman81292@gmail.com>
+'''
+import argparse
+from backend import backend
+from cli_helper import *
+
+def retag(userIDs=None, filters=None, add=None, remove=None, tags=None, confirm=True):
+	try:
+		if filters:
+			userIDs = backend.getUserIDs(filters)
+		backend.getTagIDs((add or []) + (remove or []) + (tags or []))
+	except ValueError as e:
+		putMessage(str(e), level=severity.ERROR)
+		return 1
+	if not userIDs:
+		putMessage("No matching users", level=severity.WARNING)
+		return 1
+
+	changes = []
+	if tags is not None:
+		changes.append("set tags to {:}".format(', '.join(tags) or 'none'))
+	else:
+		if add:
+			changes.append("add {:}".format(', '.join(add)))
+		if remove:
+			changes.append("remove {:}".format(', '.join(remove)))
+	putMessage("{:s} for {:d} user(s)".format('; '.join(changes).capitalize(), len(userIDs)), level=severity.WARNING)
+	if confirm and getInput("{'yes' to continue, anything else to exit}") != 'yes':
+		return 1
+
+	added, removed = backend.retagUsers(userIDs, add, remove, tags)
+	putMessage("Added {:d} and removed {:d} tag(s)".format(added, removed), level=severity.OK)
+
+def buildParser(prog=None):
+	parser = argparse.ArgumentParser(prog=prog, description='Change the tags of many users in the MakeICT database.')
+	lookup = parser.add_mutually_exclusive_group(required=True)
+	lookup.add_argument("-u", "--users", nargs='+', help="The users' userIDs.")
+	lookup.add_argument("-f", "--filters", nargs='+', help="Select users like showuser. Syntax - attribute:value1,value2,..")
+	parser.add_argument("-a", "--add", nargs='+', help="Tags to give every user.")
+	parser.add_argument("-r", "--remove", nargs='+', help="Tags to take from every user.")
+	parser.add_argument("-s", "--set", nargs='*', help="Give every user exactly these tags (none: remove all).")
+	parser.add_argument("-y", "--yes", action="store_true", help="Don't ask for confirmation.")
+	return parser
+
+def main(argv=None, prog=None):
+	parser = buildParser(prog)
+	args = parser.parse_args(argv)
+	if args.set is not None and (args.add or args.remove):
+		parser.error("-s/--set can't be combined with -a/--add or -r/--remove")
+	if args.set is None and not (args.add or args.remove):
+		parser.error("one of -a/--add, -r/--remove or -s/--set is required")
+	if args.users and not all(userID.isdigit() for userID in args.users):
+		parser.error("-u/--users takes userIDs")
+
+	filterDict = parseFilters(args.filters or [])
+	if filterDict is None:
+		return 1
+
+	try:
+		return retag(args.users, filterDict, args.add, args.remove, args.set, not args.yes)
+	except KeyboardInterrupt:
+		pass
+
+if __name__ == "__main__":
+	exit(main())
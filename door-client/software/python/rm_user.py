@@ -32,12 +32,18 @@ def rmUser(user=None):
 			backend.rmUser(user['userID'])
 			putMessage("User {:d}: '{:s} {:s}' has been deleted.".format(user['userID'], user['firstName'], user['lastName']), level=severity.WARNING)
 
-if __name__ == "__main__":
-	parser = argparse.ArgumentParser(description='Add a user to the MakeICT database.')
-	parser.add_argument("-u", "--user", help="The user's userID or e-mail address.")
-	args = parser.parse_args()
+def buildParser(prog=None):
+	parser = argparse.ArgumentParser(prog=prog, description='Add a user to the MakeICT database.')
+	parser.add_argument("-u", "--user", help="The user's userID, e-mail address or name.")
+	return parser
+
+def main(argv=None, prog=None):
+	args = buildParser(prog).parse_args(argv)
 
 	try:
 		rmUser(args.user)
 	except KeyboardInterrupt:
 		pass
+
+if __name__ == "__main__":
+	main()
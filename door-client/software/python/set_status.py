@@ -0,0 +1,70 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+MakeICT/Bluebird Arthouse Electronic Door Entry
+
+set_status.py: Changes the status of many users at once, in one transaction
+Usage: set_status.py STATUS (-u USERID [USERID ...] | -t TAG [TAG ...] | -f FILTER [FILTER ...]) [-y]
+
+Every user whose status changes gets an 'activate' or 'de-activate' log.
+
+Authors:
+	Dominic Canare <dom@greenlightgo.org>
+	Rye Kennedy <ryekennedy@gmail.com>
+	Christian Kindel <iceman81292@gmail.com>
+'''
+import argparse
+from backend import backend
+from cli_helper import *
+
+def setStatus(status, filters, confirm=True):
+	try:
+		if status not in backend.getValidStatuses():
+			raise ValueError("Invalid status '{:}'".format(status))
+		count = len(backend.getUserIDs(filters))
+	except ValueError as e:
+		putMessage(str(e), level=severity.ERROR)
+		return 1
+	if not count:
+		putMessage("No matching users", level=severity.WARNING)
+		return 1
+
+	putMessage("Set status to '{:s}' for {:d} user(s)".format(status, count), level=severity.WARNING)
+	if confirm and getInput("{'yes' to continue, anything else to exit}") != 'yes':
+		return 1
+
+	userIDs = backend.setStatus(status, filters)
+	putMessage("{:d} user(s) changed to '{:s}'".format(len(userIDs), status), level=severity.OK)
+
+def buildParser(prog=None):
+	parser = argparse.ArgumentParser(prog=prog, description='Change the status of many users in the MakeICT database.')
+	parser.add_argument("status", help="The new status.")
+	lookup = parser.add_mutually_exclusive_group(required=True)
+	lookup.add_argument("-u", "--users", nargs='+', help="The users' userIDs.")
+	lookup.add_argument("-t", "--tags", nargs='+', help="Select the users having all of these tags.")
+	lookup.add_argument("-f", "--filters", nargs='+', help="Select users like showuser. Syntax - attribute:value1,value2,..")
+	parser.add_argument("-y", "--yes", action="store_true", help="Don't ask for confirmation.")
+	return parser
+
+def main(argv=None, prog=None):
+	parser = buildParser(prog)
+	args = parser.parse_args(argv)
+	if args.users and not all(userID.isdigit() for userID in args.users):
+		parser.error("-u/--users takes userIDs")
+
+	if args.users:
+		filterDict = {'userID': args.users}
+	elif args.tags:
+		filterDict = {'tags': args.tags}
+	else:
+		filterDict = parseFilters(args.filters)
+		if filterDict is None:
+			return 1
+
+	try:
+		return setStatus(args.status, filterDict, not args.yes)
+	except KeyboardInterrupt:
+		pass
+
+if __name__ == "__main__":
+	exit(main())
@@ -4,7 +4,7 @@
 MakeICT/Bluebird Arthouse Electronic Door Entry
 
 show_logs.py: Prints logs from MakeICT database in a table.
-Usage: enroll.py [userID [rfid]]
+Usage: show_logs.py [-f FILTER ...] [-n LIMIT] [-s SINCE] [-F | -p]
 
 Authors:
 	Dominic Canare <dom@greenlightgo.org>
@@ -13,37 +13,143 @@ Authors:
 '''
 
 
-import subprocess, argparse, logging, logging.config
+import os, sys, time, socket, subprocess, argparse, logging, logging.config
 from backend import backend
-from prettytable import PrettyTable
+from log_notify import LogListener
 from cli_helper import *
 
-def showAllLogs(filters=None):
-	logs = backend.getLogs(filters)
-	if logs[0] == 1:
+fieldOrder = ['logID', 'timestamp', 'logType', 'userID', 'rfid', 'message']
+fieldWidths = [8, 10, 11, 6, 14, None]	# message takes the rest of the line
+pageSize = 40
+# --follow polls every followMinInterval seconds while logs keep coming,
+# backing off to followMaxInterval when the door is quiet. Once door-lock.py
+# notifications arrive, polls only back up lost ones.
+followMinInterval = 0.5
+followMaxInterval = 8.0
+followNotifiedInterval = 60.0
+
+def formatRow(values):
+	cells = []
+	for value, width in zip(values, fieldWidths):
+		value = '' if value is None else str(value)
+		cells.append(value if width is None else value[:width].ljust(width))
+	return '| ' + ' | '.join(cells)
+
+def printLogs(logs, out, lastID=None, pageRows=pageSize, header=True):
+	'''
+	Write logs to out as they arrive. The header goes before the first row
+	(if header is set) and again every pageRows rows (never, if pageRows is 0).
+
+	Returns:
+	  the highest logID written, or lastID if there were no logs
+	'''
+	title = formatRow(fieldOrder)
+	rule = '+' + '-' * (len(title) - 1)
+	for i, log in enumerate(logs):
+		if (i == 0 and header) or (pageRows and i and i % pageRows == 0):
+			out.write('\n'.join([rule, title, rule]) + '\n')
+		out.write(formatRow([log[field] for field in fieldOrder]) + '\n')
+		lastID = log['logID']
+	out.flush()
+	return lastID
+
+def showAllLogs(filters=None, since=None, limit=None, follow=False, pager=False):
+	'''
+	Print logs as they are read from the database, in logID order.
+
+	Args:
+	  filters (dict, optional): see backend.getLogs
+	  since (int, optional): only logs from this unix time on
+	  limit (int, optional): only the last `limit` matching logs
+	  follow (bool, optional): keep printing new logs until Ctrl+C
+	  pager (bool, optional): pipe the output through $PAGER (not with follow)
+	'''
+	try:
+		logs = backend.iterLogs(filters, since=since, limit=limit)
+	except ValueError:
 		putMessage('Invalid filter string', level=severity.ERROR)
-		return
-	else:
-	 	logs = logs[1]
-	fieldOrder = ['logID', 'timestamp', 'logType', 'userID', 'rfid', 'message']
-#	fieldColored = [colors.HEADER + field + colors.ENDC for field in fieldOrder]
-	fieldColored = fieldOrder
+		return 1
 
-	logTable = PrettyTable(fieldColored)
+	if pager and not follow:
+		pagerProcess = subprocess.Popen(os.environ.get('PAGER', 'less -S'), shell=True,
+						stdin=subprocess.PIPE)
+		out = pagerProcess.stdin
+	else:
+		pagerProcess = None
+		out = sys.stdout
+	try:
+		lastID = printLogs(logs, out, pageRows=(pageSize if out.isatty() else 0))
+	except IOError:
+		# the pager (or the pipe we print to) was closed before the end;
+		# nobody reads any more, so don't follow either
+		return
+	finally:
+		logs.close()
+		if pagerProcess:
+			pagerProcess.stdin.close()
+			pagerProcess.wait()
 
-	for log in logs:
-		logTable.add_row([log[field] for field in fieldOrder])
+	if follow:
+		followLogs(filters, since, lastID, out)
 
-	print logTable				
-#	subprocess.call(['echo', "'{:}'".format(logTable.get_string(), '|', 'less', '-r'])
+def followLogs(filters, since, lastID, out):
+	'''
+	Print logs newer than lastID as they are written, until Ctrl+C. Each
+	poll reads only logID > lastID, on the primary key.
+	'''
+	try:
+		listener = LogListener()
+	except (OSError, IOError, socket.error) as e:
+		putMessage("No door-lock notifications ({:}); polling".format(e), level=severity.WARNING)
+		listener = None
+	interval = followMinInterval
+	try:
+		while True:
+			if listener:
+				listener.wait(interval)
+			else:
+				time.sleep(interval)
+			logs = backend.iterLogs(filters, since=since, afterID=lastID)
+			try:
+				newID = printLogs(logs, out, lastID, pageRows=0, header=(lastID is None))
+			finally:
+				logs.close()
+			if newID != lastID:
+				interval = followMinInterval
+			else:
+				longest = followNotifiedInterval if listener and listener.heard else followMaxInterval
+				interval = min(interval * 2, longest)
+			lastID = newID
+	finally:
+		if listener:
+			listener.close()
 
-if __name__ == 	"__main__":
-	parser = argparse.ArgumentParser(description='Show a user from the MakeICT database.')
+def buildParser(prog=None):
+	parser = argparse.ArgumentParser(prog=prog, description='Show logs from the MakeICT database.')
 	#@TODO: incorporate filter syntax into help usage
 	parser.add_argument("-f", "--filters", nargs='+', help="Filter results. Syntax - attribute:value1,value2,..")
-	args = parser.parse_args()
+	parser.add_argument("-n", "--limit", type=int, help="Show only the last LIMIT matching logs.")
+	parser.add_argument("-s", "--since", help="Show logs from this time on: 'YYYY-MM-DD [HH:MM[:SS]]' or an age like 30m, 12h, 7d.")
+	output = parser.add_mutually_exclusive_group()
+	output.add_argument("-F", "--follow", action='store_true', help="Keep showing new logs as they are written.")
+	output.add_argument("-p", "--pager", action='store_true', help="Page the output through $PAGER (default: less -S).")
+	return parser
+
+def main(argv=None, prog=None):
+	parser = buildParser(prog)
+	args = parser.parse_args(argv)
+	since = None
+	if args.since:
+		try:
+			since = parseTime(args.since)
+		except ValueError as e:
+			parser.error(str(e))
 
 	try:
-		showAllLogs(parseFilters(args.filters) if args.filters else None)
+		return showAllLogs(parseFilters(args.filters) if args.filters else None,
+				   since, args.limit, args.follow, args.pager)
 	except KeyboardInterrupt:
 		pass
+
+if __name__ == 	"__main__":
+	exit(main())
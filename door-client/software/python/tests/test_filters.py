@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+
+import unittest
+
+import sys
+sys.path.append(sys.path[0] + "/../")
+
+import database_cli
+import show_logs
+from backend import MySQLBackend
+
+class FilterBackend(MySQLBackend):
+    '''The filter translation of MySQLBackend, without a database'''
+    def __init__(self):
+        pass
+
+    def getColumnNames(self, table):
+        return show_logs.fieldOrder
+
+class FilterCLI(database_cli.DatabaseCLI):
+    '''The shell's completion, without a terminal or history file'''
+    def __init__(self):
+        pass
+
+class FilterCompletionTest(unittest.TestCase):
+    def setUp(self):
+        self.cli = FilterCLI()
+        self.backend = FilterBackend()
+        self.filterSQL = {'userFilter': self.backend.userFilterSQL, 'logFilter': self.backend.logFilterSQL}
+
+    def offered(self, command):
+        kinds = set(kind for fields in database_cli.completions[command].values()
+                    for kind in fields if kind in database_cli.filterFields)
+        self.assertEqual(len(kinds), 1, command)
+        kind = kinds.pop()
+        fields = self.cli.completeFilter(database_cli.filterFields[kind], '')
+        self.assertTrue(fields, command)
+        return kind, [field.rstrip(':') for field in fields]
+
+    def testCompletedFiltersAccepted(self):
+        print "Every filter attribute a command completes should be accepted by its backend filter"
+        for command in ('showuser', 'showlogs', 'retag', 'setstatus'):
+            kind, fields = self.offered(command)
+            for field in fields:
+                self.filterSQL[kind]({field: '1'})
+
+    def testUserFieldsNotOfferedForLogs(self):
+        print "showlogs should not complete user attributes, nor showuser log columns"
+        self.assertEqual(self.offered('showlogs')[1], sorted(show_logs.fieldOrder))
+        self.assertNotIn('rfid', self.offered('showuser')[1])
+        self.assertRaises(ValueError, self.backend.logFilterSQL, {'email': 'a@b.c'})
+        self.assertRaises(ValueError, self.backend.userFilterSQL, {'rfid': '1'})
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(FilterCompletionTest)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -17,7 +17,6 @@ Authors:
 import os
 import signal, time, subprocess, argparse, logging, logging.config
 from backend import backend
-from prettytable import PrettyTable
 from cli_helper import *
 from get_user import getUser
 
@@ -40,17 +39,23 @@ def unenroll(user=None, nfcID=None, quiet=False, reader=False):
 			backend.unenroll(user['userID'], rfid)
 			putMessage("Key un-enrolled", level=severity.OK)
 
-if __name__ == "__main__":
-	parser = argparse.ArgumentParser(description='Remove an NFC ID from a user in the MakeICT database.')
-	parser.add_argument("-u", "--user", help="The user's userID or e-mail.", type=int)
+def buildParser(prog=None):
+	parser = argparse.ArgumentParser(prog=prog, description='Remove an NFC ID from a user in the MakeICT database.')
+	parser.add_argument("-u", "--user", help="The user's userID, e-mail address or name.")
 #	parser.add_argument("-q", "--quiet", help="Suppress prompts and output", action="store_true")
 	method = parser.add_mutually_exclusive_group()
 	method.add_argument("-n", "--nfcid", help="UID of the user's NFC card.")
 #	method.add_argument("-r", "--reader", help="Read a card UID from the card reader", action="store_true")
-	args = parser.parse_args()
+	return parser
+
+def main(argv=None, prog=None):
+	args = buildParser(prog).parse_args(argv)
 
 	try:
 #		unenroll(args.user, args.nfcid, args.quiet, args.reader)
 		unenroll(args.user, args.nfcid)
 	except KeyboardInterrupt:
 		pass
+
+if __name__ == "__main__":
+	main()
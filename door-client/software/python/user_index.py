@@ -0,0 +1,279 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+MakeICT/Bluebird Arthouse Electronic Door Entry
+
+user_index.py: In-memory indexes of users, tags and NFC keys: prefixes for
+completion in the CLI, and trigrams for fuzzy search by name or e-mail
+
+The index is read from the backend once, on first use. After that, users
+changed through the same backend (see MySQLBackend.userChanged) are re-read
+one by one, and users added by other programs are picked up by a query on
+userID > the highest one seen, at most every refreshInterval seconds.
+
+Authors:
+	Dominic Canare <dom@greenlightgo.org>
+	Rye Kennedy <ryekennedy@gmail.com>
+	Christian Kindel <iceman81292@gmail.com>
+'''
+
+import time, math
+from bisect import bisect_left
+from backend import backend
+
+class PrefixIndex(object):
+	'''
+	A sorted list of (lower case text, text) with bisect lookups. Texts are
+	reference counted, so a name shared by two users stays in the index
+	until both are removed.
+	'''
+	def __init__(self):
+		self.entries = []
+		self.counts = {}
+
+	def __len__(self):
+		return len(self.entries)
+
+	def load(self, texts):
+		self.counts = {}
+		for text in texts:
+			self.counts[text] = self.counts.get(text, 0) + 1
+		self.entries = sorted((text.lower(), text) for text in self.counts)
+
+	def add(self, text):
+		if text in self.counts:
+			self.counts[text] += 1
+			return
+		self.counts[text] = 1
+		entry = (text.lower(), text)
+		self.entries.insert(bisect_left(self.entries, entry), entry)
+
+	def remove(self, text):
+		if text not in self.counts:
+			return
+		self.counts[text] -= 1
+		if self.counts[text]:
+			return
+		del self.counts[text]
+		entry = (text.lower(), text)
+		i = bisect_left(self.entries, entry)
+		if i < len(self.entries) and self.entries[i] == entry:
+			del self.entries[i]
+
+	def complete(self, prefix, limit=None):
+		'''
+		Returns:
+		  the texts starting with prefix (ignoring case), in order, at most
+		  limit of them
+		'''
+		prefix = prefix.lower()
+		matches = []
+		i = bisect_left(self.entries, (prefix,))
+		while i < len(self.entries) and self.entries[i][0].startswith(prefix):
+			matches.append(self.entries[i][1])
+			if limit and len(matches) >= limit:
+				break
+			i += 1
+		return matches
+
+def trigrams(text):
+	'''
+	Returns:
+	  the set of lower case three letter sequences in text, padded so that
+	  words of one or two letters (and word starts) have trigrams too
+	'''
+	grams = set()
+	for word in text.lower().replace('@', ' ').replace('.', ' ').split():
+		word = '  ' + word + ' '
+		for i in range(len(word) - 2):
+			grams.add(word[i:i + 3])
+	return grams
+
+class TrigramIndex(object):
+	'''
+	Fuzzy matching of short texts. Every text is filed under each of its
+	trigrams; a query scores the texts sharing trigrams with it by their
+	Jaccard similarity |common| / |query + text trigrams|.
+	'''
+	def __init__(self):
+		self.postings = {}	# trigram -> set of keys
+		self.sizes = {}		# key -> number of trigrams of its text
+
+	def add(self, key, text):
+		grams = trigrams(text)
+		if not grams:
+			return
+		self.sizes[key] = len(grams)
+		for gram in grams:
+			self.postings.setdefault(gram, set()).add(key)
+
+	def remove(self, key, text):
+		if self.sizes.pop(key, None) is None:
+			return
+		for gram in trigrams(text):
+			keys = self.postings.get(gram)
+			if keys:
+				keys.discard(key)
+				if not keys:
+					del self.postings[gram]
+
+	def search(self, text, minScore=0.0):
+		'''
+		Returns:
+		  dict of key -> similarity (0 to 1) for the texts sharing a trigram
+		  with text, leaving out some of those scoring below minScore
+		'''
+		grams = sorted(trigrams(text), key=lambda gram: len(self.postings.get(gram, ())))
+		if not grams:
+			return {}
+		# a text scoring minScore shares at least minScore * len(grams) of the
+		# trigrams, so it is filed under one of the rarest ones left after
+		# dropping that many (prefix filtering): only those are candidates
+		needed = max(1, int(math.ceil(minScore * len(grams))))
+		candidates = set()
+		for gram in grams[:len(grams) - needed + 1]:
+			candidates.update(self.postings.get(gram, ()))
+		postings = [self.postings.get(gram, ()) for gram in grams]
+		scores = {}
+		for key in candidates:
+			shared = sum(1 for keys in postings if key in keys)
+			scores[key] = float(shared) / (len(grams) + self.sizes[key] - shared)
+		return scores
+
+class UserIndex(object):
+	'''
+	Prefix indexes of users' e-mails, names, userIDs and NFC keys, and of the
+	configured tags and statuses, and a trigram index of names and e-mails
+	'''
+	fields = ['email', 'name', 'userID', 'rfid', 'tag', 'status']
+	refreshInterval = 30.0
+
+	def __init__(self, backend):
+		self.backend = backend
+		self.indexes = dict((field, PrefixIndex()) for field in self.fields)
+		self.users = {}		# userID -> {field: [texts]}
+		self.people = {}	# userID -> (first name, last name, e-mail)
+		self.fuzzy = TrigramIndex()
+		self.lastID = 0
+		self.loaded = None
+
+	def userKeys(self, user):
+		names = [user.get('firstName'), user.get('lastName')]
+		names = [name for name in names if name]
+		if len(names) == 2:
+			names.append(' '.join(names))
+		return {
+			'email': [user['email']] if user.get('email') else [],
+			'name': names,
+			'userID': [str(user['userID'])],
+			'rfid': list(user.get('rfids') or []),
+		}
+
+	def load(self):
+		'''Read every user and tag from the backend'''
+		users = {}
+		self.people = {}
+		self.fuzzy = TrigramIndex()
+		for user in self.backend.iterUsers():
+			users[user['userID']] = self.userKeys(user)
+			self.addPerson(user)
+		self.users = users
+		for field in self.fields:
+			if field not in ('tag', 'status'):
+				self.indexes[field].load(text for keys in users.itervalues() for text in keys[field])
+		self.loadSettings()
+		self.lastID = max(users) if users else 0
+		self.backend.takeChangedUsers()
+		self.loaded = time.time()
+
+	def loadSettings(self):
+		self.indexes['tag'].load(self.backend.getValidTags())
+		self.indexes['status'].load(self.backend.getValidStatuses())
+
+	def addPerson(self, user):
+		person = (user.get('firstName') or '', user.get('lastName') or '', user.get('email') or '')
+		self.people[user['userID']] = person
+		for i, text in enumerate(self.searchTexts(person)):
+			self.fuzzy.add((user['userID'], i), text)
+
+	def searchTexts(self, person):
+		'''The texts a user is found by: the full name and the e-mail'''
+		return ['{:s} {:s}'.format(person[0], person[1]), person[2]]
+
+	def addUser(self, user):
+		self.removeUser(user['userID'])
+		keys = self.userKeys(user)
+		self.users[user['userID']] = keys
+		for field, texts in keys.items():
+			for text in texts:
+				self.indexes[field].add(text)
+		self.addPerson(user)
+		self.lastID = max(self.lastID, user['userID'])
+
+	def removeUser(self, userID):
+		keys = self.users.pop(userID, None)
+		if keys:
+			for field, texts in keys.items():
+				for text in texts:
+					self.indexes[field].remove(text)
+		person = self.people.pop(userID, None)
+		if person:
+			for i, text in enumerate(self.searchTexts(person)):
+				self.fuzzy.remove((userID, i), text)
+
+	def refresh(self, force=False):
+		'''
+		Load the index on first use; afterwards re-read the users changed
+		through the backend and, every refreshInterval seconds (or if
+		force is set), the users added since the last refresh.
+		'''
+		if self.loaded is None:
+			self.load()
+			return
+		changed = sorted(self.backend.takeChangedUsers())
+		if changed:
+			for userID in changed:
+				self.removeUser(userID)
+			for user in self.backend.iterUsers(userIDs=changed):
+				self.addUser(user)
+		if force or time.time() - self.loaded > self.refreshInterval:
+			for user in self.backend.iterUsers(afterID=self.lastID):
+				self.addUser(user)
+			self.loadSettings()
+			self.loaded = time.time()
+
+	def complete(self, field, prefix, limit=100):
+		'''
+		Args:
+		  field (string): 'email', 'name', 'userID', 'rfid', 'tag' or 'status'
+		  prefix (string): the text typed so far
+		  limit (int, optional): maximum number of completions, default=100
+		Returns:
+		  the indexed texts of that field starting with prefix
+		'''
+		self.refresh()
+		return self.indexes[field].complete(prefix, limit)
+
+	def search(self, query, limit=10, minScore=0.2):
+		'''
+		Fuzzy search of users by name and e-mail, tolerant of typos, missing
+		letters and word order.
+
+		Args:
+		  query (string): (part of) a name or e-mail
+		  limit (int, optional): maximum number of results, default=10
+		  minScore (float, optional): ignore matches scoring lower, default=0.2
+		Returns:
+		  list of (score, userID, first name, last name, e-mail), best first
+		'''
+		self.refresh()
+		best = {}
+		for (userID, i), score in self.fuzzy.search(query, minScore).iteritems():
+			if score > best.get(userID, 0):
+				best[userID] = score
+		ranked = sorted(((score, userID) for userID, score in best.iteritems() if score >= minScore),
+				key=lambda match: (-match[0], match[1]))
+		return [(score, userID) + self.people[userID] for score, userID in ranked[:limit]]
+
+# shared by the CLI and the scripts; loaded on first use
+userIndex = UserIndex(backend)
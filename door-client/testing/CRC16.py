@@ -22,19 +22,23 @@ class CRC16(object):
 
     def calculate(self, string = ''):
         try:
-            if not isinstance(string, str): raise Exception("Please provide a string as argument for calculation.")
+            if not isinstance(string, (str, bytearray, memoryview)): raise Exception("Please provide a string or bytearray as argument for calculation.")
             if not string: return 0
 
             crcValue = 0x0000 if not self.mdflag else 0xffff
-
-            for c in string:
-                tmp = crcValue ^ ord(c)
-                crcValue = (c_ushort(crcValue >> 8).value) ^ int(self.crc16_tab[(tmp & 0x00ff)], 0)
-            return crcValue
+            return self.update(crcValue, string)
         except Exception, e:
             print "EXCEPTION(calculate): {}".format(e)
 
 
+    def update(self, crcValue, data):
+        '''Continue a running CRC over data (a str, bytearray or list of byte values)'''
+        tab = self.crc16_tab
+        for b in bytearray(data):
+            crcValue = (crcValue >> 8) ^ tab[(crcValue ^ b) & 0x00ff]
+        return crcValue
+
+
     def init_crc16(self):
         '''The algorithm use tables with precalculated values'''
         for i in range(0, 256):
@@ -42,5 +46,5 @@ class CRC16(object):
             for j in range(0, 8):
                 if (crc & 0x0001):  crc = c_ushort(crc >> 1).value ^ self.crc16_constant
                 else:               crc = c_ushort(crc >> 1).value
-            self.crc16_tab.append(hex(crc))
+            self.crc16_tab.append(crc)
 
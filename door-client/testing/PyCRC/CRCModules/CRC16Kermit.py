@@ -5,47 +5,29 @@
 # 
 # Cristian NAVALICI cristian.navalici at gmail dot com
 
-from ctypes import c_ushort
+from CRCEngine import CRCEngine, PRESETS
 
-class CRC16Kermit(object):
-    crc16kermit_tab = []
 
+class CRC16Kermit(CRCEngine):
     # The CRC's are computed using polynomials. Here is the most used coefficient for CRC16 SICK
-    crc16Kermit_constant = 0x8408
+    crc16Kermit_constant = 0x8408 # (0x1021 reflected)
 
     def __init__(self):
-        if not len(self.crc16kermit_tab): self.init_crc16kermit() # initialize the precalculated tables
+        CRCEngine.__init__(self, **PRESETS['CRC-16/KERMIT'])
+        self.crc16kermit_tab = self.table
 
 
     def calculate(self, string = ''):
         try:
-            if not isinstance(string, str): raise Exception("Please provide a string as argument for calculation.")
             if not string: return 0
-
-            crcValue = 0x0000
-
-            for c in string:
-                tmp = crcValue ^ ord(c)
-                crcValue = c_ushort(crcValue >> 8).value ^ int(self.crc16kermit_tab[(tmp & 0x00ff)], 0)
-
-            # After processing, the one's complement of the CRC is calcluated and the 
-            # two bytes of the CRC are swapped.
-            low_byte   = (crcValue & 0xff00) >> 8
-            high_byte  = (crcValue & 0x00ff) << 8
-            crcValue   = low_byte | high_byte
-
-            return crcValue
+            return CRCEngine.calculate(self, string)
         except Exception, e:
             print "EXCEPTION(calculate): {}".format(e)
 
 
-    def init_crc16kermit(self):
-        '''The algorithm use tables with precalculated values'''
-        for i in range(0, 256):
-            crc = c_ushort(i).value
-            for j in range(0, 8):
-                if (crc & 0x0001):  crc = c_ushort(crc >> 1).value ^ self.crc16Kermit_constant
-                else:               crc = c_ushort(crc >> 1).value
-            self.crc16kermit_tab.append(hex(crc))
-        
-
+    def _finish(self, crcValue):
+        # After processing, the two bytes of the CRC are swapped.
+        crcValue = CRCEngine._finish(self, crcValue)
+        low_byte   = (crcValue & 0xff00) >> 8
+        high_byte  = (crcValue & 0x00ff) << 8
+        return low_byte | high_byte
@@ -6,43 +6,60 @@
 # Cristian NAVALICI cristian.navalici at gmail dot com
 #
 
-from ctypes import c_ushort
 
 class CRC16SICK(object):
     # The CRC's are computed using polynomials. Here is the most used coefficient for CRC16 SICK
     crc16SICK_constant = 0x8005
 
     def __init__(self):
-        pass
+        self.reset()
 
 
     def calculate(self, string = ''):
         try:
-            if not isinstance(string, str): raise Exception("Please provide a string as argument for calculation.")
+            if not isinstance(string, (str, bytearray, memoryview)): raise Exception("Please provide a string, bytearray or memoryview as argument for calculation.")
             if not string: return 0
-            crcValue = 0x0000
 
-            for idx, c in enumerate(string):
-                short_c  =  0x00ff & ord(c)
+            return self._finish(self._update(0x0000, 0, string)[0])
+        except Exception, e:
+            print "EXCEPTION(calculate): {}".format(e)
 
-                idx_previous = idx - 1
-                prev_c = 0 if idx_previous == -1 else ord(string[idx_previous])
-                short_p  = ( 0x00ff & prev_c) << 8;
 
-                if ( crcValue & 0x8000 ):   crcValue = c_ushort(crcValue << 1).value ^ self.crc16SICK_constant
-                else:                       crcValue = c_ushort(crcValue << 1).value
+    def reset(self):
+        '''Start a new incremental calculation'''
+        self.crcValue = 0x0000
+        self.prev_c = 0
 
-                crcValue &= 0xffff
-                crcValue ^= ( short_c | short_p )
 
-            # After processing, the one's complement of the CRC is calcluated and the 
-            # two bytes of the CRC are swapped.
-            low_byte   = (crcValue & 0xff00) >> 8
-            high_byte  = (crcValue & 0x00ff) << 8
-            crcValue   = low_byte | high_byte;
+    def update(self, data):
+        '''Feed the next chunk of a stream; str, bytearray and memoryview are accepted'''
+        if not isinstance(data, (str, bytearray, memoryview)): raise TypeError("Please provide a string, bytearray or memoryview as argument for update.")
+        self.crcValue, self.prev_c = self._update(self.crcValue, self.prev_c, data)
+        return self
 
-            return crcValue
-        except Exception, e:
-            print "EXCEPTION(calculate): {}".format(e)
+
+    def digest(self):
+        '''CRC of everything passed to update() since the last reset()'''
+        return self._finish(self.crcValue)
+
+
+    def _update(self, crcValue, prev_c, data):
+        # SICK mixes each byte with the one before it, so that byte is
+        # carried between chunks along with the CRC
+        if not isinstance(data, bytearray): data = bytearray(data)
+        constant = self.crc16SICK_constant
+        for c in data:
+            if ( crcValue & 0x8000 ):   crcValue = ((crcValue << 1) & 0xffff) ^ constant
+            else:                       crcValue = (crcValue << 1) & 0xffff
+
+            crcValue ^= ( c | (prev_c << 8) )
+            prev_c = c
+        return crcValue, prev_c
 
 
+    def _finish(self, crcValue):
+        # After processing, the one's complement of the CRC is calcluated and the 
+        # two bytes of the CRC are swapped.
+        low_byte   = (crcValue & 0xff00) >> 8
+        high_byte  = (crcValue & 0x00ff) << 8
+        return low_byte | high_byte
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+
+# CRC BATCH MODULE
+#
+# CRCs of many frames at once, e.g. to verify a capture of thousands of
+# DoorControl frames. With NumPy the frames are processed byte column by
+# byte column: one vectorized table lookup per column updates the CRC of
+# every frame that is still that long. Frames are sorted longest first, so
+# the frames still active at any column are a prefix of the batch.
+#
+# Without NumPy the same API falls back to one calculate() per frame and
+# returns lists instead of arrays.
+#
+# Frames can be given as
+#   - a 2-D uint8 array, one frame per row (with `lengths` if rows are padded)
+#   - a flat buffer plus `offsets`: frame i is buffer[offsets[i]:offsets[i + 1]]
+#   - a list of str/bytearray
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from CRCEngine import CRCEngine
+
+
+def calculate_batch(crc, frames, offsets=None, lengths=None):
+    '''
+    Args:
+      crc: a CRC object (CRCEngine or one of the CRC classes)
+      frames, offsets, lengths: the frames, in one of the layouts above
+    Returns:
+      the CRC of every frame, in order
+    '''
+    if numpy is None or not isinstance(crc, CRCEngine):
+        return [crc.calculate(frame) for frame in split_frames(frames, offsets, lengths)]
+    layout = Layout(frames, offsets, lengths)
+    return layout.run(crc, layout.lengths)
+
+
+def verify_batch(crc, frames, offsets=None, lengths=None, expected=None):
+    '''
+    Check many frames at once.
+
+    Args:
+      expected: the CRC each frame should have. By default every frame ends
+        with its CRC, high byte first (as DoorControl sends it), and the CRC
+        is computed over the rest of the frame.
+    Returns:
+      (crcs, failed): the computed CRCs and a mask that is True for frames
+      whose CRC does not match (or that are too short to hold one)
+    '''
+    size = crc.width // 8 if isinstance(crc, CRCEngine) else 2
+    if numpy is None or not isinstance(crc, CRCEngine):
+        crcs, failed = [], []
+        for i, frame in enumerate(split_frames(frames, offsets, lengths)):
+            frame = bytearray(frame)
+            if expected is None:
+                body, tail = frame[:-size], frame[-size:]
+                value = crc.calculate(body)
+                crcs.append(value)
+                failed.append(len(frame) < size or value != trailer(tail))
+            else:
+                value = crc.calculate(frame)
+                crcs.append(value)
+                failed.append(value != expected[i])
+        return crcs, failed
+
+    layout = Layout(frames, offsets, lengths)
+    if expected is not None:
+        crcs = layout.run(crc, layout.lengths)
+        return crcs, crcs != numpy.asarray(expected, dtype=numpy.int64)
+
+    body = numpy.maximum(layout.lengths - size, 0)
+    crcs = layout.run(crc, body)
+    stored = numpy.zeros(len(body), dtype=numpy.int64)
+    for i in range(size):
+        stored = (stored << 8) | layout.byte_at(numpy.minimum(body + i, numpy.maximum(layout.lengths - 1, 0)))
+    return crcs, (layout.lengths < size) | (crcs != stored)
+
+
+def trailer(tail):
+    value = 0
+    for c in tail:
+        value = (value << 8) | c
+    return value
+
+
+def split_frames(frames, offsets=None, lengths=None):
+    '''The frames of any supported layout, one by one'''
+    if offsets is not None:
+        buf = bytearray(frames)
+        return [buf[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+    if lengths is not None:
+        return [bytearray(frame[:length]) for frame, length in zip(frames, lengths)]
+    if numpy is not None and isinstance(frames, numpy.ndarray):
+        return [bytearray(row.tostring()) for row in frames]
+    return [bytearray(frame) for frame in frames]
+
+
+class Layout(object):
+    '''Frames as rows of a 2-D array, or as (start, length) pairs into a flat buffer'''
+    def __init__(self, frames, offsets=None, lengths=None):
+        if offsets is not None:
+            self.rows = None
+            if isinstance(frames, numpy.ndarray):
+                self.buf = frames.ravel().astype(numpy.uint8, copy=False)
+            else:
+                if not isinstance(frames, (str, bytearray)):
+                    frames = bytearray(frames)      # buffer() takes no memoryview
+                self.buf = numpy.frombuffer(buffer(frames), dtype=numpy.uint8)
+            offsets = numpy.asarray(offsets, dtype=numpy.int64)
+            self.starts = offsets[:-1]
+            self.lengths = offsets[1:] - offsets[:-1]
+        elif isinstance(frames, numpy.ndarray) and frames.ndim == 2:
+            self.rows = frames.astype(numpy.uint8, copy=False)
+            self.lengths = numpy.asarray(lengths, dtype=numpy.int64) if lengths is not None \
+                else numpy.full(frames.shape[0], frames.shape[1], dtype=numpy.int64)
+        else:
+            # not str(): that gives '<memory at 0x...>' for a memoryview
+            frames = [frame if isinstance(frame, str) else bytes(bytearray(frame)) for frame in frames]
+            self.rows = None
+            self.buf = numpy.frombuffer(''.join(frames), dtype=numpy.uint8)
+            self.lengths = numpy.array([len(frame) for frame in frames], dtype=numpy.int64)
+            self.starts = numpy.concatenate(([0], numpy.cumsum(self.lengths)[:-1])).astype(numpy.int64)
+
+    def byte_at(self, positions):
+        '''The byte at `positions[i]` within every frame i'''
+        if self.rows is not None:
+            return self.rows[numpy.arange(len(positions)), positions].astype(numpy.int64)
+        # frames too short to hold a CRC may point past the end of the buffer
+        index = numpy.minimum(self.starts + positions, max(len(self.buf) - 1, 0))
+        return self.buf[index].astype(numpy.int64)
+
+    def run(self, crc, lengths):
+        '''CRC of the first lengths[i] bytes of every frame'''
+        count = len(lengths)
+        if count == 0:
+            return numpy.zeros(0, dtype=numpy.int64)
+        order = numpy.argsort(-lengths, kind='mergesort')
+        longest = int(lengths[order[0]])
+        # active[c]: number of frames (in sorted order) longer than c
+        active = numpy.searchsorted(-lengths[order], -numpy.arange(longest), side='left')
+        if self.rows is not None:
+            rows = self.rows[order]
+            column = lambda c, k: rows[:k, c]
+        else:
+            starts = self.starts[order]
+            buf = self.buf
+            column = lambda c, k: buf[starts[:k] + c]
+
+        table = numpy.asarray(crc.table, dtype=numpy.int64)
+        values = numpy.full(count, crc.start, dtype=numpy.int64)
+        if crc.refin:
+            for c in xrange(longest):
+                k = active[c]
+                v = values[:k]
+                values[:k] = (v >> 8) ^ table[(v ^ column(c, k)) & 0xff]
+        else:
+            shift = crc.width - 8
+            mask = crc.mask
+            for c in xrange(longest):
+                k = active[c]
+                v = values[:k]
+                values[:k] = ((v << 8) & mask) ^ table[((v >> shift) ^ column(c, k)) & 0xff]
+
+        result = numpy.empty(count, dtype=numpy.int64)
+        result[order] = crc._finish(values)
+        # the CRC classes return 0 for empty input, not the engine's CRC
+        empty = lengths == 0
+        if empty.any():
+            result[empty] = crc.calculate(bytearray())
+        return result
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+
+# CRC ENGINE
+#
+# One table-driven implementation for every CRC described by the Rocksoft
+# model (width, poly, init, refin, refout, xorout), plus a registry of the
+# named presets the other CRC modules are built on.
+#
+# The lookup table for a (width, poly, refin) combination is generated the
+# first time an engine needs it and shared by every engine after that.
+#
+# Each engine picks the fastest kernel for its parameters:
+#   zlib    CRC-32 polynomial, handed to zlib.crc32
+#   hqx     non-reflected 0x1021 (the CCITT family), handed to binascii.crc_hqx
+#   slice4  other reflected CRCs: 4 bytes per step through 4 tables
+#   slice8  as slice4, 8 bytes per step; in CPython the extra lookups cost
+#           about what the saved iterations do, so it is not the default
+#   table   one byte per step (non-reflected CRCs)
+# Inputs shorter than SLICE_MIN bytes always use the byte table, where the
+# setup of the wider kernels costs more than it saves.
+
+import binascii, struct, zlib
+from array import array
+
+# name: (width, poly, init, refin, refout, xorout)
+PRESETS = {
+    'CRC-16':           dict(width=16, poly=0x8005, init=0x0000, refin=True,  refout=True,  xorout=0x0000),
+    'CRC-16/MODBUS':    dict(width=16, poly=0x8005, init=0xFFFF, refin=True,  refout=True,  xorout=0x0000),
+    'CRC-CCITT/XMODEM': dict(width=16, poly=0x1021, init=0x0000, refin=False, refout=False, xorout=0x0000),
+    'CRC-CCITT/FFFF':   dict(width=16, poly=0x1021, init=0xFFFF, refin=False, refout=False, xorout=0x0000),
+    'CRC-CCITT/1D0F':   dict(width=16, poly=0x1021, init=0x1D0F, refin=False, refout=False, xorout=0x0000),
+    'CRC-16/DNP':       dict(width=16, poly=0x3D65, init=0x0000, refin=True,  refout=True,  xorout=0xFFFF),
+    'CRC-16/KERMIT':    dict(width=16, poly=0x1021, init=0x0000, refin=True,  refout=True,  xorout=0x0000),
+    'CRC-32':           dict(width=32, poly=0x04C11DB7, init=0xFFFFFFFF, refin=True, refout=True, xorout=0xFFFFFFFF),
+}
+
+# CRC16 (SICK) mixes in the previous byte and does not fit the Rocksoft
+# model, so its preset is the class that implements it
+CUSTOM = {
+    'CRC-16/SICK': ('CRC16SICK', 'CRC16SICK'),
+}
+
+KERNELS = ('table', 'slice4', 'slice8', 'zlib', 'hqx')
+SLICE_MIN = 16
+
+_tables = {}
+_slice_tables = {}
+
+
+def reflect(value, width):
+    '''Mirror the lowest `width` bits of value'''
+    # written with shifts and masks only so it also works on NumPy arrays
+    result = 0
+    for i in range(width):
+        result |= ((value >> i) & 1) << (width - 1 - i)
+    return result
+
+
+def table_typecode(width):
+    if width <= 16:
+        return 'H'
+    # Python 2 returns 'I' items as longs, which slows every lookup down;
+    # a 64 bit signed 'l' holds the 32 bit entries as plain ints
+    return 'l' if array('l').itemsize >= 8 else 'I'
+
+
+def make_table(width, poly, refin):
+    '''The algorithm use tables with precalculated values; memoized per parameter set'''
+    key = (width, poly, refin)
+    tab = _tables.get(key)
+    if tab is not None:
+        return tab
+
+    mask = (1 << width) - 1
+    tab = array(table_typecode(width))
+    if refin:
+        rpoly = reflect(poly, width)
+        for i in range(0, 256):
+            crc = i
+            for j in range(0, 8):
+                if (crc & 1):   crc = (crc >> 1) ^ rpoly
+                else:           crc = crc >> 1
+            tab.append(crc)
+    else:
+        top = 1 << (width - 1)
+        for i in range(0, 256):
+            crc = i << (width - 8)
+            for j in range(0, 8):
+                if (crc & top): crc = ((crc << 1) & mask) ^ poly
+                else:           crc = (crc << 1) & mask
+            tab.append(crc)
+    _tables[key] = tab
+    return tab
+
+
+def make_slice_tables(width, poly, n):
+    '''
+    Tables for a reflected CRC consuming n bytes per step: tables[k][b] is
+    the register after byte b followed by k zero bytes
+    '''
+    key = (width, poly, n)
+    tables = _slice_tables.get(key)
+    if tables is not None:
+        return tables
+
+    # plain lists: indexing them is the cheapest lookup CPython has
+    tab = list(make_table(width, poly, True))
+    tables = [tab]
+    for k in range(1, n):
+        tables.append([(crc >> 8) ^ tab[crc & 0xff] for crc in tables[-1]])
+    _slice_tables[key] = tables
+    return tables
+
+
+def select_kernel(width, poly, refin):
+    if width == 32 and poly == 0x04C11DB7 and refin:
+        return 'zlib'
+    if width == 16 and poly == 0x1021 and not refin:
+        return 'hqx'
+    if refin:
+        return 'slice4'
+    return 'table'
+
+
+def check_data(data):
+    if not isinstance(data, (str, bytearray, memoryview)):
+        raise TypeError("Please provide a string, bytearray or memoryview as argument for calculation.")
+
+
+class CRCEngine(object):
+    def __init__(self, width, poly, init=0, refin=False, refout=False, xorout=0, kernel=None):
+        '''
+        kernel forces one of KERNELS instead of the fastest one for the
+        parameters (for benchmarking and cross-checking)
+        '''
+        if width < 8 or width > 32 or width % 8:
+            raise ValueError("Only 8, 16, 24 and 32 bit CRCs are supported")
+        self.width = width
+        self.poly = poly
+        self.init = init
+        self.refin = refin
+        self.refout = refout
+        self.xorout = xorout
+        self.mask = (1 << width) - 1
+        self.table = make_table(width, poly, refin)
+        # the reflected algorithm runs on a mirrored register
+        self.start = reflect(init, width) if refin else init
+        self.set_kernel(kernel or select_kernel(width, poly, refin))
+        self.reset()
+
+
+    def set_kernel(self, kernel):
+        if kernel not in KERNELS:
+            raise ValueError("Unknown kernel '{}'; one of {}".format(kernel, ", ".join(KERNELS)))
+        if kernel == 'zlib' and not (self.width == 32 and self.poly == 0x04C11DB7 and self.refin):
+            raise ValueError("zlib only computes the CRC-32 polynomial")
+        if kernel == 'hqx' and not (self.width == 16 and self.poly == 0x1021 and not self.refin):
+            raise ValueError("binascii.crc_hqx only computes the non-reflected 0x1021 polynomial")
+        if kernel in ('slice4', 'slice8'):
+            if not self.refin:
+                raise ValueError("Slicing is only implemented for reflected CRCs")
+            self.slices = make_slice_tables(self.width, self.poly, 8 if kernel == 'slice8' else 4)
+        self.kernel = kernel
+        self._kernel = getattr(self, '_update_' + kernel)
+
+
+    def calculate(self, data):
+        check_data(data)
+        return self._finish(self._update(self.start, data))
+
+
+    def reset(self):
+        '''Start a new incremental calculation'''
+        self.crcValue = self.start
+
+
+    def update(self, data):
+        '''Feed the next chunk of a stream; str, bytearray and memoryview are accepted'''
+        check_data(data)
+        self.crcValue = self._update(self.crcValue, data)
+        return self
+
+
+    def digest(self):
+        '''CRC of everything passed to update() since the last reset()'''
+        return self._finish(self.crcValue)
+
+
+    def _update(self, crcValue, data):
+        if len(data) < SLICE_MIN:
+            return self._update_table(crcValue, data)
+        return self._kernel(crcValue, data)
+
+
+    def _update_table(self, crcValue, data):
+        if not isinstance(data, bytearray): data = bytearray(data)
+        tab = self.table
+        if self.refin:
+            for c in data:
+                crcValue = (crcValue >> 8) ^ tab[(crcValue ^ c) & 0xff]
+        else:
+            shift = self.width - 8
+            mask = self.mask
+            for c in data:
+                crcValue = ((crcValue << 8) & mask) ^ tab[((crcValue >> shift) ^ c) & 0xff]
+        return crcValue
+
+
+    def _update_slice4(self, crcValue, data):
+        n = len(data) >> 2
+        t0, t1, t2, t3 = self.slices
+        for word in struct.unpack_from('<%dI' % n, data):
+            crcValue ^= word
+            crcValue = (t3[crcValue & 0xff] ^ t2[(crcValue >> 8) & 0xff] ^
+                        t1[(crcValue >> 16) & 0xff] ^ t0[crcValue >> 24])
+        return self._update_table(crcValue, data[n << 2:])
+
+
+    def _update_slice8(self, crcValue, data):
+        n = len(data) >> 3
+        t0, t1, t2, t3, t4, t5, t6, t7 = self.slices
+        words = struct.unpack_from('<%dI' % (n << 1), data)
+        for i in xrange(0, n << 1, 2):
+            crcValue ^= words[i]
+            high = words[i + 1]
+            crcValue = (t7[crcValue & 0xff] ^ t6[(crcValue >> 8) & 0xff] ^
+                        t5[(crcValue >> 16) & 0xff] ^ t4[crcValue >> 24] ^
+                        t3[high & 0xff] ^ t2[(high >> 8) & 0xff] ^
+                        t1[(high >> 16) & 0xff] ^ t0[high >> 24])
+        return self._update_table(crcValue, data[n << 3:])
+
+
+    def _update_zlib(self, crcValue, data):
+        # zlib keeps the register inverted between calls
+        if isinstance(data, bytearray): data = buffer(data)
+        elif isinstance(data, memoryview): data = data.tobytes()
+        return (zlib.crc32(data, crcValue ^ 0xFFFFFFFF) & 0xFFFFFFFF) ^ 0xFFFFFFFF
+
+
+    def _update_hqx(self, crcValue, data):
+        return binascii.crc_hqx(data, crcValue)
+
+
+    def _finish(self, crcValue):
+        if self.refin != self.refout:
+            crcValue = reflect(crcValue, self.width)
+        return crcValue ^ self.xorout
+
+
+def get_crc(name, kernel=None):
+    '''
+    Returns a new calculator for a named preset, e.g. get_crc('CRC-16/MODBUS')
+    '''
+    if name in CUSTOM:
+        module, cls = CUSTOM[name]
+        return getattr(__import__(module), cls)()
+    if name not in PRESETS:
+        raise KeyError("Unknown CRC '{}'; one of {}".format(name, ", ".join(sorted(PRESETS.keys() + CUSTOM.keys()))))
+    return CRCEngine(kernel=kernel, **PRESETS[name])
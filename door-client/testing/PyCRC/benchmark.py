@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+
+# THROUGHPUT BENCHMARK FOR CRC Modules
+#
+# Reports MB/s for every preset and every kernel that can compute it, from
+# 10 byte frames up to multi-MB captures. Every kernel is cross-checked
+# against a bit-by-bit implementation of the Rocksoft model (inputs up to
+# --check bytes; larger inputs are checked against the byte table kernel).
+#
+# With --batch, verifying a capture of DoorControl sized frames one
+# calculate() at a time is compared with CRCBatch.verify_batch.
+#
+# Usage: benchmark.py [-m max_size] [-b budget] [-a algorithm] [--batch frames]
+
+
+import argparse, os, sys, time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "CRCModules"))
+
+from CRCEngine import CRCEngine, CUSTOM, KERNELS, PRESETS, get_crc, reflect
+import CRCBatch
+
+SIZES = [10, 64, 1024, 64 * 1024, 1024 * 1024, 4 * 1024 * 1024]
+
+
+def reference(data, width, poly, init, refin, refout, xorout):
+    '''Bit-by-bit CRC, straight from the Rocksoft model'''
+    top = 1 << (width - 1)
+    mask = (1 << width) - 1
+    crc = init
+    for c in bytearray(data):
+        if refin: c = reflect(c, 8)
+        crc ^= c << (width - 8)
+        for i in range(8):
+            if crc & top:   crc = ((crc << 1) & mask) ^ poly
+            else:           crc = (crc << 1) & mask
+    if refout: crc = reflect(crc, width)
+    return crc ^ xorout
+
+
+def kernels(name):
+    '''Every kernel able to compute the preset, the default one first'''
+    if name in CUSTOM:
+        return [None]
+    found = [get_crc(name).kernel]
+    for kernel in KERNELS:
+        if kernel in found:
+            continue
+        try:
+            get_crc(name, kernel)
+        except ValueError:
+            continue
+        found.append(kernel)
+    return found
+
+
+def measure(crc, data, budget):
+    '''MB/s computing the CRC of data, repeated until about `budget` bytes went through'''
+    count = max(1, budget // len(data))
+    start = time.time()
+    for i in xrange(count):
+        crc.calculate(data)
+    elapsed = time.time() - start
+    return count * len(data) / elapsed / 1e6 if elapsed else float('inf')
+
+
+def run(names, sizes, budget, check):
+    inputs = dict((size, bytearray(os.urandom(size))) for size in sizes)
+    print "{:<18s}{:<8s}".format("algorithm", "kernel") + "".join("{:>11s}".format(label(size)) for size in sizes)
+    failures = 0
+    for name in names:
+        expected = {}
+        for kernel in kernels(name):
+            crc = get_crc(name) if kernel is None else get_crc(name, kernel)
+            for size in sizes:
+                value = crc.calculate(inputs[size])
+                if size not in expected:
+                    if name in PRESETS and size <= check:
+                        expected[size] = reference(inputs[size], **PRESETS[name])
+                    else:
+                        expected[size] = value
+                if value != expected[size]:
+                    failures += 1
+                    print "MISMATCH {} ({}) on {:d} bytes: {:#x} != {:#x}".format(
+                        name, kernel, size, value, expected[size])
+            speeds = [measure(crc, inputs[size], budget) for size in sizes]
+            print "{:<18s}{:<8s}".format(name, kernel or "custom") + "".join("{:>11.2f}".format(speed) for speed in speeds)
+    print "throughput in MB/s; {}".format("all results agree" if not failures else "{:d} MISMATCHES".format(failures))
+    return failures
+
+
+def run_batch(names, count):
+    '''Frames/s verifying `count` frames of 7 to 63 bytes (trailing CRC, high byte first)'''
+    sizes = [7, 8, 15, 63]
+    frames = []
+    for i in xrange(count):
+        frame = bytearray(os.urandom(sizes[i % len(sizes)]))
+        frames.append(frame)
+    print "verifying {:d} frames ({})".format(count, "NumPy" if CRCBatch.numpy is not None else "NumPy missing, per-frame fallback")
+    print "{:<18s}{:>14s}{:>14s}".format("algorithm", "loop", "batch")
+    failures = 0
+    for name in names:
+        crc = get_crc(name)
+        size = crc.width // 8 if isinstance(crc, CRCEngine) else 2
+        sealed = []
+        for frame in frames:
+            value = crc.calculate(frame[:-size])
+            sealed.append(frame[:-size] + bytearray((value >> (8 * i)) & 0xff for i in reversed(range(size))))
+
+        start = time.time()
+        loop = [crc.calculate(frame[:-size]) for frame in sealed]
+        looped = time.time() - start
+
+        start = time.time()
+        crcs, failed = CRCBatch.verify_batch(crc, sealed)
+        batched = time.time() - start
+
+        if list(crcs) != loop or any(failed):
+            failures += 1
+            print "MISMATCH {} in batch verification".format(name)
+        print "{:<18s}{:>12.0f}/s{:>12.0f}/s".format(name, count / looped, count / batched)
+    return failures
+
+
+def label(size):
+    if size >= 1024 * 1024: return "{:d}MB".format(size // (1024 * 1024))
+    if size >= 1024:        return "{:d}KB".format(size // 1024)
+    return "{:d}B".format(size)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the CRC modules.')
+    parser.add_argument("-m", "--max-size", type=int, default=SIZES[-1], help="Largest input, in bytes.")
+    parser.add_argument("-b", "--budget", type=int, default=1024 * 1024, help="Bytes to process per measurement.")
+    parser.add_argument("-c", "--check", type=int, default=64 * 1024, help="Largest input checked bit by bit.")
+    parser.add_argument("-a", "--algorithm", action="append", help="Preset to run (repeatable); all by default.")
+    parser.add_argument("--batch", type=int, metavar="FRAMES", help="Benchmark batch verification of this many frames instead.")
+    args = parser.parse_args()
+
+    names = args.algorithm or sorted(PRESETS.keys() + CUSTOM.keys())
+    if args.batch:
+        sys.exit(1 if run_batch(names, args.batch) else 0)
+    sizes = [size for size in SIZES if size <= args.max_size]
+    sys.exit(1 if run(names, sizes, args.budget, args.check) else 0)
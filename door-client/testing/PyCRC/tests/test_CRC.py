@@ -12,6 +12,9 @@ from CRC16DNP import CRC16DNP
 from CRC16Kermit import CRC16Kermit
 from CRC16SICK import CRC16SICK
 from CRCCCITT import CRCCCITT
+from CRCEngine import CRCEngine, KERNELS, PRESETS, get_crc
+import CRCBatch
+from CRCBatch import calculate_batch, verify_batch
 
 class CRC16Test(unittest.TestCase):
     def setUp(self):
@@ -38,13 +41,30 @@ class CRC16Test(unittest.TestCase):
         print "Calculated CRC16 for 0123456789 should be 0x443D"
         self.assertEqual(self.crc.calculate("0123456789"), int('0x443D', 0))
 
+    def testCalculateBytes(self):
+        print "Calculating from a bytearray or memoryview should match calculating from a string"
+        self.assertEqual(self.crc_modbus.calculate(bytearray("0123456789")), int('0x434D', 0))
+        self.assertEqual(self.crc_modbus.calculate(memoryview("0123456789")), int('0x434D', 0))
+
+    def testEmptyBytesCalculate(self):
+        print "Calculating from an empty bytearray or memoryview should return 0, like an empty string"
+        self.assertEqual(self.crc.calculate(bytearray()), 0)
+        self.assertEqual(self.crc.calculate(memoryview("")), 0)
+
+    def testUpdateDigest(self):
+        print "Feeding 0123456789 in chunks through update() should digest to 0x434D for MODBUS"
+        self.crc_modbus.update("0123").update(bytearray("456")).update(memoryview("789"))
+        self.assertEqual(self.crc_modbus.digest(), int('0x434D', 0))
+        self.crc_modbus.reset()
+        self.assertEqual(self.crc_modbus.digest(), int('0xFFFF', 0))
+
     def testTableItem42(self):
         print "The precalculated table's item #42 should be 0xdf81"
-        self.assertEqual(self.crc.crc16_tab[42], '0xdf81')
+        self.assertEqual(self.crc.crc16_tab[42], 0xdf81)
 
     def testTableItem10(self):
         print "The precalculated table's item #10 should be 0x780"
-        self.assertEqual(self.crc.crc16_tab[10], '0x780')
+        self.assertEqual(self.crc.crc16_tab[10], 0x780)
 
     def testTableItems(self):
         print "After creating a CRC16 object we must have a precalculated table with 256 items"
@@ -75,13 +95,29 @@ class CRC32Test(unittest.TestCase):
         print "Calculated CRC32 for 0123456789 should be 0xA684C7C6"
         self.assertEqual(self.crc.calculate("0123456789"), int('0xA684C7C6', 0))
 
+    def testCalculateBytes(self):
+        print "Calculating from a bytearray or memoryview should match calculating from a string"
+        self.assertEqual(self.crc.calculate(bytearray("0123456789")), int('0xA684C7C6', 0))
+        self.assertEqual(self.crc.calculate(memoryview("0123456789")), int('0xA684C7C6', 0))
+
+    def testEmptyBytesCalculate(self):
+        print "Calculating from an empty bytearray or memoryview should return 0, like an empty string"
+        self.assertEqual(self.crc.calculate(bytearray()), 0)
+        self.assertEqual(self.crc.calculate(memoryview("")), 0)
+
+    def testUpdateDigest(self):
+        print "Feeding 0123456789 in chunks through update() should digest to 0xA684C7C6"
+        for c in "0123456789":
+            self.crc.update(c)
+        self.assertEqual(self.crc.digest(), int('0xA684C7C6', 0))
+
     def testTableItem42(self):
         print "The precalculated table's item #42 should be 0xdbbbc9d6"
-        self.assertEqual(self.crc.crc32_tab[42], '0xdbbbc9d6')
+        self.assertEqual(self.crc.crc32_tab[42], 0xdbbbc9d6)
  
     def testTableItem10(self):
         print "The precalculated table's item #10 should be 0xe0d5e91e"
-        self.assertEqual(self.crc.crc32_tab[10], '0xe0d5e91e')
+        self.assertEqual(self.crc.crc32_tab[10], 0xe0d5e91e)
 
     def testTableItems(self):
         print "After creating a CRC32 object we must have a precalculated table with 256 items"
@@ -109,13 +145,18 @@ class CRC16DNPTest(unittest.TestCase):
         print "Calculated CRC16DNP for 0123456789 should be 0x7267"
         self.assertEqual(self.crc.calculate("0123456789"), int('0x7267', 0))
 
+    def testUpdateDigest(self):
+        print "Feeding 0123456789 in chunks through update() should digest to 0x7267"
+        self.crc.update("01234").update(bytearray("56789"))
+        self.assertEqual(self.crc.digest(), int('0x7267', 0))
+
     def testTableItem42(self):
         print "The precalculated table's item #42 should be 0xba9a"
-        self.assertEqual(self.crc.crc16dnp_tab[42], '0xba9a')
+        self.assertEqual(self.crc.crc16dnp_tab[42], 0xba9a)
  
     def testTableItem10(self):
         print "The precalculated table's item #10 should be 0x9335"
-        self.assertEqual(self.crc.crc16dnp_tab[10], '0x9335')
+        self.assertEqual(self.crc.crc16dnp_tab[10], 0x9335)
 
     def testTableItems(self):
         print "After creating a CRC16DNP object we must have a precalculated table with 256 items"
@@ -144,11 +185,11 @@ class CRC16DNPTest(unittest.TestCase):
 
     def testTableItem42(self):
         print "The precalculated table's item #42 should be 0xba9a"
-        self.assertEqual(self.crc.crc16dnp_tab[42], '0xba9a')
+        self.assertEqual(self.crc.crc16dnp_tab[42], 0xba9a)
  
     def testTableItem10(self):
         print "The precalculated table's item #10 should be 0x9335"
-        self.assertEqual(self.crc.crc16dnp_tab[10], '0x9335')
+        self.assertEqual(self.crc.crc16dnp_tab[10], 0x9335)
 
     def testTableItems(self):
         print "After creating a CRC16DNP object we must have a precalculated table with 256 items"
@@ -176,13 +217,18 @@ class CRC16KermitTest(unittest.TestCase):
         print "Calculated CRC16Kermit for 0123456789 should be 0x6E5F"
         self.assertEqual(self.crc.calculate("0123456789"), int('0x6E5F', 0))
 
+    def testUpdateDigest(self):
+        print "Feeding 0123456789 in chunks through update() should digest to 0x6E5F"
+        self.crc.update("01234").update(bytearray("56789"))
+        self.assertEqual(self.crc.digest(), int('0x6E5F', 0))
+
     def testTableItem42(self):
         print "The precalculated table's item #42 should be 0x8e58"
-        self.assertEqual(self.crc.crc16kermit_tab[42], '0x8e58')
+        self.assertEqual(self.crc.crc16kermit_tab[42], 0x8e58)
  
     def testTableItem10(self):
         print "The precalculated table's item #10 should be 0xaf5a"
-        self.assertEqual(self.crc.crc16kermit_tab[10], '0xaf5a')
+        self.assertEqual(self.crc.crc16kermit_tab[10], 0xaf5a)
 
     def testTableItems(self):
         print "After creating a CRC16Kermit object we must have a precalculated table with 256 items"
@@ -209,6 +255,11 @@ class CRC16SICKTest(unittest.TestCase):
         print "Calculated CRC16SICK for 0123456789 should be 0xF6C6"
         self.assertEqual(self.crc.calculate("0123456789"), int('0xF6C6', 0))
 
+    def testUpdateDigest(self):
+        print "Feeding 0123456789 in chunks through update() should digest to 0xF6C6"
+        self.crc.update("01234").update(bytearray("56789"))
+        self.assertEqual(self.crc.digest(), int('0xF6C6', 0))
+
 
 
 class CRCCCITTTest(unittest.TestCase):
@@ -245,13 +296,18 @@ class CRCCCITTTest(unittest.TestCase):
         print "Calculated CRC CCITT (XModem) for 0123456789 should be 0x9C58"
         self.assertEqual(self.crc_1.calculate("0123456789"), int('0x9C58', 0))
 
+    def testUpdateDigest(self):
+        print "Feeding 0123456789 in chunks through update() should digest to 0x7D61 for CRC CCITT (0xFFFF)"
+        self.crc_2.update(memoryview("01234")).update(bytearray("56789"))
+        self.assertEqual(self.crc_2.digest(), int('0x7D61', 0))
+
     def testTableItem42(self):
         print "The precalculated table's item #42 should be 0x8528"
-        self.assertEqual(self.crc_1.crc_ccitt_tab[42], '0x8528')
+        self.assertEqual(self.crc_1.crc_ccitt_tab[42], 0x8528)
  
     def testTableItem10(self):
         print "The precalculated table's item #10 should be 0xa14a"
-        self.assertEqual(self.crc_1.crc_ccitt_tab[10], '0xa14a')
+        self.assertEqual(self.crc_1.crc_ccitt_tab[10], 0xa14a)
 
     def testTableItems(self):
         print "After creating a CRC CCITT object we must have a precalculated table with 256 items"
@@ -261,6 +317,162 @@ class CRCCCITTTest(unittest.TestCase):
         print "After creating a CRC CCITT object we must have a precalculated table not empty"
         self.assertIsNot(self.crc_1.crc_ccitt_tab, []) 
 
+class CRCEngineTest(unittest.TestCase):
+    # check values for "123456789" from the catalogue of parametrised CRC algorithms
+    check = {
+        'CRC-16': 0xBB3D,
+        'CRC-16/MODBUS': 0x4B37,
+        'CRC-CCITT/XMODEM': 0x31C3,
+        'CRC-CCITT/FFFF': 0x29B1,
+        'CRC-16/DNP': 0xEA82,
+        'CRC-16/KERMIT': 0x2189,
+        'CRC-32': 0xCBF43926,
+    }
+
+    def testPresetCheckValues(self):
+        print "Every preset should produce its catalogue check value for 123456789"
+        for name, value in self.check.items():
+            self.assertEqual(get_crc(name).calculate("123456789"), value, name)
+
+    def testWrappersMatchEngine(self):
+        print "The CRC classes should agree with the engine run from the same preset"
+        data = "0123456789"
+        self.assertEqual(CRC16(modbus_flag = True).calculate(data), get_crc('CRC-16/MODBUS').calculate(data))
+        self.assertEqual(CRC32().calculate(data), get_crc('CRC-32').calculate(data))
+        self.assertEqual(CRCCCITT('1D0F').calculate(data), get_crc('CRC-CCITT/1D0F').calculate(data))
+
+    def testSharedTables(self):
+        print "Engines with the same width, poly and refin should share one table"
+        self.assertIs(CRC16().crc16_tab, CRC16(modbus_flag = True).crc16_tab)
+        self.assertIs(get_crc('CRC-CCITT/FFFF').table, CRCCCITT().crc_ccitt_tab)
+
+    def testCustomParameters(self):
+        print "A CRC outside the presets can be built from its Rocksoft parameters (CRC-16/GENIBUS)"
+        crc = CRCEngine(width=16, poly=0x1021, init=0xFFFF, refin=False, refout=False, xorout=0xFFFF)
+        self.assertEqual(crc.calculate("123456789"), 0xD64E)
+
+    def testMixedReflection(self):
+        print "When refin and refout differ the register should be reflected on output"
+        crc = CRCEngine(width=16, poly=0x8005, init=0x0000, refin=False, refout=False, xorout=0)
+        mixed = CRCEngine(width=16, poly=0x8005, init=0x0000, refin=False, refout=True, xorout=0)
+        value = crc.calculate("123456789")
+        self.assertEqual(mixed.calculate("123456789"), int('{:016b}'.format(value)[::-1], 2))
+
+    def testSICKPreset(self):
+        print "The SICK preset should return the custom CRC16SICK implementation"
+        self.assertIsInstance(get_crc('CRC-16/SICK'), CRC16SICK)
+
+    def testKernelsAgree(self):
+        print "Every kernel able to compute a preset should agree with the byte table, also when streamed"
+        data = bytearray(range(256)) * 5 + bytearray("0123456789")
+        for name in PRESETS:
+            for kernel in KERNELS:
+                try:
+                    crc = get_crc(name, kernel)
+                except ValueError:
+                    continue
+                table = get_crc(name, 'table')
+                for size in (0, 1, 7, 15, 16, 17, 31, 64, 100, len(data)):
+                    self.assertEqual(crc.calculate(data[:size]), table.calculate(data[:size]), (name, kernel, size))
+                crc.reset()
+                for i in range(0, len(data), 37):
+                    crc.update(memoryview(data)[i:i + 37])
+                self.assertEqual(crc.digest(), table.calculate(data), (name, kernel))
+
+    def testDefaultKernels(self):
+        print "CRC-32 should use zlib, CRC-CCITT binascii and the other reflected CRCs slicing"
+        self.assertEqual(get_crc('CRC-32').kernel, 'zlib')
+        self.assertEqual(get_crc('CRC-CCITT/1D0F').kernel, 'hqx')
+        self.assertEqual(get_crc('CRC-16/MODBUS').kernel, 'slice4')
+
+    def testKernelMismatch(self):
+        print "Forcing a kernel that cannot compute the parameters should raise ValueError"
+        self.assertRaises(ValueError, get_crc, 'CRC-16/MODBUS', 'zlib')
+        self.assertRaises(ValueError, get_crc, 'CRC-CCITT/XMODEM', 'slice4')
+
+    def testUnknownPreset(self):
+        print "An unknown preset name should raise KeyError"
+        self.assertRaises(KeyError, get_crc, 'CRC-99')
+
+
+class CRCBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.frames = [bytearray((i * 7 + j) & 0xff for j in range(i % 40)) for i in range(200)]
+        self.crc = CRC16(modbus_flag = True)
+        self.numpy = CRCBatch.numpy
+
+    def tearDown(self):
+        CRCBatch.numpy = self.numpy
+
+    def sealed(self):
+        frames = []
+        for frame in self.frames:
+            value = self.crc.calculate(frame)
+            frames.append(frame + bytearray([value >> 8, value & 0xff]))
+        return frames
+
+    def testFallback(self):
+        print "Without NumPy the batch API should return the same CRCs as calculate()"
+        CRCBatch.numpy = None
+        self.assertEqual(calculate_batch(self.crc, self.frames), [self.crc.calculate(f) for f in self.frames])
+
+    @unittest.skipIf(CRCBatch.numpy is None, "NumPy is not installed")
+    def testLayouts(self):
+        print "List, offsets+buffer and padded 2-D layouts should give the CRCs calculate() does"
+        numpy = CRCBatch.numpy
+        for name in PRESETS:
+            crc = get_crc(name)
+            expected = [crc.calculate(f) for f in self.frames]
+            self.assertEqual(list(calculate_batch(crc, self.frames)), expected, name)
+
+            offsets = [0]
+            for frame in self.frames:
+                offsets.append(offsets[-1] + len(frame))
+            self.assertEqual(list(calculate_batch(crc, bytearray().join(self.frames), offsets=offsets)), expected, name)
+
+            rows = numpy.zeros((len(self.frames), 40), dtype=numpy.uint8)
+            for i, frame in enumerate(self.frames):
+                rows[i, :len(frame)] = list(frame)
+            lengths = [len(f) for f in self.frames]
+            self.assertEqual(list(calculate_batch(crc, rows, lengths=lengths)), expected, name)
+
+    def testBufferTypes(self):
+        print "Frames given as str, bytearray or memoryview should give the same CRCs, with and without NumPy"
+        expected = [self.crc.calculate(f) for f in self.frames]
+        offsets = [0]
+        for frame in self.frames:
+            offsets.append(offsets[-1] + len(frame))
+        joined = bytearray().join(self.frames)
+        for numpy in (self.numpy, None):
+            CRCBatch.numpy = numpy
+            for convert in (str, bytearray, memoryview):
+                self.assertEqual(list(calculate_batch(self.crc, [convert(f) for f in self.frames])), expected)
+                self.assertEqual(list(calculate_batch(self.crc, convert(joined), offsets=offsets)), expected)
+            self.assertEqual(list(calculate_batch(self.crc, [memoryview('abc')])), [self.crc.calculate('abc')])
+
+    @unittest.skipIf(CRCBatch.numpy is None, "NumPy is not installed")
+    def testByteSwappedPresets(self):
+        print "The batch API should keep the byte swap of CRC16DNP and CRC16Kermit"
+        for crc in (CRC16DNP(), CRC16Kermit()):
+            self.assertEqual(list(calculate_batch(crc, self.frames[1:])), [crc.calculate(f) for f in self.frames[1:]])
+
+    def testVerify(self):
+        print "verify_batch should flag exactly the corrupted and truncated frames, with and without NumPy"
+        frames = self.sealed()
+        frames[5][0] ^= 0x01
+        frames[17] = frames[17][:1]
+        for numpy in (self.numpy, None):
+            CRCBatch.numpy = numpy
+            crcs, failed = verify_batch(self.crc, frames)
+            self.assertEqual([i for i, bad in enumerate(failed) if bad], [5, 17])
+
+    def testVerifyExpected(self):
+        print "verify_batch should compare against given CRCs when expected is passed"
+        expected = [self.crc.calculate(f) for f in self.frames]
+        expected[3] ^= 1
+        crcs, failed = verify_batch(self.crc, self.frames, expected=expected)
+        self.assertEqual([i for i, bad in enumerate(failed) if bad], [3])
+
 
  
 if __name__ == "__main__":
@@ -282,5 +494,11 @@ if __name__ == "__main__":
     suite_crcccitt = unittest.TestLoader().loadTestsFromTestCase(CRCCCITTTest)
     unittest.TextTestRunner(verbosity=2).run(suite_crcccitt)  
 
+    suite_crcengine = unittest.TestLoader().loadTestsFromTestCase(CRCEngineTest)
+    unittest.TextTestRunner(verbosity=2).run(suite_crcengine)
+
+    suite_crcbatch = unittest.TestLoader().loadTestsFromTestCase(CRCBatchTest)
+    unittest.TextTestRunner(verbosity=2).run(suite_crcbatch)
+
 
 
@@ -0,0 +1,221 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+MakeICT/Bluebird Arthouse Electronic Door Entry
+
+benchmark.py: Measures the per-frame cost of the DoorControl protocol routines
+Usage: benchmark.py [-n frames] [-s recorded_stream]
+
+Authors:
+	Dominic Canare <dom@greenlightgo.org>
+	Rye Kennedy <ryekennedy@gmail.com>
+	Christian Kindel <iceman81292@gmail.com>
+'''
+
+import argparse, binascii, random, time
+from CRC16 import CRC16
+from framing import FrameDecoder, FrameEncoder, B_FLAG, B_ESC
+
+# Frames shaped like the ones DoorControl puts on the bus:
+# update request, unlock, light pattern and the 'birthday' tune
+FRAME_SIZES = [('update', 0), ('unlock', 1), ('light', 8), ('tune', 56)]
+
+def referenceCRC(data):
+	'''
+	Bit-by-bit Modbus CRC16, as computed by the door client firmware
+	'''
+	crc = 0xFFFF
+	for byte in data:
+		crc ^= byte
+		for i in range(8):
+			if crc & 0x0001:
+				crc = (crc >> 1) ^ 0xA001
+			else:
+				crc >>= 1
+	return crc
+
+def makeFrame(payloadLength, rand=random):
+	'''
+	Build an unescaped frame (header + payload + CRC) with a random payload
+	'''
+	header = [rand.randint(0, 0xFF), 0x00, 0x01, 0x0A, payloadLength]
+	frame = bytearray(header + [rand.randint(0, 0xFF) for i in range(payloadLength)])
+	crc = referenceCRC(frame)
+	frame.append(crc >> 8)
+	frame.append(crc & 0xFF)
+	return frame
+
+def escapeFrame(frame):
+	'''
+	Byte-stuff a frame and wrap it in flags, as it appears on the wire
+	'''
+	out = bytearray([B_FLAG])
+	for byte in frame:
+		if byte == B_FLAG or byte == B_ESC:
+			out.append(B_ESC)
+		out.append(byte)
+	out.append(B_FLAG)
+	return out
+
+def makeStream(count, rand=random):
+	'''
+	Build a raw bus capture: a mix of frame sizes, with every 50th frame corrupted
+	'''
+	stream = bytearray()
+	for i in range(count):
+		frame = makeFrame(FRAME_SIZES[i % len(FRAME_SIZES)][1], rand)
+		if i % 50 == 49:
+			frame[5 % len(frame)] ^= 0x01
+		stream += escapeFrame(frame)
+	return stream
+
+def checkFrame(frame, checker=CRC16(modbus_flag = True)):
+	return (len(frame) >= 7 and frame[4] == len(frame) - 7 and
+		checker.calculate(bytearray(frame[:-2])) == (frame[-2] << 8 | frame[-1]))
+
+def perByteDecode(stream):
+	'''
+	The original DoorControl.receive_packet loop: one read and one hex
+	round trip per byte, with the escape state carried between calls
+	'''
+	frames = []
+	packet = []
+	escaping = False
+	for i in xrange(len(stream)):
+		byte = int(binascii.b2a_hex(str(stream[i:i + 1])), 16)
+		if byte == B_ESC and not escaping:
+			escaping = True
+		elif byte == B_FLAG and not escaping:
+			if packet and checkFrame(packet):
+				frames.append(packet)
+			packet = []
+		else:
+			packet.append(byte)
+			escaping = False
+	return frames
+
+def concatEncode(trans_ID, from_addr, to_addr, function, payload, checker=CRC16(modbus_flag = True)):
+	'''
+	The original DoorControl.send_packet: chr() concatenation in a per-byte loop
+	'''
+	frame = [trans_ID, from_addr, to_addr, function, len(payload)] + list(payload)
+	crc = checker.calculate(bytearray(frame))
+	data = ''
+	for byte in frame + [crc >> 8, crc & 0xFF]:
+		if byte == B_FLAG or byte == B_ESC:
+			data = data + chr(B_ESC)
+		data = data + chr(byte)
+	return chr(B_FLAG) + data + chr(B_FLAG)
+
+def report(name, count, elapsed, nbytes=None):
+	perFrame = elapsed / count * 1e6
+	line = "{:<28s}{:>10.2f} us/frame{:>12.0f} frames/s".format(name, perFrame, count / elapsed)
+	if nbytes is not None:
+		line += "{:>10.2f} MB/s".format(nbytes / elapsed / 1e6)
+	print line
+
+def benchCRC(count):
+	'''
+	Compare the bit-by-bit CRC against the table-driven CRC16 module
+	used by DoorControl.check_CRC, and make sure both agree.
+	'''
+	checker = CRC16(modbus_flag = True)
+	rand = random.Random(0)
+	print "== Modbus CRC16 verification =="
+	for name, size in FRAME_SIZES:
+		frames = [makeFrame(size, rand) for i in range(count)]
+		for frame in frames[:100]:
+			assert checker.calculate(frame[:-2]) == referenceCRC(frame[:-2])
+
+		start = time.time()
+		for frame in frames:
+			referenceCRC(frame[:-2])
+		report("{:s} ({:d}B) bitwise".format(name, len(frames[0])), count, time.time() - start)
+
+		start = time.time()
+		for frame in frames:
+			checker.calculate(frame[:-2]) == (frame[-2] << 8 | frame[-1])
+		report("{:s} ({:d}B) table".format(name, len(frames[0])), count, time.time() - start)
+
+def benchDecode(count, streamFile=None):
+	'''
+	Run a recorded (or synthesized) byte stream through the per-byte
+	decoder and through FrameDecoder at several serial read sizes.
+	'''
+	if streamFile:
+		with open(streamFile, 'rb') as f:
+			stream = bytearray(f.read())
+	else:
+		stream = makeStream(count, random.Random(1))
+	print "== Frame decoding ({:d} bytes) ==".format(len(stream))
+
+	start = time.time()
+	expected = len(perByteDecode(stream))
+	report("per-byte read", max(expected, 1), time.time() - start, len(stream))
+
+	for chunkSize in (1, 16, 256, 4096):
+		chunks = [stream[i:i + chunkSize] for i in xrange(0, len(stream), chunkSize)]
+		decoder = FrameDecoder(validate=checkFrame)
+		start = time.time()
+		frames = sum(1 for frame in decoder.decode(chunks))
+		elapsed = time.time() - start
+		assert frames == expected
+		report("FrameDecoder {:d}B reads".format(chunkSize), max(frames, 1), elapsed, len(stream))
+	print "{:d} frames accepted, {:d} rejected".format(decoder.frames, decoder.rejected)
+
+def benchEncode(count, batch=8):
+	'''
+	Encode cost per frame: string concatenation vs FrameEncoder, one frame
+	per call and `batch` frames per buffer
+	'''
+	encoder = FrameEncoder(crc=CRC16(modbus_flag = True).calculate)
+	rand = random.Random(2)
+	print "== Frame encoding =="
+	for name, size in FRAME_SIZES:
+		commands = [(rand.randint(0, 0xFF), 0x00, 0x01, 0x05,
+			[rand.randint(0, 0xFF) for i in range(size)]) for j in range(count)]
+		for command in commands[:100]:
+			assert str(encoder.encode(*command)) == concatEncode(*command)
+
+		start = time.time()
+		for command in commands:
+			concatEncode(*command)
+		report("{:s} ({:d}B) concat".format(name, size), count, time.time() - start)
+
+		start = time.time()
+		for command in commands:
+			encoder.encode(*command)
+		report("{:s} ({:d}B) encoder".format(name, size), count, time.time() - start)
+
+		start = time.time()
+		for i in xrange(0, count, batch):
+			encoder.encode_many(commands[i:i + batch])
+		report("{:s} ({:d}B) encoder x{:d}".format(name, size, batch), count, time.time() - start)
+
+def benchTurnaround(bauds=(9600, 19200, 57600, 115200)):
+	'''
+	Frames per second one direction of the bus can carry with the old fixed
+	10 ms + 20 ms driver sleeps, and with drain + one character time
+	'''
+	encoder = FrameEncoder(crc=CRC16(modbus_flag = True).calculate)
+	print "== Driver turnaround (8N1) =="
+	print "{:<16s}{:>8s}{:>14s}{:>14s}".format('frame', 'baud', 'fixed sleep', 'drained')
+	for name, size in FRAME_SIZES:
+		wireBytes = len(encoder.encode(0x10, 0x00, 0x01, 0x05, [0] * size))
+		for baud in bauds:
+			charTime = 10.0 / baud
+			wire = wireBytes * charTime
+			print "{:<16s}{:>8d}{:>12.0f}/s{:>12.0f}/s".format(
+				"{:s} ({:d}B)".format(name, wireBytes), baud,
+				1 / (wire + 0.030), 1 / (wire + charTime))
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description='Benchmark the DoorControl protocol routines.')
+	parser.add_argument("-n", "--frames", type=int, default=20000, help="Number of frames per test.")
+	parser.add_argument("-s", "--stream", help="Raw byte capture to decode instead of a synthesized one.")
+	args = parser.parse_args()
+
+	benchCRC(args.frames)
+	benchDecode(args.frames, args.stream)
+	benchEncode(args.frames)
+	benchTurnaround()
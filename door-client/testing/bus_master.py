@@ -0,0 +1,224 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+MakeICT/Bluebird Arthouse Electronic Door Entry
+
+bus_master.py: Schedules traffic for several door clients sharing one RS-485 bus
+
+The master round-robins status polls across the client addresses and slips
+queued commands in between them. Unlock/lock go out ahead of the next poll;
+other commands (tunes, lights) alternate with polls so a long burst of them
+cannot starve status updates.
+
+Authors:
+	Dominic Canare <dom@greenlightgo.org>
+	Rye Kennedy <ryekennedy@gmail.com>
+	Christian Kindel <iceman81292@gmail.com>
+'''
+
+import heapq, itertools, time
+from framing import *
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+
+class ClientStats(object):
+    def __init__(self, address):
+        self.address = address
+        self.polls = 0
+        self.commands = 0
+        self.responses = 0
+        self.timeouts = 0
+        self.naks = 0
+        self.latency_total = 0.0
+        self.latency_min = None
+        self.latency_max = None
+        self.last_seen = None
+        self.last_trans_ID = None     # last ID the client used for its own frames
+
+    def record_response(self, latency):
+        self.responses += 1
+        self.latency_total += latency
+        if self.latency_min is None or latency < self.latency_min:
+            self.latency_min = latency
+        if self.latency_max is None or latency > self.latency_max:
+            self.latency_max = latency
+        self.last_seen = time.time()
+
+    def latency_avg(self):
+        return self.latency_total / self.responses if self.responses else None
+
+
+class BusMaster(object):
+    def __init__(self, control, addresses, timeout=0.1, retries=3, read_timeout=0.005):
+        '''
+        Args:
+          control (DoorControl): the port the clients are connected to
+          addresses (list of ints): client addresses to poll
+          timeout (float, optional): seconds to wait for a response
+          retries (int, optional): times a command is resent after a timeout
+          read_timeout (float, optional): granularity of the response wait
+        '''
+        self.control = control
+        self.control.set_timeout(read_timeout)
+        self.timeout = timeout
+        self.retries = retries
+        self.clients = {}
+        self.addresses = []
+        self.set_addresses(addresses)
+        self.commands = []
+        self.sequence = itertools.count()
+        self.last_was_poll = False
+        self.trans_IDs = {}
+        self.events = []
+        self.on_frame = None
+        self.started = time.time()
+        self.bytes_start = self.wire_bytes()
+
+    def set_addresses(self, addresses):
+        self.addresses = list(addresses)
+        for address in self.addresses:
+            if address not in self.clients:
+                self.clients[address] = ClientStats(address)
+        self.poll_order = itertools.cycle(self.addresses)
+
+    def queue_command(self, address, function, payload=[], priority=PRIORITY_NORMAL):
+        heapq.heappush(self.commands,
+            (priority, next(self.sequence), address, function, list(payload), 0, None))
+
+    def unlock(self, address, duration=0):
+        self.queue_command(address, F_UNLOCK_DOOR, [duration >> 8, duration & 0xFF], PRIORITY_HIGH)
+
+    def lock(self, address):
+        self.queue_command(address, F_LOCK_DOOR, [], PRIORITY_HIGH)
+
+    def next_trans_ID(self, address):
+        # Rolling per-client IDs. Skip the ID the client last used itself:
+        # its firmware would take a command with that ID for a duplicate.
+        trans_ID = (self.trans_IDs.get(address, 0) + 1) & 0xFF
+        if trans_ID == self.clients[address].last_trans_ID:
+            trans_ID = (trans_ID + 1) & 0xFF
+        self.trans_IDs[address] = trans_ID
+        return trans_ID
+
+    def step(self):
+        '''
+        Send one frame -- a queued command or the next status poll -- and wait
+        for the addressed client to answer it.
+
+        Returns:
+          the response frame, or None on a timeout
+        '''
+        if self.commands and (self.commands[0][0] == PRIORITY_HIGH or self.last_was_poll
+                              or not self.addresses):
+            priority, seq, address, function, payload, attempt, trans_ID = heapq.heappop(self.commands)
+            self.clients.setdefault(address, ClientStats(address)).commands += 1
+            self.last_was_poll = False
+        elif self.addresses:
+            address = next(self.poll_order)
+            function, payload = F_GET_UPDATE, self.control.update_payload(address)
+            trans_ID = None
+            self.clients[address].polls += 1
+            self.last_was_poll = True
+        else:
+            return None
+
+        if trans_ID is None:
+            trans_ID = self.next_trans_ID(address)
+        sent = time.time()
+        self.control.send_packet(to_addr=address, function=function, payload=payload, trans_ID=trans_ID)
+        response = self.wait_response(address, trans_ID, sent + self.timeout)
+        stats = self.clients[address]
+        if response is None:
+            stats.timeouts += 1
+            if not self.last_was_poll and attempt < self.retries:
+                # Resend under the same ID, so a client that did run the command
+                # (only its ACK was lost) takes it for a duplicate. Send it next,
+                # before any other frame to that client changes its last ID.
+                heapq.heappush(self.commands,
+                    (PRIORITY_HIGH, seq, address, function, payload, attempt + 1, trans_ID))
+            return None
+        stats.record_response(time.time() - sent)
+        if response[3] == F_NAK:
+            stats.naks += 1
+        elif self.last_was_poll:
+            self.control.apply_status(response)
+        return response
+
+    def wait_response(self, address, trans_ID, deadline):
+        packet = []
+        while time.time() < deadline:
+            if self.control.receive_packet(packet) is not True:
+                continue
+            frame, packet = packet, []
+            if frame[1] == address and frame[0] == trans_ID:
+                return frame
+            self.handle_unsolicited(frame)
+        return None
+
+    def handle_unsolicited(self, frame):
+        '''
+        ACK frames a client sent on its own (card reads, door state,
+        doorbell) so it stops retrying them, then pass them on.
+        '''
+        if frame[2] != ADDR_MASTER or frame[3] in (F_ACK, F_NAK):
+            return
+        address = frame[1]
+        if address in self.clients:
+            self.clients[address].last_trans_ID = frame[0]
+        self.control.send_packet(to_addr=address, function=F_ACK, trans_ID=frame[0])
+        if self.on_frame:
+            self.on_frame(frame)
+        else:
+            self.events.append(frame)
+
+    def run(self, interval=0.0, duration=None, callback=None):
+        '''
+        Keep the bus busy until interrupted or `duration` seconds pass.
+
+        Args:
+          interval (float, optional): pause between full polling rounds
+          duration (float, optional): stop after this many seconds
+          callback (function, optional): called with each response frame
+        '''
+        end = time.time() + duration if duration else None
+        while end is None or time.time() < end:
+            for i in range(max(len(self.addresses), 1)):
+                response = self.step()
+                if response is not None and callback:
+                    callback(response)
+            while self.commands:
+                response = self.step()
+                if response is not None and callback:
+                    callback(response)
+            if interval:
+                time.sleep(interval)
+
+    def wire_bytes(self):
+        return self.control.bytes_sent + self.control.decoder.bytes
+
+    def utilization(self):
+        '''
+        Fraction of wall time the bus spent carrying bytes (10 bits per
+        character: start, 8 data, stop) since the master started.
+        '''
+        elapsed = time.time() - self.started
+        if elapsed <= 0:
+            return 0.0
+        wire = (self.wire_bytes() - self.bytes_start) * 10.0 / self.control.baudrate
+        return wire / elapsed
+
+    def report(self):
+        lines = ["{:>6s}{:>8s}{:>8s}{:>8s}{:>8s}{:>6s}{:>10s}{:>10s}{:>10s}".format(
+            'addr', 'polls', 'cmds', 'resp', 'tmout', 'nak', 'min ms', 'avg ms', 'max ms')]
+        ms = lambda value: "{:.1f}".format(value * 1000) if value is not None else '-'
+        for address in sorted(self.clients):
+            c = self.clients[address]
+            lines.append("{:>6s}{:>8d}{:>8d}{:>8d}{:>8d}{:>6d}{:>10s}{:>10s}{:>10s}".format(
+                hex(address), c.polls, c.commands, c.responses, c.timeouts, c.naks,
+                ms(c.latency_min), ms(c.latency_avg()), ms(c.latency_max)))
+        lines.append("bus utilization: {:.1f}%".format(self.utilization() * 100))
+        polls = sum(c.polls for c in self.clients.values())
+        if polls:
+            lines.append("{:.1f} bytes per poll".format((self.wire_bytes() - self.bytes_start) / float(polls)))
+        return '\n'.join(lines)
@@ -0,0 +1,251 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+MakeICT/Bluebird Arthouse Electronic Door Entry
+
+capture.py: Records DoorControl bus traffic and plays it back through a pty
+Usage: capture.py dump LOG
+       capture.py replay LOG [--speed X] [--tx]
+       capture.py bench LOG [--speed X] [--repeat N]
+
+A capture is an append-only binary log: an 8 byte header (magic and format
+version) followed by one record per chunk of bus traffic, each a
+little-endian double timestamp, a direction byte, a 16 bit length and the
+raw bytes exactly as they were read from or written to the port.
+
+Authors:
+	Dominic Canare <dom@greenlightgo.org>
+	Rye Kennedy <ryekennedy@gmail.com>
+	Christian Kindel <iceman81292@gmail.com>
+'''
+
+import argparse, errno, fcntl, os, select, struct, threading, time, tty
+from framing import FrameDecoder
+
+MAGIC = 'DCAP'
+VERSION = 1
+HEADER = struct.Struct('<4sHH')     # magic, version, reserved
+RECORD = struct.Struct('<dBH')      # timestamp, direction, length
+
+RX = 0      # read from the bus
+TX = 1      # written by the master
+DIRECTIONS = {RX: 'rx', TX: 'tx'}
+
+class CaptureError(Exception):
+    pass
+
+class CaptureWriter(object):
+    '''
+    Appends records to a capture log. An existing log is extended; a new
+    (or empty) one gets a header first.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(HEADER.pack(MAGIC, VERSION, 0))
+        else:
+            check_header(path)
+        self.lock = threading.Lock()
+        self.records = 0
+        self.bytes = 0
+
+    def write(self, direction, data, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        data = bytes(data)
+        with self.lock:
+            # records are limited to 64 KiB; split anything larger
+            for i in xrange(0, len(data), 0xFFFF):
+                chunk = data[i:i + 0xFFFF]
+                self.file.write(RECORD.pack(timestamp, direction, len(chunk)))
+                self.file.write(chunk)
+                self.records += 1
+                self.bytes += len(chunk)
+
+    def flush(self):
+        with self.lock:
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def check_header(path):
+    with open(path, 'rb') as f:
+        header = f.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise CaptureError("{}: truncated header".format(path))
+    magic, version, reserved = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise CaptureError("{}: not a capture log".format(path))
+    if version != VERSION:
+        raise CaptureError("{}: unsupported capture version {:d}".format(path, version))
+
+
+def read_capture(path, directions=(RX, TX)):
+    '''
+    Generator yielding (timestamp, direction, data) for every record. A
+    record cut short by a crash while it was written ends the log.
+    '''
+    check_header(path)
+    with open(path, 'rb') as f:
+        f.seek(HEADER.size)
+        while True:
+            head = f.read(RECORD.size)
+            if len(head) < RECORD.size:
+                return
+            timestamp, direction, length = RECORD.unpack(head)
+            data = f.read(length)
+            if len(data) < length:
+                return
+            if direction in directions:
+                yield timestamp, direction, data
+
+
+class Replayer(object):
+    '''
+    Plays the recorded bytes of one direction into a pseudo-terminal, at
+    the original pace divided by `speed` (speed 0: as fast as possible).
+    Open `port` (e.g. with DoorControl.set_port) to read them back.
+    '''
+    def __init__(self, path, speed=1.0, direction=RX, repeat=1):
+        check_header(path)
+        self.path = path
+        self.speed = speed
+        self.direction = direction
+        self.repeat = repeat
+        self.master, self.slave = os.openpty()
+        # raw mode: no echo, no newline translation, no flow control bytes
+        tty.setraw(self.slave)
+        # non-blocking, so a full pty buffer nobody reads cannot hang stop()
+        fcntl.fcntl(self.master, fcntl.F_SETFL, fcntl.fcntl(self.master, fcntl.F_GETFL) | os.O_NONBLOCK)
+        self.port = os.ttyname(self.slave)
+        self.bytes = 0
+        self.records = 0
+        self.thread = None
+        self.running = False
+        self.stopping = threading.Event()
+        self.finished = threading.Event()
+
+    def start(self):
+        self.running = True
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self.run, name='capture-replay')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+    def run(self):
+        try:
+            for i in range(self.repeat):
+                first = None
+                started = time.time()
+                for timestamp, direction, data in read_capture(self.path, (self.direction,)):
+                    if not self.running:
+                        return
+                    if first is None:
+                        first = timestamp
+                    if self.speed:
+                        delay = started + (timestamp - first) / self.speed - time.time()
+                        if delay > 0:
+                            self.stopping.wait(delay)
+                    self.write(data)
+                    self.records += 1
+        finally:
+            self.finished.set()
+
+    def write(self, data):
+        view = memoryview(data)
+        while view and self.running:
+            if not select.select([], [self.master], [], 0.1)[1]:
+                continue
+            try:
+                written = os.write(self.master, view.tobytes())
+            except OSError as e:
+                if e.errno == errno.EAGAIN:
+                    continue
+                raise
+            self.bytes += written
+            view = view[written:]
+
+
+def dump(path):
+    first = None
+    for timestamp, direction, data in read_capture(path):
+        if first is None:
+            first = timestamp
+        print "{:12.6f} {} {:5d}  {}".format(timestamp - first, DIRECTIONS.get(direction, '??'),
+                                            len(data), ' '.join('{:02x}'.format(ord(c)) for c in data))
+
+
+def bench(path, speed=0.0, repeat=1):
+    '''
+    Replay a capture through a pty into DoorControl.receive_packet, with no
+    hardware attached, and report how fast frames come out
+    '''
+    from door_control import DoorControl
+
+    expected = sum(len(data) for t, d, data in read_capture(path, (RX,))) * repeat
+    replayer = Replayer(path, speed, RX, repeat)
+    control = DoorControl(replayer.port, use_gpio=False)
+    control.set_timeout(0.1)
+    frames = 0
+    packet = []
+    start = time.time()
+    replayer.start()
+    while control.decoder.bytes < expected or control.received:
+        if control.receive_packet(packet) is True:
+            frames += 1
+            packet = []
+        elif replayer.finished.is_set() and not control.ser.inWaiting():
+            break
+    elapsed = time.time() - start
+    replayer.stop()
+
+    print "{:d} bytes, {:d} frames ({:d} rejected) in {:.3f} s".format(
+        control.decoder.bytes, frames, control.decoder.rejected, elapsed)
+    if elapsed > 0:
+        print "{:.0f} frames/s, {:.2f} MB/s".format(frames / elapsed, control.decoder.bytes / elapsed / 1e6)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Inspect and replay DoorControl bus captures.')
+    parser.add_argument("action", choices=['dump', 'replay', 'bench'])
+    parser.add_argument("log", help="Capture log file.")
+    parser.add_argument("-s", "--speed", type=float, default=None,
+                        help="Playback speed factor; 0 replays as fast as possible (default: 1 for replay, 0 for bench).")
+    parser.add_argument("--tx", action="store_true", help="Replay what the master sent instead of what it received.")
+    parser.add_argument("-r", "--repeat", type=int, default=1, help="Number of times to play the log.")
+    args = parser.parse_args()
+
+    try:
+        if args.action == 'dump':
+            dump(args.log)
+        elif args.action == 'bench':
+            bench(args.log, args.speed or 0.0, args.repeat)
+        else:
+            replayer = Replayer(args.log, 1.0 if args.speed is None else args.speed,
+                                TX if args.tx else RX, args.repeat)
+            print "Replaying {} on {} (Ctrl+C to stop)".format(args.log, replayer.port)
+            replayer.start()
+            try:
+                while not replayer.finished.wait(0.5):
+                    pass
+                print "{:d} records, {:d} bytes; keeping the pty open until Ctrl+C".format(
+                    replayer.records, replayer.bytes)
+                while True:
+                    time.sleep(1)
+            except KeyboardInterrupt:
+                pass
+            replayer.stop()
+    except (CaptureError, IOError), e:
+        print "ERROR:", e
@@ -14,6 +14,10 @@ Authors:
 from cmd import Cmd
 from cli_helper import *
 import door_control
+from bus_master import BusMaster
+from transport import DoorTransport, TransportError
+from framing import F_UNLOCK_DOOR, F_LOCK_DOOR
+import capture
 
 import os, subprocess, readline
 
@@ -21,7 +25,10 @@ Dir = os.path.realpath(os.path.dirname(__file__))
 
 historyFile = os.path.join(Dir, '.cli-history')
 
-control = door_control.DoorControl()
+# DOOR_PORT points the CLI at another port, e.g. the pty of emulator.py
+control = door_control.DoorControl(os.environ.get('DOOR_PORT', '/dev/ttyAMA0'))
+master = None
+transport = None
 
 
 class DebugCLI(Cmd):
@@ -38,8 +45,18 @@ class DebugCLI(Cmd):
         pass    
    
     def do_port(self, args):
-        control.set_port("/dev/tty" + args)
+        if args.startswith('/'):
+            control.set_port(args)
+        else:
+            control.set_port("/dev/tty" + args)
     
+    def do_rs485(self, args):
+        if not control.set_rs485(args.strip() != 'off'):
+            putMessage("Kernel RS-485 mode not supported on this port", '', severity.WARNING)
+
+    def help_rs485(self):
+        print "rs485 [on|off]: let the kernel switch the bus driver instead of the GPIO pin"
+
     def complete_port(self, text, line, start_index, end_index):
         ports = '/dev/ttyUSB0  /dev/ttyUSB1'.split()
         #ports = os.system('''ls /dev/ttyUSB*''').strip('''/''').split(' ')
@@ -52,59 +69,122 @@ class DebugCLI(Cmd):
             return ports
         
 
+    def get_master(self):
+        global master
+        if master is None:
+            master = BusMaster(control, [control.client_address])
+        return master
+
+    def do_clients(self, args):
+        addresses = [int(arg, 0) for arg in args.split()]
+        if not addresses:
+            print ' '.join(hex(address) for address in self.get_master().addresses)
+            return
+        control.set_address(addresses[0])
+        self.get_master().set_addresses(addresses)
+
+    def help_clients(self):
+        print "clients [addr ...]: set (or show) the client addresses polled by 'display'"
+
+    def get_transport(self):
+        global transport
+        if transport is None:
+            transport = DoorTransport(control, window=4, retry_nak=True)
+        return transport
+
+    def do_window(self, args):
+        if args:
+            self.get_transport().window = int(args) or None
+        print "window:", self.get_transport().window or 'unlimited'
+
+    def help_window(self):
+        print "window [n]: commands in flight per client for play/light (0: unlimited, 1: stop-and-wait)"
+
+    def wait_requests(self, requests):
+        for request in requests:
+            try:
+                request.result()
+            except TransportError, e:
+                putMessage(str(e), '', severity.ERROR)
+                continue
+            if request.nak():
+                print "ERROR: Packet NAKed"
+
+    def stop_transport(self):
+        # The transport's reader thread and the bus master both read the
+        # port, so only one of them may run at a time
+        if transport is not None:
+            transport.stop()
+
     def do_display(self, args):
+        interval = float(args) if args else 0.1
+        self.stop_transport()
+        bus = self.get_master()
         try:
-            packet = []
-            while 1:
-                print "get update"
-                control.get_update()
-                while 1:
-                    if control.receive_packet(packet):
-                        control.process_packet(packet)
-                        del packet[:]
-                        break
+            bus.run(interval=interval, callback=control.process_packet)
         except KeyboardInterrupt:
             pass
+        print bus.report()
+
+    def help_display(self):
+        print "display [interval]: poll every client, pausing 'interval' seconds between rounds"
+
+    def do_busstats(self, args):
+        print self.get_master().report()
+
+    def do_status(self, args):
+        if not control.status:
+            print "No status reports yet; run 'display' first"
+        for address in sorted(control.status):
+            print control.status[address]
+
+    def help_status(self):
+        print "status: door, latch and last card of every client, as merged from its status reports"
+
+    def do_capture(self, args):
+        if control.capture is not None:
+            control.capture.close()
+            putMessage("Captured {:d} records ({:d} bytes) to {}".format(
+                control.capture.records, control.capture.bytes, control.capture.path), '', severity.OK)
+            control.set_capture(None)
+        if args and args.strip() != 'off':
+            try:
+                control.set_capture(capture.CaptureWriter(args.strip()))
+            except (capture.CaptureError, IOError), e:
+                putMessage(str(e), '', severity.ERROR)
+
+    def help_capture(self):
+        print "capture FILE|off: append all bus traffic to a capture log (see capture.py)"
 
     def do_unlock(self, args):
         if args:
             duration = int(args)
         else:
             duration = 0
-        control.send_packet(function = 1, payload = [duration])
+        # through the transport: its reader thread writes ACKs to the same port
+        self.wait_requests([self.get_transport().request(control.client_address, F_UNLOCK_DOOR, [duration])])
 
     def do_lock(self, args):
-        control.send_packet(function = 2)
+        self.wait_requests([self.get_transport().request(control.client_address, F_LOCK_DOOR)])
  
     def do_play(self, args):
         #print args
-        tune = [60, 150]
-        if args == 'scale':
-            t=[48,50,52,53,55,57,59,60]
-            r=[21,21,21,21,21,21,21,12]
-        elif args == 'fanfare':
-            t=[34,34,32,34,38,40,38,40,43]  
-            r=[21,07,07,07,21,07,07,07,42]
-        elif args == 'birthday':
-            t=[54,54,56,54,59,58,00, 54,54,56,54,61,59,00, 54,54,66,63,59,58,56,00, 64,64,63,59,61,59]
-            r=[14,06,20,20,20,20,20, 14,06,20,20,20,20,20, 14,06,20,20,20,20,40,10, 14,06,20,20,23,17]
-        if control.send_packet(function=0x05, payload=t+r) == 1:
-            putMessage("Serial Port not set!", '', severity.ERROR)
-            return
-        packet = []
-        while 1:
-            value = control.receive_packet(packet)
-            if value == 1:
-                putMessage("Serial Port not set!", '', severity.ERROR)
-                return
-            while not value:
-                pass
-            if packet[3] == (0xAA or 0xAB):
-                if packet[3] == 0xAB:
-                    print "ERROR: Packet NAKed"
-                break
-            else:
-                del packet[:]
+        # several tunes are pipelined: play scale fanfare
+        commands = []
+        for name in args.split() or ['']:
+            t = [60]
+            r = [150]
+            if name == 'scale':
+                t=[48,50,52,53,55,57,59,60]
+                r=[21,21,21,21,21,21,21,12]
+            elif name == 'fanfare':
+                t=[34,34,32,34,38,40,38,40,43]  
+                r=[21,07,07,07,21,07,07,07,42]
+            elif name == 'birthday':
+                t=[54,54,56,54,59,58,00, 54,54,56,54,61,59,00, 54,54,66,63,59,58,56,00, 64,64,63,59,61,59]
+                r=[14,06,20,20,20,20,20, 14,06,20,20,20,20,20, 14,06,20,20,20,20,40,10, 14,06,20,20,23,17]
+            commands.append((0x05, t+r))
+        self.wait_requests(self.get_transport().request_many(control.client_address, commands))
 
     def complete_play(self, text, line, start_index, end_index):
         tunes = ['scale', 'fanfare', 'birthday', 'scale2']
@@ -131,7 +211,7 @@ class DebugCLI(Cmd):
         period = int(a[2])
         duration = int(a[3])
         state = [mode, color[0],color[1],color[2], period >> 8, period & 0xFF, duration>>8, duration&0xFF]
-        control.send_packet(function=0x08, payload=state)
+        self.wait_requests([self.get_transport().request(control.client_address, 0x08, state)])
 
     def completion(self, text, options):
         return [option for option in options
@@ -155,6 +235,9 @@ class DebugCLI(Cmd):
                 return options
 
     def do_exit(self, args):
+        self.stop_transport()
+        if control.capture is not None:
+            control.capture.close()
         readline.write_history_file(historyFile)
         exit(0)
 
@@ -2,41 +2,107 @@
 
 import time
 import serial
-import binascii
 import struct
 import sys
+import capture
+import status
+from collections import deque
 from CRC16 import CRC16
+from framing import FrameDecoder, FrameEncoder, B_FLAG, B_ESC, F_GET_UPDATE
 
-class DoorControl:
-    import RPi.GPIO as GPIO
-
-    GPIO.setmode(GPIO.BCM)
+try:
+    import RPi.GPIO
+except (ImportError, RuntimeError):
+    # Not on a Raspberry Pi, e.g. talking to emulator.py over a pty
+    RPi = None
 
+class DoorControl:
     rw_pin = 18
-    GPIO.setup(rw_pin, GPIO.OUT)
-    GPIO.output(rw_pin, GPIO.LOW)
+    GPIO = None
     
     checker = CRC16(modbus_flag = True)
 
-    b_flag = 0x7E
-    b_esc = 0x7D
+    b_flag = B_FLAG
+    b_esc = B_ESC
+    header_length = 5       # transaction ID, from, to, function, length
+    crc_length = 2
     ACK_wait = False
-    escaping = False
     client_address = 0x01
     trans_ID = 0x10
-    ser = serial.Serial('/dev/ttyAMA0', 9600)
+    baudrate = 9600
+    read_timeout = None
+    rs485_mode = False
+    capture = None
+    delta_status = True     # poll for changed fields only (see status.py)
+    ser = None
     
-    def __init__(self):
+    def __init__(self, port='/dev/ttyAMA0', use_gpio=True):
+        # The port and the driver pin are set up here rather than when the
+        # module is imported, so DoorControl can run without the hardware:
+        # DoorControl('/dev/pts/3', use_gpio=False) talks to the emulator
+        if use_gpio and RPi is not None:
+            self.GPIO = RPi.GPIO
+            self.GPIO.setmode(self.GPIO.BCM)
+            self.GPIO.setup(self.rw_pin, self.GPIO.OUT)
+            self.GPIO.output(self.rw_pin, self.GPIO.LOW)
+        self.decoder = FrameDecoder(validate=self.check_CRC)
+        self.encoder = FrameEncoder(crc=self.checker.calculate)
+        self.received = deque()
+        self.bytes_sent = 0
+        self.status = {}
+        if port:
+            try:
+                self.set_port(port)
+            except serial.SerialException, e:
+                print "Could not open {}: {}".format(port, e)
         self.set_driver('input');
 
     def set_port(self, port):
-        self.ser = serial.Serial(port, 9600)
+        self.ser = serial.Serial(port, self.baudrate, timeout=self.read_timeout)
+        self.decoder.reset()
+        self.received.clear()
+        if self.rs485_mode:
+            self.set_rs485(True)
+
+    def set_rs485(self, enabled=True):
+        # Let the kernel switch the transceiver with RTS (TIOCSRS485) instead
+        # of toggling rw_pin around every write. Only works where the UART
+        # driver supports it and DE/RE is wired to RTS; returns False otherwise.
+        try:
+            import serial.rs485
+            self.ser.rs485_mode = serial.rs485.RS485Settings() if enabled else None
+        except (ImportError, AttributeError, ValueError, IOError):
+            self.rs485_mode = False
+            return False
+        self.rs485_mode = enabled
+        return True
+
+    def set_capture(self, writer):
+        # Record every chunk written to and read from the port, e.g. to a
+        # capture.CaptureWriter; None stops recording
+        self.capture = writer
+
+    def set_timeout(self, timeout):
+        # None blocks reads until a byte arrives; a number of seconds lets
+        # callers such as the bus master give up on a silent client
+        self.read_timeout = timeout
+        if self.ser is not None:
+            self.ser.timeout = timeout
 
     def check_CRC(self, packet):
-        return True
+        if len(packet) < self.header_length + self.crc_length:
+            return False
+        if packet[4] != len(packet) - self.header_length - self.crc_length:
+            return False
+        crc = (packet[-2] << 8) | packet[-1]
+        return self.compute_CRC(packet[:-2]) == crc
 
     def set_address(self, addr):
-        client_address = addr
+        self.client_address = addr
+
+    def next_trans_ID(self):
+        self.trans_ID = (self.trans_ID + 1) & 0xFF
+        return self.trans_ID
 
     def find_port(self):
         pass
@@ -56,8 +122,7 @@ class DoorControl:
         str1 = ''.join(str(e) for e in packet)
         print str1
         print "Calculated CRC:",
-        #print(self.checker.calculate(str1))
-        print self.compute_CRC(packet, length -2)
+        print hex(self.compute_CRC(packet[:-2]))
         if not length == len(packet):
             print "ERROR: Packet length incorrect"
         if not self.check_CRC(packet):
@@ -74,7 +139,7 @@ class DoorControl:
         to_address = packet[2]
         function = packet[3]
         crc = packet[-2:]
-        payload = packet[4:-2]
+        payload = packet[5:-2]
         if function < 0x0A:
             print function
 
@@ -82,91 +147,105 @@ class DoorControl:
 
             
 
-    def compute_CRC(self, data, length):
-        crc = 0xFFFF
-
-        pos = 0
-        while (pos < length):
-            crc ^= data[pos]
+    def compute_CRC(self, data):
+        # Modbus CRC16 over the unescaped header and payload, as the clients compute it
+        return self.checker.calculate(bytearray(data))
 
-            i = 8
-            while not i == 0:
-                if (crc & 0x0001) !=0:
-                    crc >>= 1;
-                    crc^= 0xA001
-                else:
-                    crc >>=1
-                i -= 1
-            pos += 1
-        return crc
+    def char_time(self):
+        # Seconds one character spends on the wire: start bit, data bits,
+        # parity bit and stop bits
+        parity = 0 if self.ser.parity == serial.PARITY_NONE else 1
+        bits = 1 + self.ser.bytesize + parity + self.ser.stopbits
+        return bits / float(self.ser.baudrate)
 
     def set_driver(self, mode):
+        if self.rs485_mode or self.GPIO is None:
+            return
         if mode == 'output':
             self.GPIO.output(self.rw_pin, self.GPIO.LOW)
-            time.sleep(0.01)
         elif mode == 'input':
-            time.sleep(0.02)
+            # flush() blocks in tcdrain() until the kernel has handed every
+            # byte to the UART; wait one more character time for the last
+            # one to leave the shift register before releasing the bus
+            try:
+                self.ser.flush()
+                time.sleep(self.char_time())
+            except AttributeError:
+                pass
             self.GPIO.output(self.rw_pin, self.GPIO.HIGH)
 
-    def send_packet(self, from_addr=0x00, to_addr=client_address, function=0x00, payload=[]):
-        length = len(payload)
-        data = ''
+    def send_packet(self, from_addr=0x00, to_addr=None, function=0x00, payload=[], trans_ID=None):
+        # Every new command gets a fresh transaction ID; the clients ignore a
+        # repeated ID as a retransmission. Pass trans_ID to resend or ACK.
+        if to_addr is None:
+            to_addr = self.client_address
+        if trans_ID is None:
+            trans_ID = self.next_trans_ID()
+        return self.write(self.encoder.encode(trans_ID, from_addr, to_addr, function, payload))
+
+    def send_packets(self, commands, from_addr=0x00):
+        # Send several commands in one write, e.g. [(addr, function, payload), ...]
+        # Returns the transaction IDs assigned to them, or 1 if the port is not set
+        trans_IDs = []
+        frames = []
+        for to_addr, function, payload in commands:
+            trans_IDs.append(self.next_trans_ID())
+            frames.append((trans_IDs[-1], from_addr, to_addr, function, payload))
+        if self.write(self.encoder.encode_many(frames)) == 1:
+            return 1
+        return trans_IDs
+
+    def write(self, data):
         self.set_driver('output');
-        for byte in payload:
-            if byte == self.b_flag or byte == self.b_esc:
-                data = data + chr(self.b_esc)
-            data = data + chr(byte)
-        packet = chr(self.b_flag) + chr(self.trans_ID) +  chr(from_addr) + chr(to_addr) + chr(function) + chr(length) +  data + chr(0xFF) + chr(0xFF)  + chr(self.b_flag)
         try:
-            self.ser.write(packet)
+            self.ser.write(data)
         except AttributeError:
             self.set_driver('input')
             return 1
+        self.bytes_sent += len(data)
+        if self.capture is not None:
+            self.capture.write(capture.TX, data)
         self.set_driver('input')
         return 0
 
-    def get_update(self):
-        self.send_packet(function=0x0A)
+    def client_status(self, address):
+        if address not in self.status:
+            self.status[address] = status.ClientStatus(address)
+        return self.status[address]
+
+    def update_payload(self, address):
+        # Ask for the fields that changed since the last report, or for all
+        # of them when a report was missed or delta polling is off
+        if not self.delta_status:
+            return [status.UPDATE_RESYNC]
+        return self.client_status(address).poll_payload()
+
+    def get_update(self, to_addr=None):
+        if to_addr is None:
+            to_addr = self.client_address
+        return self.send_packet(to_addr=to_addr, function=F_GET_UPDATE, payload=self.update_payload(to_addr))
+
+    def apply_status(self, packet):
+        # Merge a client's answer to get_update() into self.status
+        return self.client_status(packet[1]).apply(packet)
+
+    def read_frames(self):
+        # Pull everything the port has buffered (blocking for at least one
+        # byte) and return the complete, CRC-checked frames found so far
+        data = self.ser.read(self.ser.inWaiting() or 1)
+        if data and self.capture is not None:
+            self.capture.write(capture.RX, data)
+        return self.decoder.feed(data)
 
     def receive_packet(self, packet):
-        try:
-            byte = int(binascii.b2a_hex(self.ser.read()), 16)
-        except AttributeError:
-            return 1
-        if (byte == self.b_esc) and (not self.escaping):
-            self.escaping = True;
-        elif byte == (self.b_flag) and (not self.escaping):
-            if packet:
-                return True
-                #self.process_packet(packet)
-        else:
-            packet.append(byte)
-            print "received:", byte
-            self.escaping = False
+        if not self.received:
+            try:
+                self.received.extend(self.read_frames())
+            except AttributeError:
+                return 1
+        if not self.received:
             return False
-
-    def CRC16(self, Output):
-        crc = 0xFFFF 
-        l = len(Output)
-        i = 0
-        while i < l:
-            j = 0
-            crc = crc ^ ord(Output[i])
-            while j < 8:
-                if (crc & 0x1):
-                    mask = 0xA001
-                else:
-                    mask = 0x00
-                crc = ((crc >> 1) & 0x7FFF) ^ mask
-                j += 1
-            i += 1
-        if crc < 0:
-            crc -= 256
-        print Output + chr(crc % 256) + chr(crc / 256)
-
-
+        packet.extend(self.received.popleft())
+        return True
 
     #GPIO.cleanup()
-if __name__ == '__main__':
-    test = DoorControl()
-    print test.CRC16(1234)
@@ -0,0 +1,371 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+MakeICT/Bluebird Arthouse Electronic Door Entry
+
+emulator.py: Door client firmware emulator on a pseudo-terminal
+Usage: emulator.py [-n clients] [--latency ms] [--drop p] [--corrupt p] [--nak p]
+       emulator.py --bench seconds [...]
+
+Any number of virtual clients answer the master on one pty the way the
+firmware does (driver/src/superserial.cpp, driver.ino): every valid command
+addressed to a client is ACKed with its transaction ID, a repeated
+transaction ID is ACKed and ignored, broadcasts are processed silently, and
+frames a client sends on its own are retried until the master ACKs them.
+Latency, lost commands, corrupted replies and NAKs can be injected to
+exercise the master's timeouts and retries.
+
+Status polls (F_GET_UPDATE with a payload) are answered with delta status
+reports (see status.py) unless --legacy is given, in which case the
+clients only ACK them like the current firmware.
+
+Point DoorControl at the printed port, e.g.
+  DOOR_PORT=/dev/pts/3 ./cli.py
+or DoorControl('/dev/pts/3', use_gpio=False) from a script.
+
+Authors:
+	Dominic Canare <dom@greenlightgo.org>
+	Rye Kennedy <ryekennedy@gmail.com>
+	Christian Kindel <iceman81292@gmail.com>
+'''
+
+import argparse, os, random, select, threading, time, tty
+from CRC16 import CRC16
+from framing import *
+from status import *
+
+class VirtualClient(object):
+    def __init__(self, address):
+        self.address = address
+        self.trans_ID = 0           # shared by received and sent frames, as in the firmware
+        self.locked = True
+        self.unlocked_until = None
+        self.door_open = False
+        self.tune = None
+        self.lights = None
+        self.pending = None         # unsolicited frame waiting for its ACK
+        self.events = []
+        self.last_card = None
+        self.seq = 0                # status report sequence number
+        self.changed = 0            # STATUS_* fields changed since the last report
+        self.last_reply = (F_ACK, [])
+        self.attempts = 0
+        self.next_send = 0
+        # counters
+        self.commands = 0
+        self.duplicates = 0
+        self.acks = 0
+        self.naks = 0
+        self.dropped = 0
+        self.corrupted = 0
+        self.sent = 0
+        self.expired = 0
+
+    def handle(self, function, payload):
+        '''
+        Apply a command. Returns False if it should be NAKed.
+        '''
+        if function == F_UNLOCK_DOOR:
+            if len(payload) not in (1, 2):
+                return False
+            duration = payload[0] << 8 | payload[1] if len(payload) == 2 else payload[0]
+            if not self.door_open:
+                self.set_locked(False)
+                self.unlocked_until = time.time() + duration if duration else None
+        elif function == F_LOCK_DOOR:
+            self.set_locked(True)
+            self.unlocked_until = None
+        elif function == F_PLAY_TUNE:
+            if len(payload) % 2:
+                return False
+            half = len(payload) // 2
+            self.tune = (list(payload[:half]), list(payload[half:]))
+        elif function == F_SET_LIGHTS:
+            if len(payload) < 8:
+                return False
+            self.lights = list(payload)
+        elif function == F_SET_CONFIG:
+            if len(payload) >= 2 and payload[0] == 0x00:
+                self.address = payload[1]
+        return True
+
+    def update(self, now):
+        if self.unlocked_until is not None and now >= self.unlocked_until:
+            self.set_locked(True)
+            self.unlocked_until = None
+
+    def set_locked(self, locked):
+        if locked != self.locked:
+            self.changed |= STATUS_LATCH
+        self.locked = locked
+
+    def set_door(self, door_open):
+        if door_open != self.door_open:
+            self.changed |= STATUS_DOOR
+        self.door_open = door_open
+
+    def set_card(self, uid):
+        self.last_card = uid
+        self.changed |= STATUS_CARD
+
+    def status_report(self, request):
+        '''The F_STATUS payload answering a status poll'''
+        if request & UPDATE_RESYNC:
+            mask = STATUS_FULL | STATUS_ALL
+        else:
+            mask = self.changed
+            if mask:
+                self.seq = (self.seq + 1) & 0xFF
+        self.changed = 0
+        return encode_status(self.seq, mask, self.door_open, not self.locked, self.last_card)
+
+    def queue_event(self, function, payload=[]):
+        self.events.append((function, list(payload)))
+
+
+class Emulator(object):
+    def __init__(self, addresses=[0x01], latency=0.0, jitter=0.0, drop=0.0, corrupt=0.0, nak=0.0,
+                 baudrate=None, retry_interval=0.25, retries=5, seed=None, legacy=False):
+        '''
+        Args:
+          addresses (list of ints): one virtual client per address
+          latency (float, optional): seconds each client takes to answer
+          jitter (float, optional): random extra latency, up to this many seconds
+          drop (float, optional): probability a command is lost before the client sees it
+          corrupt (float, optional): probability a reply is sent with a bad CRC
+          nak (float, optional): probability a command is NAKed
+          baudrate (int, optional): pace replies as if sent at this rate (8N1)
+          retry_interval (float, optional): seconds between resends of an unACKed event
+          retries (int, optional): resends of an event before it is given up
+          seed (optional): seed for the error injection
+          legacy (bool, optional): ACK status polls instead of reporting status
+        '''
+        self.clients = dict((address, VirtualClient(address)) for address in addresses)
+        self.latency = latency
+        self.jitter = jitter
+        self.drop = drop
+        self.corrupt = corrupt
+        self.nak = nak
+        self.baudrate = baudrate
+        self.retry_interval = retry_interval
+        self.retries = retries
+        self.random = random.Random(seed)
+        self.legacy = legacy
+        self.checker = CRC16(modbus_flag = True)
+        self.decoder = FrameDecoder(validate=self.check_CRC)
+        self.encoder = FrameEncoder(crc=self.checker.calculate)
+        self.bad_encoder = FrameEncoder(crc=lambda raw: self.checker.calculate(raw) ^ 0x0001)
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        self.write_lock = threading.Lock()
+        self.thread = None
+        self.running = False
+        self.bytes_sent = 0
+
+    def check_CRC(self, frame):
+        if len(frame) < 7 or frame[4] != len(frame) - 7:
+            return False
+        return self.checker.calculate(frame[:-2]) == (frame[-2] << 8 | frame[-1])
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='door-emulator')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        os.close(self.master)
+        os.close(self.slave)
+
+    def client(self, address):
+        for client in self.clients.values():
+            if client.address == address:
+                return client
+        return None
+
+    def card(self, address, uid):
+        '''A card is held to a client's reader'''
+        uid = list(uid)[:7] + [0] * (7 - len(uid))
+        client = self.client(address)
+        client.set_card(uid)
+        client.queue_event(F_SEND_ID, uid)
+
+    def door(self, address, door_open):
+        '''A client's door sensor changes'''
+        client = self.client(address)
+        client.set_door(door_open)
+        client.queue_event(F_DOOR_STATE, [1 if door_open else 0])
+
+    def doorbell(self, address):
+        self.client(address).queue_event(F_DOOR_BELL)
+
+    def run(self):
+        while self.running:
+            readable = select.select([self.master], [], [], 0.01)[0]
+            if readable:
+                try:
+                    data = os.read(self.master, 4096)
+                except OSError:
+                    break
+                for frame in self.decoder.feed(data):
+                    self.dispatch(frame)
+            self.send_events()
+
+    def dispatch(self, frame):
+        trans_ID, from_addr, to_addr, function = frame[0], frame[1], frame[2], frame[3]
+        payload = frame[5:-2]
+        if to_addr == ADDR_BROADCAST:
+            for client in self.clients.values():
+                client.handle(function, payload)
+            return
+        client = self.client(to_addr)
+        if client is None:
+            return
+        if function == F_ACK:
+            if client.pending is not None and trans_ID == client.trans_ID:
+                client.pending = None
+                client.acks += 1
+            return
+        if self.drop and self.random.random() < self.drop:
+            client.dropped += 1
+            return
+        client.commands += 1
+        self.wait()
+        if trans_ID == client.trans_ID:
+            # a resend of the last command: answer it again, don't repeat it
+            client.duplicates += 1
+            self.reply(client, trans_ID, *client.last_reply)
+            return
+        client.trans_ID = trans_ID
+        if self.nak and self.random.random() < self.nak or not client.handle(function, payload):
+            client.naks += 1
+            client.last_reply = (F_NAK, [])
+        elif function == F_GET_UPDATE and payload and not self.legacy:
+            client.update(time.time())
+            client.last_reply = (F_STATUS, client.status_report(payload[0]))
+        else:
+            client.update(time.time())
+            client.last_reply = (F_ACK, [])
+        self.reply(client, trans_ID, *client.last_reply)
+
+    def send_events(self):
+        now = time.time()
+        for client in self.clients.values():
+            client.update(now)
+            if client.pending is None and client.events:
+                client.trans_ID = (client.trans_ID + 1) % 255
+                client.pending = client.events.pop(0)
+                client.attempts = 0
+                client.next_send = now
+            if client.pending is None or now < client.next_send:
+                continue
+            if client.attempts > self.retries:
+                client.pending = None
+                client.expired += 1
+                continue
+            client.attempts += 1
+            client.next_send = now + self.retry_interval
+            function, payload = client.pending
+            self.reply(client, client.trans_ID, function, payload)
+
+    def wait(self):
+        if self.latency or self.jitter:
+            time.sleep(self.latency + self.random.random() * self.jitter)
+
+    def reply(self, client, trans_ID, function, payload=[]):
+        with self.write_lock:
+            encoder = self.encoder
+            if self.corrupt and self.random.random() < self.corrupt:
+                encoder = self.bad_encoder
+                client.corrupted += 1
+            data = encoder.encode(trans_ID, client.address, ADDR_MASTER, function, payload)
+            if self.baudrate:
+                time.sleep(len(data) * 10.0 / self.baudrate)
+            try:
+                os.write(self.master, bytes(data))
+            except OSError:
+                return
+            self.bytes_sent += len(data)
+            client.sent += 1
+
+    def report(self):
+        lines = ["{:>6s}{:>8s}{:>8s}{:>8s}{:>8s}{:>8s}{:>8s}{:>8s}".format(
+            'addr', 'cmds', 'dups', 'naks', 'drop', 'corrupt', 'acked', 'expired')]
+        for address in sorted(self.clients):
+            c = self.clients[address]
+            lines.append("{:>6s}{:>8d}{:>8d}{:>8d}{:>8d}{:>8d}{:>8d}{:>8d}".format(
+                hex(c.address), c.commands, c.duplicates, c.naks, c.dropped, c.corrupted,
+                c.acks, c.expired))
+        return '\n'.join(lines)
+
+
+def bench(emulator, duration, full_status=False):
+    '''
+    Drive the emulated clients with BusMaster through DoorControl for
+    `duration` seconds and report latency, retries and bus utilization.
+    '''
+    from door_control import DoorControl
+    from bus_master import BusMaster
+
+    control = DoorControl(emulator.port, use_gpio=False)
+    control.delta_status = not full_status
+    if emulator.baudrate:
+        control.baudrate = emulator.baudrate
+    addresses = sorted(emulator.clients)
+    master = BusMaster(control, addresses)
+    end = time.time() + duration
+    rounds = 0
+    while time.time() < end:
+        for address in addresses:
+            if rounds % 10 == 0:
+                master.unlock(address, 5)
+            if rounds % 25 == 0:
+                master.queue_command(address, F_PLAY_TUNE, [60, 150])
+            if rounds % 20 == 5:
+                emulator.card(address, [0x04, 0x12, 0x34, 0x56, 0x78, 0x9A, rounds & 0xFF])
+            if rounds % 7 == 3:
+                emulator.door(address, not emulator.client(address).door_open)
+        master.run(duration=min(0.5, max(end - time.time(), 0.01)))
+        rounds += 1
+    print master.report()
+    print "(utilization is relative to {:d} baud; the pty itself is not rate limited)".format(control.baudrate)
+    print "{:d} unsolicited frames received".format(len(master.events))
+    for address in addresses:
+        client = control.client_status(address)
+        print "{} ({:d} reports, {:d} resyncs)".format(client, client.reports, client.resyncs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Emulate door clients on a pseudo-terminal.')
+    parser.add_argument("-n", "--clients", type=int, default=1, help="Number of clients (addresses 1..n).")
+    parser.add_argument("-l", "--latency", type=float, default=0.0, help="Reply latency, in ms.")
+    parser.add_argument("-j", "--jitter", type=float, default=0.0, help="Random extra latency, up to this many ms.")
+    parser.add_argument("--drop", type=float, default=0.0, help="Probability a command is lost.")
+    parser.add_argument("--corrupt", type=float, default=0.0, help="Probability a reply has a bad CRC.")
+    parser.add_argument("--nak", type=float, default=0.0, help="Probability a command is NAKed.")
+    parser.add_argument("-b", "--baudrate", type=int, help="Pace replies as if sent at this baud rate.")
+    parser.add_argument("--seed", type=int, help="Seed for the error injection.")
+    parser.add_argument("--legacy", action="store_true", help="ACK status polls like the current firmware.")
+    parser.add_argument("--bench", type=float, metavar="SECONDS", help="Run the bus master against the clients and report.")
+    parser.add_argument("--full-status", action="store_true", help="With --bench, poll for full status every time.")
+    args = parser.parse_args()
+
+    emulator = Emulator(range(1, args.clients + 1), args.latency / 1000.0, args.jitter / 1000.0,
+                        args.drop, args.corrupt, args.nak, args.baudrate, seed=args.seed, legacy=args.legacy)
+    emulator.start()
+    try:
+        if args.bench:
+            bench(emulator, args.bench, args.full_status)
+        else:
+            print "Emulating {:d} client(s) on {} (Ctrl+C to stop)".format(args.clients, emulator.port)
+            while True:
+                time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    print emulator.report()
+    emulator.stop()
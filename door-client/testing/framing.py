@@ -0,0 +1,192 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+MakeICT/Bluebird Arthouse Electronic Door Entry
+
+framing.py: Framing and function codes for the RS-485 link between the master and
+the door clients
+
+Frames are delimited by a flag byte (0x7E). Inside a frame an escape byte
+(0x7D) makes the byte that follows it literal, so flags and escapes can be
+carried in the header, payload and CRC.
+
+Authors:
+	Dominic Canare <dom@greenlightgo.org>
+	Rye Kennedy <ryekennedy@gmail.com>
+	Christian Kindel <iceman81292@gmail.com>
+'''
+
+B_FLAG = 0x7E
+B_ESC = 0x7D
+
+# Function codes (see driver/src/superserial.h)
+F_SET_CONFIG = 0x00
+F_UNLOCK_DOOR = 0x01
+F_LOCK_DOOR = 0x02
+F_SEND_ID = 0x03
+F_SET_LCD = 0x04
+F_PLAY_TUNE = 0x05
+F_ALARM_BUTTON = 0x06
+F_DOOR_STATE = 0x07
+F_SET_LIGHTS = 0x08
+F_STATUS = 0x09         # delta status report, see status.py
+F_GET_UPDATE = 0x0A
+F_NOP = 0x0B
+F_DENY_CARD = 0x0C
+F_DOOR_BELL = 0x0D
+F_CLIENT_START = 0x0E
+F_ACK = 0xAA
+F_NAK = 0xAB
+F_HEARTBEAT = 0xCC
+
+# Reserved addresses
+ADDR_MASTER = 0x00
+ADDR_BROADCAST = 0xFF
+
+class FrameEncoder(object):
+    '''
+    Builds escaped frames.
+
+    Every field -- header, payload and CRC -- is escaped. Escaping is done
+    with two C-level bytearray.replace() passes, and only when a flag or
+    escape byte is present. The scratch and output buffers are reused
+    between calls, so the bytearray returned by encode() is only valid
+    until the next call.
+    '''
+    def __init__(self, crc, flag=B_FLAG, esc=B_ESC):
+        '''
+        Args:
+          crc (function): computes the 16 bit CRC of a bytearray
+        '''
+        self.crc = crc
+        self._flag = bytearray([flag])
+        self._esc = bytearray([esc])
+        self._escaped_flag = bytearray([esc, flag])
+        self._escaped_esc = bytearray([esc, esc])
+        self.raw = bytearray()
+        self.out = bytearray()
+
+    def append(self, out, trans_ID, from_addr, to_addr, function, payload=()):
+        '''
+        Append one escaped, flag-delimited frame to `out`
+        '''
+        raw = self.raw
+        del raw[:]
+        raw.append(trans_ID)
+        raw.append(from_addr)
+        raw.append(to_addr)
+        raw.append(function)
+        raw.append(len(payload))
+        raw.extend(payload)
+        crc = self.crc(raw)
+        raw.append(crc >> 8)
+        raw.append(crc & 0xFF)
+
+        out += self._flag
+        if self._esc in raw:
+            raw = raw.replace(self._esc, self._escaped_esc)
+        if self._flag in raw:
+            raw = raw.replace(self._flag, self._escaped_flag)
+        out += raw
+        out += self._flag
+        return out
+
+    def encode(self, trans_ID, from_addr, to_addr, function, payload=()):
+        out = self.out
+        del out[:]
+        return self.append(out, trans_ID, from_addr, to_addr, function, payload)
+
+    def encode_many(self, frames):
+        '''
+        Encode several frames back to back into one buffer, for a single write.
+
+        Args:
+          frames: iterable of (trans_ID, from_addr, to_addr, function, payload)
+        '''
+        out = self.out
+        del out[:]
+        for frame in frames:
+            self.append(out, *frame)
+        return out
+
+
+class FrameDecoder(object):
+    '''
+    Incremental deframer.
+
+    Raw bytes are fed in whatever chunks the serial port hands over, and
+    complete unescaped frames come back out. A partial frame is kept
+    until the rest of it arrives. Frames rejected by `validate` (e.g. a
+    CRC check) are counted and dropped.
+    '''
+    def __init__(self, validate=None, flag=B_FLAG, esc=B_ESC):
+        self.validate = validate
+        self.flag = flag
+        self.esc = esc
+        self._flag = bytearray([flag])
+        self._esc = bytearray([esc])
+        self.buffer = bytearray()
+        self.bytes = 0
+        self.frames = 0
+        self.rejected = 0
+
+    def reset(self):
+        del self.buffer[:]
+
+    def unescape(self, raw):
+        if self._esc not in raw:
+            return raw
+        out = bytearray()
+        i = 0
+        n = len(raw)
+        while i < n:
+            j = raw.find(self._esc, i)
+            if j < 0:
+                out += raw[i:]
+                break
+            out += raw[i:j]
+            out += raw[j + 1:j + 2]
+            i = j + 2
+        return out
+
+    def feed(self, data):
+        '''
+        Add raw bytes from the bus.
+
+        Returns:
+          a list of complete frames (bytearrays, without flags or escapes)
+        '''
+        buf = self.buffer
+        buf += data
+        self.bytes += len(data)
+        frames = []
+        start = pos = 0
+        while True:
+            end = buf.find(self._flag, pos)
+            if end < 0:
+                break
+            # a flag preceded by an odd run of escapes is part of the data
+            k = end
+            while k > start and buf[k - 1] == self.esc:
+                k -= 1
+            if (end - k) & 1:
+                pos = end + 1
+                continue
+            if end > start:
+                frame = self.unescape(buf[start:end])
+                if self.validate is None or self.validate(frame):
+                    self.frames += 1
+                    frames.append(frame)
+                else:
+                    self.rejected += 1
+            start = pos = end + 1
+        del buf[:start]
+        return frames
+
+    def decode(self, chunks):
+        '''
+        Generator yielding every complete frame found in an iterable of raw chunks
+        '''
+        for chunk in chunks:
+            for frame in self.feed(chunk):
+                yield frame
@@ -0,0 +1,150 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+MakeICT/Bluebird Arthouse Electronic Door Entry
+
+status.py: Delta-encoded client status (function 0x09)
+
+The master polls with F_GET_UPDATE and a one byte payload: UPDATE_DELTA asks
+for the fields that changed since the client's last report, UPDATE_RESYNC for
+all of them. A client that knows the extension answers with an F_STATUS frame
+(same transaction ID) instead of a plain ACK:
+
+    seq, mask, [door], [latch], [card x 7]
+
+Only the fields whose bit is set in mask follow, in bit order. seq goes up
+by one with every report that carries changes; a report without changes
+repeats the last seq. STATUS_FULL in mask marks a complete report, which
+carries the current seq. When the master sees any other seq it has missed a
+report and asks for a resync.
+
+Clients without the extension ACK the poll as before and are polled the
+old way.
+
+Authors:
+	Dominic Canare <dom@greenlightgo.org>
+	Rye Kennedy <ryekennedy@gmail.com>
+	Christian Kindel <iceman81292@gmail.com>
+'''
+
+import time
+from framing import F_STATUS, F_ACK
+
+UPDATE_DELTA = 0x01
+UPDATE_RESYNC = 0x02
+
+STATUS_DOOR = 0x01      # door sensor: 1 open, 0 closed
+STATUS_LATCH = 0x02     # latch: 1 unlocked, 0 locked
+STATUS_CARD = 0x04      # last card seen: 7 byte UID
+STATUS_FULL = 0x80
+STATUS_ALL = STATUS_DOOR | STATUS_LATCH | STATUS_CARD
+
+CARD_LENGTH = 7
+
+def encode_status(seq, mask, door_open=False, unlocked=False, card=None):
+    '''
+    Returns:
+      the F_STATUS payload carrying the fields in mask
+    '''
+    payload = [seq & 0xFF, mask]
+    if mask & STATUS_DOOR:
+        payload.append(1 if door_open else 0)
+    if mask & STATUS_LATCH:
+        payload.append(1 if unlocked else 0)
+    if mask & STATUS_CARD:
+        card = list(card or [])[:CARD_LENGTH]
+        payload.extend(card + [0] * (CARD_LENGTH - len(card)))
+    return payload
+
+def decode_status(payload):
+    '''
+    Returns:
+      (seq, mask, fields) where fields maps 'door_open', 'unlocked' and
+      'card' to the values present in the report
+    Raises:
+      ValueError if the payload is shorter than its mask says
+    '''
+    if len(payload) < 2:
+        raise ValueError("Status report too short")
+    seq, mask = payload[0], payload[1]
+    fields = {}
+    i = 2
+    if mask & STATUS_DOOR:
+        fields['door_open'] = bool(payload[i])
+        i += 1
+    if mask & STATUS_LATCH:
+        fields['unlocked'] = bool(payload[i])
+        i += 1
+    if mask & STATUS_CARD:
+        fields['card'] = list(payload[i:i + CARD_LENGTH])
+        i += CARD_LENGTH
+    if i > len(payload):
+        raise ValueError("Status report shorter than its mask")
+    return seq, mask, fields
+
+
+class ClientStatus(object):
+    '''
+    The master's merged view of one client's status
+    '''
+    def __init__(self, address):
+        self.address = address
+        self.door_open = None
+        self.unlocked = None
+        self.card = None
+        self.seq = None
+        self.synced = False
+        self.legacy = False         # client ACKs polls instead of reporting status
+        self.updated = None
+        self.reports = 0
+        self.changes = 0
+        self.resyncs = 0
+
+    def poll_payload(self):
+        return [UPDATE_DELTA] if self.synced else [UPDATE_RESYNC]
+
+    def apply(self, frame):
+        '''
+        Merge the response to a status poll.
+
+        Returns:
+          False if a report was missed (the next poll asks for a resync),
+          True otherwise
+        '''
+        if frame[3] == F_ACK:
+            self.legacy = True
+            return True
+        if frame[3] != F_STATUS:
+            return True
+        try:
+            seq, mask, fields = decode_status(frame[5:-2])
+        except ValueError:
+            self.synced = False
+            return False
+        self.legacy = False
+        self.reports += 1
+        if mask & STATUS_FULL:
+            self.resyncs += 1
+        elif not self.synced or seq != ((self.seq + 1) & 0xFF if mask else self.seq):
+            self.synced = False
+            return False
+        for name, value in fields.items():
+            setattr(self, name, value)
+        if mask & STATUS_ALL:
+            self.changes += 1
+        self.seq = seq
+        self.synced = True
+        self.updated = time.time()
+        return True
+
+    def __str__(self):
+        if self.legacy:
+            return "{:#x}: no status reports (legacy firmware)".format(self.address)
+        if self.seq is None:
+            return "{:#x}: unknown".format(self.address)
+        state = lambda value, yes, no: '?' if value is None else (yes if value else no)
+        return "{:#x}: door {}, latch {}, last card {} (seq {:d}{})".format(
+            self.address, state(self.door_open, 'open', 'closed'),
+            state(self.unlocked, 'unlocked', 'locked'),
+            ' '.join('{:02x}'.format(b) for b in self.card) if self.card else '-',
+            self.seq, '' if self.synced else ', resync pending')
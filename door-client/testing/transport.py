@@ -0,0 +1,303 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+MakeICT/Bluebird Arthouse Electronic Door Entry
+
+transport.py: Request/response transport for DoorControl
+
+A background thread owns the read side of the port. Requests are matched to
+their responses by client address, transaction ID and function, resent on a timeout
+and failed after the last retry, so callers wait on a Request instead of
+spinning on receive_packet(). Frames a client sends on its own (card reads,
+door state, doorbell) are ACKed and handed to subscribers.
+
+With a window, at most that many requests per client are on the bus at
+once; the rest wait in a per-client queue and go out as answers come back,
+several frames to a write. A NAK or timeout resends only the request it
+belongs to, under its original transaction ID. The firmware only remembers
+the last transaction ID it accepted, so a resend whose first copy did
+arrive (only the ACK was lost) can run twice once a later command got
+through; keep windowed traffic to commands that are safe to repeat, such
+as tunes and light patterns.
+
+Authors:
+	Dominic Canare <dom@greenlightgo.org>
+	Rye Kennedy <ryekennedy@gmail.com>
+	Christian Kindel <iceman81292@gmail.com>
+'''
+
+import threading, time
+from framing import *
+
+class TransportError(Exception):
+    pass
+
+class TransportTimeout(TransportError):
+    pass
+
+class Request(object):
+    '''
+    A command waiting for its ACK/NAK or reply. Behaves like a future:
+    result() blocks until the response arrives or the request fails.
+    '''
+    def __init__(self, address, function, payload, trans_ID):
+        self.address = address
+        self.function = function
+        self.payload = list(payload)
+        self.trans_ID = trans_ID
+        self.attempts = 0
+        self.naks = 0
+        self.sent = None
+        self.deadline = None
+        self.response = None
+        self.error = None
+        self.callbacks = []
+        self.finished = threading.Event()
+
+    def done(self):
+        return self.finished.is_set()
+
+    def nak(self):
+        return self.response is not None and self.response[3] == F_NAK
+
+    def result(self, timeout=None):
+        '''
+        Returns:
+          the response frame (an ACK, NAK or reply)
+        Raises:
+          TransportTimeout if the client never answered
+        '''
+        if not self.finished.wait(timeout):
+            raise TransportTimeout("No response yet from client {:#x}".format(self.address))
+        if self.error:
+            raise self.error
+        return self.response
+
+    def add_done_callback(self, callback):
+        if self.done():
+            callback(self)
+        else:
+            self.callbacks.append(callback)
+
+    def finish(self, response=None, error=None):
+        self.response = response
+        self.error = error
+        self.finished.set()
+        for callback in self.callbacks:
+            callback(self)
+
+
+class DoorTransport(object):
+    def __init__(self, control, timeout=0.1, retries=3, read_timeout=0.01, window=None, retry_nak=False):
+        '''
+        Args:
+          control (DoorControl): the port the clients are connected to
+          timeout (float, optional): seconds to wait for each response
+          retries (int, optional): times a request is resent before failing
+          read_timeout (float, optional): how often the reader thread wakes up
+            to check for expired requests
+          window (int, optional): requests in flight per client; unlimited if None
+          retry_nak (bool, optional): resend NAKed requests like timed out ones
+            (a request still NAKed after the last retry resolves with the NAK)
+        '''
+        self.control = control
+        self.timeout = timeout
+        self.retries = retries
+        self.read_timeout = read_timeout
+        self.window = window
+        self.retry_nak = retry_nak
+        self.retransmits = 0
+        self.queued = {}
+        self.pending = {}
+        self.last_trans_IDs = {}    # address -> last ID the client used for its own frames
+        self.subscribers = {}
+        self.next_token = 0
+        self.lock = threading.RLock()
+        self.write_lock = threading.Lock()
+        self.thread = None
+        self.running = False
+
+    def start(self):
+        if self.running:
+            return
+        self.control.set_timeout(self.read_timeout)
+        self.running = True
+        self.thread = threading.Thread(target=self.reader, name='door-transport')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        with self.lock:
+            pending, self.pending = self.pending.values(), {}
+            for queue in self.queued.values():
+                pending.extend(queue)
+            self.queued = {}
+        for request in pending:
+            request.finish(error=TransportError("Transport stopped"))
+
+    def subscribe(self, callback, function=None, address=None):
+        '''
+        Call `callback(frame)` for each unsolicited frame, optionally only
+        for one function code and/or client address. Callbacks run on the
+        reader thread and should return quickly.
+
+        Returns:
+          a token for unsubscribe()
+        '''
+        with self.lock:
+            self.next_token += 1
+            self.subscribers[self.next_token] = (callback, function, address)
+            return self.next_token
+
+    def unsubscribe(self, token):
+        with self.lock:
+            self.subscribers.pop(token, None)
+
+    def request(self, address, function, payload=[]):
+        '''
+        Send a command and return a Request that resolves with its response.
+        Any number of requests, to any number of clients, can be outstanding;
+        with a window, the ones beyond it are queued.
+        '''
+        return self.request_many(address, [(function, payload)])[0]
+
+    def request_many(self, address, commands):
+        '''
+        Queue several commands for one client, e.g. [(function, payload), ...],
+        and send as many as the window allows in one write.
+
+        Returns:
+          a Request per command, in order
+        '''
+        self.start()
+        with self.lock:
+            requests = []
+            for function, payload in commands:
+                requests.append(Request(address, function, payload, self.new_trans_ID(address)))
+            self.queued.setdefault(address, []).extend(requests)
+        self.fill(address)
+        return requests
+
+    def new_trans_ID(self, address):
+        # unique among this client's unanswered requests, and not the ID the
+        # client last used itself: its firmware would take a command with
+        # that ID for a duplicate
+        busy = set(r.trans_ID for r in self.pending.values() if r.address == address)
+        busy.update(r.trans_ID for r in self.queued.get(address, []))
+        busy.add(self.last_trans_IDs.get(address))
+        trans_ID = self.control.next_trans_ID()
+        while trans_ID in busy:
+            trans_ID = self.control.next_trans_ID()
+        return trans_ID
+
+    def in_flight(self, address):
+        return sum(1 for r in self.pending.values() if r.address == address)
+
+    def fill(self, address):
+        '''Move queued requests for a client onto the bus while the window allows'''
+        with self.lock:
+            queue = self.queued.get(address)
+            if not queue:
+                return
+            free = len(queue) if self.window is None else self.window - self.in_flight(address)
+            batch, queue[:] = queue[:max(free, 0)], queue[max(free, 0):]
+            for request in batch:
+                self.pending[(address, request.trans_ID)] = request
+        if batch:
+            self.send(*batch)
+
+    def send(self, *requests):
+        now = time.time()
+        for request in requests:
+            if request.attempts:
+                self.retransmits += 1
+            request.attempts += 1
+            request.sent = now
+            request.deadline = now + self.timeout
+        if self.write(requests) == 1:
+            with self.lock:
+                for request in requests:
+                    self.pending.pop((request.address, request.trans_ID), None)
+            for request in requests:
+                request.finish(error=TransportError("Serial Port not set!"))
+
+    def write(self, requests):
+        frames = [(r.trans_ID, ADDR_MASTER, r.address, r.function, r.payload) for r in requests]
+        with self.write_lock:
+            return self.control.write(self.control.encoder.encode_many(frames))
+
+    def ack(self, address, trans_ID):
+        with self.write_lock:
+            return self.control.send_packet(to_addr=address, function=F_ACK, trans_ID=trans_ID)
+
+    def reader(self):
+        while self.running:
+            try:
+                frames = self.control.read_frames()
+            except AttributeError:
+                time.sleep(self.read_timeout)
+                frames = []
+            for frame in frames:
+                self.dispatch(frame)
+            self.expire()
+
+    def answers(self, request, frame):
+        '''A response is an ACK, a NAK or a reply with the request's function'''
+        if frame[3] in (F_ACK, F_NAK, request.function):
+            return True
+        return request.function == F_GET_UPDATE and frame[3] == F_STATUS
+
+    def dispatch(self, frame):
+        if frame[2] != ADDR_MASTER:
+            return
+        key = (frame[1], frame[0])
+        with self.lock:
+            request = self.pending.get(key)
+            if request is not None and not self.answers(request, frame):
+                request = None      # the client's own frame, reusing the ID
+            retry = False
+            if request is not None and frame[3] == F_NAK and self.retry_nak:
+                request.naks += 1
+                retry = request.attempts <= self.retries
+            if request is not None and not retry:
+                del self.pending[key]
+        if retry:
+            self.send(request)      # selective retransmit, same trans_ID
+            return
+        if request is not None:
+            request.finish(response=frame)
+            self.fill(frame[1])
+            return
+        if frame[3] in (F_ACK, F_NAK):
+            return      # late answer to a request that already timed out
+        with self.lock:
+            self.last_trans_IDs[frame[1]] = frame[0]
+        self.ack(frame[1], frame[0])
+        with self.lock:
+            subscribers = self.subscribers.values()
+        for callback, function, address in subscribers:
+            if function is not None and function != frame[3]:
+                continue
+            if address is not None and address != frame[1]:
+                continue
+            callback(frame)
+
+    def expire(self):
+        now = time.time()
+        with self.lock:
+            expired = [r for r in self.pending.values() if r.deadline <= now]
+        retry = [r for r in expired if r.attempts <= self.retries]
+        failed = [r for r in expired if r.attempts > self.retries]
+        if retry:
+            self.send(*retry)
+        for request in failed:
+            with self.lock:
+                self.pending.pop((request.address, request.trans_ID), None)
+            request.finish(error=TransportTimeout(
+                "No response from client {:#x} after {:d} attempts".format(
+                    request.address, request.attempts)))
+            self.fill(request.address)